@@ -0,0 +1,342 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from llm_client import ChatCompletionsClient, RequestFailed
+from near_duplicates import NearDuplicateClusterer
+from response_cache import DEFAULT_MAX_BYTES, ResponseCache
+from run_journal import DONE, FAILED, RunJournal
+
+# Deployment used for the published results; override with --endpoint or AZURE_OPENAI_ENDPOINT
+DEFAULT_ENDPOINT = ("https://yuwa-m2oi18l3-swedencentral.openai.azure.com/openai/deployments/gpt-4o/"
+                    "chat/completions?api-version=2024-08-01-preview")
+
+
+def build_payload(name: str, description: str) -> Dict:
+    """Chat-completions payload of the tagging prompt of GPT4oAPI.ipynb"""
+    payload = {
+        "messages": [
+            {
+                "role": "system",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"""You are a tagging system that identifies and extracts modalities and data types from dataset information (name and description) to categorize datasets and form a comprehensive data repository.
+                        
+                        This is about a multimodal data task. Please identify and provide tags for modalities and data types that may be included in this dataset. Use detailed tags that capture the essence of the dataset. 
+                                Modalities refer to the broad categories of data (e.g., text, image, video). Data types refer to the specific forms or instances of data within each modality (e.g., bird images, captions, sentences).  
+
+                                Requirements: 
+                                1. Use consistent tags across all datasets. For example, if a tag for "text" is used, do not switch to other similar tags like "textual." Ensure that modality and data type tags are reused consistently across datasets. Avoid inventing new tags unless necessary.  
+                                2. The response should follow this JSON structure: 
+                                {{
+                                    "modalities": [
+                                        {{
+                                            "title": "modality_title",
+                                            "explanation": "modality_explanation",
+                                            "data_types": [
+                                                {{
+                                                "title": "data_type_title",
+                                                "explanation": "data_type_explanation"
+                                                }},
+                                            ]
+                                        }}
+                                    ]
+                                }}
+                                3. Only extract information from the provided dataset(dataset_name and dataset_description), and avoid using overly specific terminology or overly general terms unless the dataset description explicitly calls for it. Keep the tags general but informative. 
+                                4. Please provide your response in English.
+                                5. Don't use _ in your answer, e.g., use bird images, not bird_images."""
+                    }
+                ]
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"""Below is a dataset's information:  
+                                [begin]  
+                                {{dataset_name：{name}}}  
+                                {{dataset_description: {description}}} 
+                                [end]  """
+                    }
+                ]
+            }
+        ],
+        "temperature": 0.1,
+        "top_p": 0.95,
+        "max_tokens": 8000
+    }
+    return payload
+
+
+def answer_content(response: Dict) -> str:
+    """Message content of a chat-completions response.
+
+    Raises ValueError when there is no usable text, e.g. no choices, or the
+    null content Azure returns for a content-filtered completion.
+    """
+    choices = response.get('choices') if isinstance(response, dict) else None
+    if not choices or not isinstance(choices[0], dict):
+        raise ValueError("Response has no choices")
+    message = choices[0].get('message') or {}
+    content = message.get('content')
+    if not isinstance(content, str):
+        reason = choices[0].get('finish_reason')
+        raise ValueError(f"Response has no text content (finish_reason: {reason})")
+    return content
+
+
+def parse_tags(answer: str) -> Dict:
+    """Tags JSON of an answer, without the ```json fence the model adds"""
+    if answer.startswith("```json") and answer.endswith("```"):
+        answer = answer[8:-3].strip()
+    return json.loads(answer)
+
+
+def parse_answer(response: Dict) -> Dict:
+    """Tags JSON of a chat-completions response"""
+    return parse_tags(answer_content(response))
+
+
+def select_datasets(datasets: Sequence[Dict],
+                    first_position: int = 0) -> Tuple[List[Tuple[int, Dict]], List[Tuple[int, Dict]]]:
+    """(position, dataset) pairs to tag, and those skipped for a missing name or description.
+
+    Positions count from first_position, the position of datasets[0] in the input file.
+    """
+    selected, skipped = [], []
+    for position, dataset in enumerate(datasets, first_position):
+        if dataset.get('name') and dataset.get('description'):
+            selected.append((position, dataset))
+        else:
+            skipped.append((position, dataset))
+    return selected, skipped
+
+
+async def tag_datasets(client: ChatCompletionsClient, datasets: Sequence[Tuple[int, Dict]],
+                       concurrency: int = 8, progress_every: int = 100,
+                       journal: Optional[RunJournal] = None,
+                       duplicates: Optional[Dict[int, List[Tuple[int, Dict]]]] = None
+                       ) -> Tuple[Dict[int, Dict], Dict[int, str]]:
+    """Tag (position, dataset) pairs with `concurrency` requests in flight.
+
+    Returns the results and the errors, both keyed by position, so that the
+    output can keep the input order however the requests complete. With a
+    journal, every outcome is also appended to it as soon as it is known.
+    `duplicates` maps the position of a representative to the (position,
+    dataset) pairs of its near-duplicates, which receive its outcome with a
+    "duplicate_of" link instead of a request of their own.
+    """
+    duplicates = duplicates or {}
+    queue = asyncio.Queue()
+    for item in datasets:
+        queue.put_nowait(item)
+    total = len(datasets) + sum(len(members) for members in duplicates.values())
+    results, errors = {}, {}
+    start = time.perf_counter()
+
+    async def worker():
+        while True:
+            try:
+                position, dataset = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            name, description = dataset['name'], dataset['description']
+            payload = build_payload(name, description)
+            try:
+                answer = answer_content(await client.complete(payload))
+                results[position] = {"name": name, "tags": parse_tags(answer)}
+            except RequestFailed as e:
+                errors[position] = str(e)
+                print(f"Failed to make the request for {name}. Error: {e}")
+            except ValueError as e:
+                errors[position] = f"Unparseable answer: {e}"
+                # Let a rerun ask again instead of replaying the same answer
+                client.forget(payload)
+                print(f"An unexpected error occurred for {name}. Error: {e}")
+            except Exception as e:
+                # One bad answer must not abort the run; it is recorded like any other failure
+                errors[position] = f"Unexpected error: {e!r}"
+                client.forget(payload)
+                print(f"An unexpected error occurred for {name}. Error: {e!r}")
+            if journal is not None:
+                if position in results:
+                    journal.record_done(position, name, description, answer)
+                else:
+                    journal.record_failed(position, name, errors[position])
+            source = {"position": position, "name": name}
+            for member_position, member in duplicates.get(position, ()):
+                if position in results:
+                    results[member_position] = {"name": member['name'], "tags": results[position]["tags"],
+                                                "duplicate_of": source}
+                    if journal is not None:
+                        journal.record_done(member_position, member['name'], member['description'], answer, source)
+                else:
+                    errors[member_position] = f"Representative #{position + 1} failed: {errors[position]}"
+                    if journal is not None:
+                        journal.record_failed(member_position, member['name'], errors[member_position])
+            finished = 1 + len(duplicates.get(position, ()))
+            done = len(results) + len(errors)
+            if progress_every and done // progress_every != (done - finished) // progress_every:
+                print(f"Processed {done}/{total} datasets in {time.perf_counter() - start:.1f}s")
+
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return results, errors
+
+
+async def run_extraction(datasets: Sequence[Dict], endpoint: str, api_key: str = '', concurrency: int = 8,
+                         requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                         max_retries: int = 6, auth_header: str = 'api-key',
+                         first_position: int = 0, journal: Optional[RunJournal] = None,
+                         cache: Optional[ResponseCache] = None,
+                         dedup_threshold: Optional[float] = None) -> Tuple[List[Dict], List[Dict]]:
+    """Tag every dataset that has a name and a description; returns (results, failures) in input order.
+
+    first_position is the position of datasets[0] in the input file, used
+    for the dataset numbers in messages, failures and the journal. With a
+    journal, datasets it already holds a result for are skipped, so an
+    interrupted run resumes where it stopped and retries only the failures.
+    With a response cache, prompts answered before are not sent again.
+    With a dedup_threshold, near-duplicate datasets (MinHash estimate of the
+    Jaccard similarity of name and description, see near_duplicates.py) are
+    tagged once, through the first of them.
+    """
+    selected, skipped = select_datasets(datasets, first_position)
+    for position, dataset in skipped:
+        print(f"Dataset entry #{position + 1} is missing name or description: {dataset}")
+    if journal is not None:
+        pending = [(position, dataset) for position, dataset in selected
+                   if not journal.is_done(position, dataset['name'])]
+        if len(pending) < len(selected):
+            print(f"Skipping {len(selected) - len(pending)} datasets already tagged in {journal.path}")
+        selected = pending
+
+    duplicates = {}
+    if dedup_threshold is not None:
+        clusters = NearDuplicateClusterer(dedup_threshold).cluster_datasets([d for _, d in selected])
+        duplicates = {selected[cluster[0]][0]: [selected[i] for i in cluster[1:]]
+                      for cluster in clusters if len(cluster) > 1}
+        print(f"{len(selected)} datasets in {len(clusters)} near-duplicate clusters, "
+              f"saving {len(selected) - len(clusters)} requests")
+        selected = [selected[cluster[0]] for cluster in clusters]
+
+    async with ChatCompletionsClient(endpoint, api_key, auth_header, concurrency, requests_per_minute,
+                                     tokens_per_minute, max_retries, cache=cache) as client:
+        results, errors = await tag_datasets(client, selected, concurrency, journal=journal, duplicates=duplicates)
+        print(f"Requests: {client.stats['requests']}, retries: {client.stats['retries']}, "
+              f"throttled: {client.stats['throttled']}, tokens: {client.stats['tokens']}, "
+              f"connections opened: {client.pool.opened}")
+        if cache is not None:
+            print(f"Response cache: {client.stats['cache_hits']} hits, {client.stats['cache_misses']} misses, "
+                  f"{cache.entries} responses, {cache.total_bytes} bytes")
+
+    failures = [{"position": position, "name": datasets[position - first_position]['name'], "error": errors[position]}
+                for position in sorted(errors)]
+    return [results[position] for position in sorted(results)], failures
+
+
+def write_results(records: Iterable[Dict], path: str) -> int:
+    """Write DONE journal records as results.json ([{"name", "tags"}] with indent=4, like GPT4oAPI.ipynb).
+
+    Streamed one result at a time; the file is byte-identical to
+    json.dump(results, f, ensure_ascii=False, indent=4). Returns the number of results.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[')
+        for record in records:
+            result = {"name": record['name'], "tags": parse_tags(record['answer'])}
+            if 'duplicate_of' in record:
+                result["duplicate_of"] = record['duplicate_of']
+            entry = json.dumps(result, ensure_ascii=False, indent=4)
+            f.write((',\n    ' if count else '\n    ') + entry.replace('\n', '\n    '))
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+
+def write_results_jsonl(records: Iterable[Dict], path: str) -> int:
+    """Write DONE journal records in the combined_results_2.jsonl layout: {"custom_id", "input", "output"} lines"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            result = {
+                'custom_id': f"task-{record['position']}",
+                'input': {'dataset_name': record['name'], 'dataset_description': record['description']},
+                'output': record['answer']
+            }
+            if 'duplicate_of' in record:
+                result['duplicate_of'] = f"task-{record['duplicate_of']['position']}"
+            f.write(json.dumps(result, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def compact_journal(journal: RunJournal, output: str, failures: str, jsonl_output: Optional[str] = None) -> None:
+    """Write the final outputs from the last journal record of every dataset"""
+    count = write_results(journal.records(DONE), output)
+    if jsonl_output:
+        write_results_jsonl(journal.records(DONE), jsonl_output)
+    failed = [{"position": r['position'], "name": r['name'], "error": r['error']} for r in journal.records(FAILED)]
+    with open(failures, 'w', encoding='utf-8') as f:
+        json.dump(failed, f, ensure_ascii=False, indent=4)
+    print(f"Journal holds {count} tagged datasets and {len(failed)} failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag the modalities and data types of datasets with an LLM")
+    parser.add_argument('--input', default='extracted_data.json', help="Datasets with name and description")
+    parser.add_argument('--output', default='results.json', help="Tags in the results.json layout")
+    parser.add_argument('--failures', default='failed_datasets.json', help="Datasets whose request failed")
+    parser.add_argument('--jsonl-output', default=None,
+                        help="Also write the tags in the combined_results_2.jsonl layout to this path")
+    parser.add_argument('--journal', default='results_journal.jsonl',
+                        help="Append-only journal of finished requests; a rerun skips what it already holds")
+    parser.add_argument('--compact-only', action='store_true',
+                        help="Only write the outputs from the journal, without sending requests")
+    parser.add_argument('--start', type=int, default=0, help="First dataset position to tag")
+    parser.add_argument('--end', type=int, default=None, help="Position after the last dataset to tag")
+    parser.add_argument('--endpoint', default=os.environ.get('AZURE_OPENAI_ENDPOINT', DEFAULT_ENDPOINT),
+                        help="Chat-completions URL")
+    parser.add_argument('--auth-header', default='api-key',
+                        help="Header carrying the key ('api-key' for Azure, 'Authorization' for a bearer token)")
+    parser.add_argument('--concurrency', type=int, default=8, help="Requests in flight")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit")
+    parser.add_argument('--tpm', type=float, default=None, help="Tokens-per-minute limit")
+    parser.add_argument('--max-retries', type=int, default=6, help="Retries on 429, 5xx and connection errors")
+    parser.add_argument('--cache', default='response_cache.sqlite',
+                        help="Response cache file; identical prompts are answered from it")
+    parser.add_argument('--no-cache', action='store_true', help="Send every prompt, without the response cache")
+    parser.add_argument('--cache-max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help="Size above which least recently used responses are evicted")
+    parser.add_argument('--dedup-threshold', type=float, default=None,
+                        help="Tag near-duplicate datasets once, at this estimated Jaccard similarity (e.g. 0.85)")
+    args = parser.parse_args()
+
+    with RunJournal(args.journal) as journal:
+        if not args.compact_only:
+            with open(args.input, 'r', encoding='utf-8') as f:
+                datasets = json.load(f)[args.start:args.end]
+
+            api_key = os.environ.get('AZURE_OPENAI_API_KEY', '')
+            cache = None if args.no_cache else ResponseCache(args.cache, args.cache_max_bytes)
+            start = time.perf_counter()
+            try:
+                results, failures = asyncio.run(run_extraction(
+                    datasets, args.endpoint, api_key, args.concurrency, args.rpm, args.tpm, args.max_retries,
+                    args.auth_header, args.start, journal, cache, args.dedup_threshold
+                ))
+            finally:
+                if cache is not None:
+                    cache.close()
+            print(f"Tagged {len(results)} datasets, {len(failures)} failed, in {time.perf_counter() - start:.1f}s")
+
+        compact_journal(journal, args.output, args.failures, args.jsonl_output)
+
+
+if __name__ == "__main__":
+    main()
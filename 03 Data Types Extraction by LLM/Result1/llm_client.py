@@ -0,0 +1,334 @@
+import ssl
+import json
+import time
+import random
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from response_cache import ResponseCache, prompt_key
+
+# Statuses worth retrying: throttling and transient server errors
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Rough size of a token, used to reserve rate-limit budget before the usage is known
+CHARS_PER_TOKEN = 4
+
+
+def has_text_content(response: Dict) -> bool:
+    """Whether a response carries a string choices[0].message.content, the only kind worth caching"""
+    try:
+        return isinstance(response['choices'][0]['message']['content'], str)
+    except (KeyError, IndexError, TypeError):
+        return False
+
+
+class RequestFailed(Exception):
+    """A request that failed for good: a non-retryable status, or retries exhausted"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class TokenBucket:
+    """Budget refilled continuously up to `per_minute`, shared by all concurrent callers"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` is available (0 if it is now)"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """Charge (positive) or refund (negative) once the real cost is known; may go below zero"""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits, plus a shared pause after throttling.
+
+    Callers are served one at a time in arrival order, so a large request is
+    not starved by a stream of small ones.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.resume_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 0) -> None:
+        async with self._lock:
+            while True:
+                delay = self.resume_at - time.monotonic()
+                if self.requests is not None:
+                    delay = max(delay, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    delay = max(delay, self.tokens.wait_time(tokens))
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(tokens)
+
+    def settle(self, reserved: float, used: float) -> None:
+        """Replace the reserved token estimate by the usage the server reported"""
+        if self.tokens is not None:
+            self.tokens.adjust(used - reserved)
+
+    def pause(self, seconds: float) -> None:
+        """Hold every caller for `seconds`, e.g. after a 429 with Retry-After"""
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+
+class ConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one host, at most `size` open at a time.
+
+    Only what a JSON API needs is implemented: requests with a body, and
+    responses delimited by Content-Length, chunked encoding or connection close.
+    """
+
+    def __init__(self, url: str, size: int = 8, timeout: float = 120.0):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError(f"Unsupported URL scheme: {url}")
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.ssl = ssl.create_default_context() if parts.scheme == 'https' else None
+        self.target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+        self.host_header = parts.netloc
+        self.timeout = timeout
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots = asyncio.Semaphore(size)
+        self.opened = 0
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        self.opened += 1
+        return await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+    async def request(self, method: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        """Send one request and return (status, lower-cased headers, body)"""
+        async with self._slots:
+            reused = bool(self._idle)
+            connection = self._idle.pop() if reused else await self._connect()
+            try:
+                status, response_headers, data, keep_alive = await asyncio.wait_for(
+                    self._exchange(connection, method, headers, body), self.timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                connection[1].close()
+                if not reused:
+                    raise
+                # The server may have closed an idle connection; retry once on a fresh one
+                connection = await self._connect()
+                status, response_headers, data, keep_alive = await asyncio.wait_for(
+                    self._exchange(connection, method, headers, body), self.timeout)
+            except BaseException:
+                connection[1].close()
+                raise
+            if keep_alive:
+                self._idle.append(connection)
+            else:
+                connection[1].close()
+            return status, response_headers, data
+
+    async def _exchange(self, connection, method: str, headers: Dict[str, str], body: bytes):
+        reader, writer = connection
+        lines = [f"{method} {self.target} HTTP/1.1", f"Host: {self.host_header}",
+                 f"Content-Length: {len(body)}", "Connection: keep-alive"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+        status_line = await reader.readuntil(b'\r\n')
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = response_headers.get('connection', '').lower() != 'close'
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                if size == 0:
+                    # Skip trailers up to the final empty line
+                    while await reader.readuntil(b'\r\n') != b'\r\n':
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await reader.read()
+            keep_alive = False
+        return status, response_headers, data, keep_alive
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+
+
+class ChatCompletionsClient:
+    """Asynchronous chat-completions client with rate limits, retries and pooled connections.
+
+    Retryable failures (429, 5xx, dropped connections, timeouts) are retried
+    with exponential backoff and jitter, or after the server's Retry-After.
+    A 429 pauses every caller of the shared rate limiter, not just this one.
+    With a response cache, a payload already answered for the same model is
+    returned from it without a request or any rate-limit budget, and identical
+    payloads in flight at the same time share one request. The model of the
+    cache key defaults to the endpoint URL, which names the Azure deployment.
+    """
+
+    def __init__(self, endpoint: str, api_key: str = '', auth_header: str = 'api-key',
+                 concurrency: int = 8, requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None, max_retries: int = 6,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0,
+                 completion_tokens_estimate: int = 600, timeout: float = 120.0,
+                 cache: Optional[ResponseCache] = None, model: Optional[str] = None):
+        self.pool = ConnectionPool(endpoint, concurrency, timeout)
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.headers = {'Content-Type': 'application/json'}
+        if api_key:
+            self.headers[auth_header] = f'Bearer {api_key}' if auth_header.lower() == 'authorization' else api_key
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.completion_tokens_estimate = completion_tokens_estimate
+        self.cache = cache
+        self.model = model or endpoint
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.stats = {'requests': 0, 'retries': 0, 'throttled': 0, 'tokens': 0, 'cache_hits': 0, 'cache_misses': 0}
+
+    def estimate_tokens(self, payload: Dict) -> int:
+        """Tokens reserved before sending: the prompt length plus the expected completion"""
+        prompt_chars = len(json.dumps(payload.get('messages', []), ensure_ascii=False))
+        return prompt_chars // CHARS_PER_TOKEN + min(self.completion_tokens_estimate, payload.get('max_tokens', 1 << 30))
+
+    def backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Delay before retry `attempt` (0-based): Retry-After if given, else jittered exponential"""
+        if retry_after:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * 2 ** attempt, self.backoff_max)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def complete(self, payload: Dict) -> Dict:
+        """POST one chat-completions payload and return the decoded response"""
+        if self.cache is None:
+            return await self._send(payload)
+        key = prompt_key(payload, self.model)
+        if key in self._in_flight:
+            self.stats['cache_hits'] += 1
+            return await asyncio.shield(self._in_flight[key])
+        cached = self.cache.get(key)
+        if cached is not None and not has_text_content(cached):
+            # Left by an older version that cached every response; ask again
+            self.cache.discard(key)
+            cached = None
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return cached
+        self.stats['cache_misses'] += 1
+
+        future = self._in_flight[key] = asyncio.get_running_loop().create_future()
+        try:
+            response = await self._send(payload)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters see the exception; mark it retrieved so an unshared failure is not logged
+            future.exception()
+            raise
+        else:
+            # Answers without text (e.g. content-filtered) are returned but never replayed
+            if has_text_content(response):
+                self.cache.put(key, response)
+            future.set_result(response)
+            return response
+        finally:
+            del self._in_flight[key]
+
+    async def _send(self, payload: Dict) -> Dict:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reserved = self.estimate_tokens(payload)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(reserved)
+            self.stats['requests'] += 1
+            retry_after = None
+            try:
+                status, headers, data = await self.pool.request('POST', self.headers, body)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                error = RequestFailed(f"Connection error: {e!r}")
+            else:
+                if status == 200:
+                    try:
+                        response = json.loads(data)
+                    except ValueError:
+                        raise RequestFailed(f"Invalid JSON response: {data[:200]!r}", status)
+                    used = response.get('usage', {}).get('total_tokens', reserved)
+                    self.limiter.settle(reserved, used)
+                    self.stats['tokens'] += used
+                    return response
+                error = RequestFailed(f"HTTP {status}: {data[:500].decode('utf-8', 'replace')}", status)
+                if status not in RETRY_STATUSES:
+                    raise error
+                retry_after = headers.get('retry-after')
+                if status == 429:
+                    self.stats['throttled'] += 1
+
+            if attempt == self.max_retries:
+                raise RequestFailed(f"Gave up after {attempt + 1} attempts: {error}", error.status)
+            delay = self.backoff(attempt, retry_after)
+            if error.status == 429:
+                self.limiter.pause(delay)
+            self.stats['retries'] += 1
+            await asyncio.sleep(delay)
+
+    def forget(self, payload: Dict) -> None:
+        """Drop the cached response of a payload, e.g. when its answer could not be used"""
+        if self.cache is not None:
+            self.cache.discard(prompt_key(payload, self.model))
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def __aenter__(self) -> 'ChatCompletionsClient':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
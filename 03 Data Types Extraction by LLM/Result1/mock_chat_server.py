@@ -0,0 +1,190 @@
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import deque
+from typing import Dict, Optional
+
+# The dataset name inside the user prompt of extract_tags.build_payload
+NAME_PATTERN = re.compile(r'dataset_name：(.*?)}')
+
+
+def fake_answer(payload: Dict) -> str:
+    """Deterministic tags answer for a tagging payload, fenced like the real model's"""
+    text = payload['messages'][-1]['content'][0]['text']
+    match = NAME_PATTERN.search(text)
+    name = match.group(1) if match else 'unknown'
+    tags = {"modalities": [{"title": "text", "explanation": f"Text of {name}",
+                            "data_types": [{"title": f"{name} records", "explanation": "Records of the dataset"}]}]}
+    return "```json\n" + json.dumps(tags, ensure_ascii=False, indent=2) + "\n```"
+
+
+class MockChatServer:
+    """Local chat-completions server for exercising the tagging client.
+
+    Speaks HTTP/1.1 with keep-alive and answers every POST with a
+    deterministic tags completion. It can add latency, fail a seeded share of
+    requests with 429 or 500, answer a share with null content as Azure does
+    for content-filtered completions, and enforce its own requests-per-minute
+    limit with 429 and Retry-After, like the hosted API does.
+
+        async with MockChatServer(error_rate=0.1) as server:
+            ... ChatCompletionsClient(server.url) ...
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 throttle_rate: float = 0.0, error_rate: float = 0.0, null_content_rate: float = 0.0,
+                 requests_per_minute: Optional[float] = None, retry_after: float = 1.0, seed: int = 0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.null_content_rate = null_content_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.stats = {'connections': 0, 'requests': 0, 'throttled': 0, 'errors': 0, 'filtered': 0,
+                      'max_in_flight': 0}
+        self._recent = deque()
+        self._in_flight = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}/chat/completions"
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def __aenter__(self) -> 'MockChatServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _over_limit(self) -> bool:
+        """Sliding one-minute window of the accepted requests"""
+        if not self.requests_per_minute:
+            return False
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 60:
+            self._recent.popleft()
+        if len(self._recent) >= self.requests_per_minute:
+            return True
+        self._recent.append(now)
+        return False
+
+    async def _respond(self, body: bytes):
+        """(status, extra headers, response body) of one request"""
+        self.stats['requests'] += 1
+        if self._over_limit():
+            self.stats['throttled'] += 1
+            return 429, {'Retry-After': f'{self.retry_after:g}'}, b'{"error": {"code": "429"}}'
+        draw = self.random.random()
+        if draw < self.throttle_rate:
+            self.stats['throttled'] += 1
+            return 429, {'Retry-After': f'{self.retry_after:g}'}, b'{"error": {"code": "429"}}'
+        if draw < self.throttle_rate + self.error_rate:
+            self.stats['errors'] += 1
+            return 500, {}, b'{"error": {"code": "500"}}'
+        filtered = draw < self.throttle_rate + self.error_rate + self.null_content_rate
+
+        self._in_flight += 1
+        self.stats['max_in_flight'] = max(self.stats['max_in_flight'], self._in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self._in_flight -= 1
+        payload = json.loads(body)
+        if filtered:
+            self.stats['filtered'] += 1
+            content, finish_reason = None, "content_filter"
+        else:
+            content, finish_reason = fake_answer(payload), "stop"
+        prompt_tokens = len(json.dumps(payload['messages'], ensure_ascii=False)) // 4
+        completion_tokens = len(content or '') // 4
+        response = {
+            "choices": [{"index": 0, "finish_reason": finish_reason,
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        }
+        return 200, {}, json.dumps(response, ensure_ascii=False).encode('utf-8')
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.stats['connections'] += 1
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b'\r\n')
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readuntil(b'\r\n')
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                if request_line.split()[0] == b'POST':
+                    status, extra, data = await self._respond(body)
+                else:
+                    status, extra, data = 405, {}, b'{"error": {"code": "405"}}'
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                lines = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                         "Content-Type: application/json", f"Content-Length: {len(data)}",
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                lines.extend(f"{name}: {value}" for name, value in extra.items())
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server: MockChatServer) -> None:
+    async with server:
+        print(f"Serving chat completions at {server.url}")
+        await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local chat-completions server for testing extract_tags.py")
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds per successful completion")
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument('--null-content-rate', type=float, default=0.0,
+                        help="Share of requests answered with null content, like a content-filtered completion")
+    parser.add_argument('--rpm', type=float, default=None, help="Requests-per-minute limit enforced with 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockChatServer(port=args.port, latency=args.latency, throttle_rate=args.throttle_rate,
+                            error_rate=args.error_rate, null_content_rate=args.null_content_rate,
+                            requests_per_minute=args.rpm,
+                            retry_after=args.retry_after, seed=args.seed)
+    try:
+        asyncio.run(serve(server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import re
+import ast
+import json
+import zlib
+import argparse
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Shingles hashed in one vectorized MinHash step
+SHINGLES_PER_CHUNK = 1 << 16
+
+# A Python string literal as repr() writes it: single-quoted, or double-quoted when the
+# value contains an apostrophe, with backslash escapes
+STRING_LITERAL = r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")"""
+
+# Name and description inside the user prompt of paperwithcode_prompt_v1.jsonl
+PROMPT_NAME_PATTERN = re.compile(r"""\{(['"])dataset_name\1: """ + STRING_LITERAL, re.DOTALL)
+PROMPT_DESCRIPTION_PATTERN = re.compile(r"""\{(['"])dataset description\1: """ + STRING_LITERAL, re.DOTALL)
+
+
+def normalize_text(name: str, description: str) -> str:
+    """Lower-cased name and description with whitespace runs collapsed"""
+    return ' '.join(f"{name} {description}".lower().split())
+
+
+def shingle_hashes(text: str, size: int = 3) -> List[int]:
+    """CRC32 of every distinct run of `size` words; a shorter text is one shingle"""
+    words = text.split()
+    if len(words) <= size:
+        return [zlib.crc32(text.encode('utf-8'))]
+    return list({zlib.crc32(' '.join(words[i:i + size]).encode('utf-8')) for i in range(len(words) - size + 1)})
+
+
+def lsh_parameters(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) with bands * rows <= num_perm whose S-curve midpoint (1 / bands) ** (1 / rows)
+    is closest to the threshold; ties go to more bands, which misses fewer pairs"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        midpoint = (1.0 / bands) ** (1.0 / rows)
+        key = (abs(midpoint - threshold), -bands)
+        if best is None or key < best[0]:
+            best = (key, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures over `num_perm` multiply-shift hash functions, seeded for reproducibility.
+
+    Function i maps a 32-bit shingle hash x to the top 32 bits of
+    (a_i * x + b_i) mod 2^64 with a_i odd, which numpy computes with
+    wrapping uint64 arithmetic and no division.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.randint(0, 1 << 62, size=num_perm).astype(np.uint64) * np.uint64(4) | np.uint64(1)
+        self.b = rng.randint(0, 1 << 62, size=num_perm).astype(np.uint64) * np.uint64(4)
+
+    def signatures(self, texts: Sequence[str]) -> np.ndarray:
+        """(len(texts), num_perm) signature matrix, computed a chunk of documents at a time"""
+        result = np.empty((len(texts), self.num_perm), dtype=np.uint64)
+        start = 0
+        while start < len(texts):
+            hashes, offsets = [], []
+            end = start
+            while end < len(texts) and (end == start or len(hashes) < SHINGLES_PER_CHUNK):
+                offsets.append(len(hashes))
+                hashes.extend(shingle_hashes(texts[end], self.shingle_size))
+                end += 1
+            # One row per hash function, so the per-document minimum reduces contiguous runs
+            values = self.a[:, None] * np.array(hashes, dtype=np.uint64)[None, :]
+            values += self.b[:, None]
+            values >>= np.uint64(32)
+            result[start:end] = np.minimum.reduceat(values, offsets, axis=1).T
+            start = end
+        return result
+
+
+class NearDuplicateClusterer:
+    """Clusters of near-duplicate texts by MinHash LSH, each led by its first text.
+
+    Texts sharing a band of their signatures are candidates. Clusters are
+    formed greedily in input order, like the data type grouping: the first
+    unassigned text leads a cluster and takes the unassigned candidates
+    whose estimated Jaccard similarity to it (the share of equal signature
+    values) reaches the threshold. Every member is thus close to its leader,
+    not merely chained to it through other members.
+
+    Many unrelated datasets share a placeholder description and differ only
+    by name, so when names are given a member's name must also be similar to
+    the leader's (difflib ratio of at least name_threshold, 0 to disable).
+    Versions and splits such as "WikiText-2" and "WikiText-103" still pass.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 128, shingle_size: int = 3, seed: int = 1,
+                 name_threshold: float = 0.7):
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError(f"threshold must be in (0, 1], got {threshold}")
+        self.threshold = threshold
+        self.name_threshold = name_threshold
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = lsh_parameters(threshold, num_perm)
+
+    def candidates(self, signatures: np.ndarray) -> List[List[int]]:
+        """Positions sharing at least one LSH band with each position"""
+        neighbours = [set() for _ in range(len(signatures))]
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            block = np.ascontiguousarray(signatures[:, band * self.rows:(band + 1) * self.rows])
+            for position, row in enumerate(block):
+                buckets[row.tobytes()].append(position)
+            for members in buckets.values():
+                if len(members) > 1:
+                    for position in members:
+                        neighbours[position].update(members)
+        return [sorted(n) for n in neighbours]
+
+    def cluster(self, texts: Sequence[str], names: Optional[Sequence[str]] = None) -> List[List[int]]:
+        """Clusters of positions covering every text, each starting with its leader, in leader order"""
+        signatures = self.hasher.signatures(texts)
+        neighbours = self.candidates(signatures)
+        assigned = np.zeros(len(texts), dtype=bool)
+        clusters = []
+        for leader in range(len(texts)):
+            if assigned[leader]:
+                continue
+            assigned[leader] = True
+            others = np.array([p for p in neighbours[leader] if not assigned[p]], dtype=np.int64)
+            if len(others):
+                similarity = (signatures[others] == signatures[leader]).mean(axis=1)
+                others = others[similarity >= self.threshold]
+                if names is not None and self.name_threshold > 0:
+                    matcher = SequenceMatcher(None, '', names[leader])
+                    others = others[[self._names_match(matcher, names[p]) for p in others.tolist()]] \
+                        if len(others) else others
+                assigned[others] = True
+            clusters.append([leader] + others.tolist())
+        return clusters
+
+    def _names_match(self, matcher: SequenceMatcher, name: str) -> bool:
+        matcher.set_seq1(name)
+        return matcher.ratio() >= self.name_threshold
+
+    def cluster_datasets(self, datasets: Sequence[Dict]) -> List[List[int]]:
+        texts = [normalize_text(d.get('name', ''), d.get('description', '')) for d in datasets]
+        return self.cluster(texts, [' '.join(d.get('name', '').lower().split()) for d in datasets])
+
+
+def prompt_value(pattern: re.Pattern, content: str) -> str:
+    """The string value the pattern finds in a prompt, unescaped, or '' when it is absent"""
+    match = pattern.search(content)
+    return ast.literal_eval(match.group(2)).strip() if match else ''
+
+
+def iter_prompt_datasets(path: str) -> Iterator[Dict]:
+    """Name and description of every request of a batch prompt file such as paperwithcode_prompt_v1.jsonl"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            data = json.loads(line)
+            for message in data['body']['messages']:
+                if message['role'] == 'user':
+                    yield {'custom_id': data['custom_id'],
+                           'name': prompt_value(PROMPT_NAME_PATTERN, message['content']),
+                           'description': prompt_value(PROMPT_DESCRIPTION_PATTERN, message['content'])}
+                    break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster near-duplicate dataset descriptions with MinHash LSH")
+    parser.add_argument('--input', default='extracted_data.json',
+                        help="Datasets (.json list with name and description, or a .jsonl batch prompt file)")
+    parser.add_argument('--output', default='near_duplicate_clusters.json', help="Clusters of two or more datasets")
+    parser.add_argument('--threshold', type=float, default=0.85, help="Estimated Jaccard similarity to the leader")
+    parser.add_argument('--num-perm', type=int, default=128, help="MinHash functions per signature")
+    parser.add_argument('--shingle-size', type=int, default=3, help="Words per shingle")
+    parser.add_argument('--name-threshold', type=float, default=0.7,
+                        help="Name similarity to the leader also required (0 to cluster on the text alone)")
+    args = parser.parse_args()
+
+    if args.input.endswith('.jsonl'):
+        datasets = list(iter_prompt_datasets(args.input))
+    else:
+        with open(args.input, 'r', encoding='utf-8') as f:
+            datasets = json.load(f)
+
+    clusterer = NearDuplicateClusterer(args.threshold, args.num_perm, args.shingle_size,
+                                       name_threshold=args.name_threshold)
+    # Like extract_tags.select_datasets, datasets without a name or a description are not tagged
+    complete = [p for p, d in enumerate(datasets) if d.get('name') and d.get('description')]
+    clusters = [[complete[k] for k in cluster]
+                for cluster in clusterer.cluster_datasets([datasets[p] for p in complete])]
+    duplicates = [cluster for cluster in clusters if len(cluster) > 1]
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump([[{'position': p, 'name': datasets[p].get('name', '')} for p in cluster] for cluster in duplicates],
+                  f, ensure_ascii=False, indent=2)
+
+    print(f"LSH with {clusterer.bands} bands of {clusterer.rows} rows")
+    print(f"{len(complete)} datasets in {len(clusters)} clusters; "
+          f"{len(complete) - len(clusters)} requests saved ({len(duplicates)} clusters with duplicates)")
+    print(f"{len(datasets) - len(complete)} datasets skipped for a missing name or description")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import hashlib
+import argparse
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_PATH = 'response_cache.sqlite'
+
+# Total size of the cached responses above which the least recently used are evicted
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Least recently used rows fetched per eviction query
+EVICTION_BATCH = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+def prompt_key(payload: Dict, model: str) -> str:
+    """Content hash of a chat-completions request: the model, every message and every parameter.
+
+    Azure deployments carry the model in the URL rather than the payload, so
+    callers pass it explicitly; a "model" field in the payload is hashed too.
+    """
+    canonical = json.dumps({'model': model, 'payload': payload}, sort_keys=True,
+                           ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """Chat-completions responses by prompt key, in one SQLite file with LRU eviction.
+
+    Recency is a counter stored with every row and bumped on each hit, so
+    eviction deletes the rows with the smallest counters until the total
+    response size is back under max_bytes. The database runs in WAL mode and
+    commits every write, so an interrupted run keeps what it already paid for.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        count, total, clock = self.db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM responses').fetchone()
+        self.entries = count
+        self.total_bytes = total
+        self._clock = clock
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, key: str) -> Optional[Dict]:
+        row = self.db.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        self.db.execute('UPDATE responses SET last_used = ? WHERE key = ?', (self._tick(), key))
+        return json.loads(row[0])
+
+    def put(self, key: str, response: Dict) -> None:
+        text = json.dumps(response, ensure_ascii=False)
+        size = len(text.encode('utf-8'))
+        self.discard(key)
+        self.db.execute('INSERT INTO responses (key, response, size, last_used) VALUES (?, ?, ?, ?)',
+                        (key, text, size, self._tick()))
+        self.entries += 1
+        self.total_bytes += size
+        self.stats['stores'] += 1
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def discard(self, key: str) -> bool:
+        """Remove one response, e.g. an answer that turned out to be unusable"""
+        row = self.db.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return False
+        self.db.execute('DELETE FROM responses WHERE key = ?', (key,))
+        self.entries -= 1
+        self.total_bytes -= row[0]
+        return True
+
+    def evict(self) -> List[str]:
+        """Delete least recently used responses until the total size fits in max_bytes"""
+        evicted = []
+        while self.total_bytes > self.max_bytes and self.entries:
+            rows = self.db.execute('SELECT key, size FROM responses ORDER BY last_used LIMIT ?',
+                                   (EVICTION_BATCH,)).fetchall()
+            batch = []
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                batch.append((key,))
+                self.total_bytes -= size
+                self.entries -= 1
+            self.db.executemany('DELETE FROM responses WHERE key = ?', batch)
+            evicted.extend(key for key, in batch)
+        self.stats['evictions'] += len(evicted)
+        return evicted
+
+    def clear(self) -> int:
+        removed = self.entries
+        self.db.execute('DELETE FROM responses')
+        self.db.execute('VACUUM')
+        self.entries = self.total_bytes = 0
+        return removed
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> 'ResponseCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the chat-completions response cache")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="Cache database file")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show the number and size of cached responses")
+    subparsers.add_parser('clear', help="Delete every cached response")
+    args = parser.parse_args()
+
+    with ResponseCache(args.cache) as cache:
+        if args.command == 'stats':
+            print(f"{cache.entries} responses, {cache.total_bytes} bytes (limit {cache.max_bytes})")
+        elif args.command == 'clear':
+            print(f"Removed {cache.clear()} cached responses")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# Record statuses; the last record of a position wins
+DONE = 'done'
+FAILED = 'failed'
+
+
+class RunJournal:
+    """Append-only JSONL journal of a tagging run, keyed by dataset position.
+
+    Every finished request appends one line, so recording a result costs
+    O(1) whatever the number of results already saved. Lines are flushed to
+    the OS as they are written and fsynced in batches of `sync_every` records
+    or every `sync_interval` seconds. A run that stops midway is resumed by
+    skipping the positions whose last record is DONE; failed positions are
+    retried. records() reads the final record of every position back in
+    position order, one at a time, for writing the outputs.
+
+    A DONE record keeps the raw answer of the model together with the name
+    and description, which is what both output layouts of the tags need:
+
+        {"position": 12, "status": "done", "name": ..., "description": ..., "answer": "```json ..."}
+        {"position": 13, "status": "failed", "name": ..., "error": "HTTP 400: ..."}
+
+    Datasets tagged through a near-duplicate representative also keep a
+    "duplicate_of" link: {"position": ..., "name": ...} of the representative.
+    """
+
+    def __init__(self, path: str, sync_every: int = 64, sync_interval: float = 1.0):
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        # position -> (byte offset of its last record, status, name)
+        self.index: Dict[int, Tuple[int, str, str]] = {}
+        self._file: Optional[BinaryIO] = None
+        self._pending = 0
+        self._synced_at = time.monotonic()
+        self._load()
+
+    def _load(self) -> None:
+        """Index the existing records, cutting off a last line left incomplete by a crash"""
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.index[record['position']] = (offset, record['status'], record['name'])
+                offset += len(line)
+        if offset < os.path.getsize(self.path):
+            print(f"Truncating incomplete journal record at byte {offset} of {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(offset)
+
+    def is_done(self, position: int, name: str) -> bool:
+        """Whether the dataset at `position` was tagged; a different name means another input file"""
+        entry = self.index.get(position)
+        return entry is not None and entry[1] == DONE and entry[2] == name
+
+    def counts(self) -> Dict[str, int]:
+        counts = {DONE: 0, FAILED: 0}
+        for _, status, _ in self.index.values():
+            counts[status] += 1
+        return counts
+
+    def _append(self, record: Dict) -> None:
+        if self._file is None:
+            self._file = open(self.path, 'ab')
+        offset = self._file.tell()
+        self._file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b'\n')
+        self._file.flush()
+        self.index[record['position']] = (offset, record['status'], record['name'])
+        self._pending += 1
+        if self._pending >= self.sync_every or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+
+    def record_done(self, position: int, name: str, description: str, answer: str,
+                    duplicate_of: Optional[Dict] = None) -> None:
+        record = {"position": position, "status": DONE, "name": name, "description": description, "answer": answer}
+        if duplicate_of is not None:
+            record["duplicate_of"] = duplicate_of
+        self._append(record)
+
+    def record_failed(self, position: int, name: str, error: str) -> None:
+        self._append({"position": position, "status": FAILED, "name": name, "error": error})
+
+    def sync(self) -> None:
+        if self._file is not None and self._pending:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._synced_at = time.monotonic()
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def __enter__(self) -> 'RunJournal':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def records(self, status: Optional[str] = None) -> Iterator[Dict]:
+        """Last record of every position, by position, optionally only those with `status`"""
+        if not self.index:
+            return
+        if self._file is not None:
+            self._file.flush()
+        with open(self.path, 'rb') as f:
+            for position in sorted(self.index):
+                offset, record_status, _ = self.index[position]
+                if status is None or record_status == status:
+                    f.seek(offset)
+                    yield json.loads(f.readline())
@@ -1,5 +1,59 @@
-import json
+import io
+import os
 import re
+import json
+import heapq
+import zipfile
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+# 流式模式下每个排序段在内存中保留的记录数，超过后写入临时文件再归并
+DEFAULT_RUN_SIZE = 100000
+
+@contextmanager
+def open_jsonl(path):
+    """按行读取JSONL文件；.zip文件直接读取其中的.jsonl文件，不解压到磁盘"""
+    if not path.endswith('.zip'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield f
+        return
+    with zipfile.ZipFile(path) as archive:
+        names = [name for name in archive.namelist()
+                 if name.endswith('.jsonl') and not name.startswith('__MACOSX/')]
+        if not names:
+            raise ValueError(f"No .jsonl file in {path}")
+        with archive.open(names[0]) as member:
+            yield io.TextIOWrapper(member, encoding='utf-8')
+
+def task_number(custom_id):
+    """custom_id（如task-12）的数字部分，作为排序键"""
+    return int(custom_id.split('-')[1])
+
+def parse_output_record(line):
+    """输出文件的一行 -> (custom_id, content)"""
+    data = json.loads(line)
+    # 直接获取content内容，不进行JSON解析
+    return data['custom_id'], data['response']['body']['choices'][0]['message']['content']
+
+def parse_input_record(line):
+    """输入文件的一行 -> (custom_id, dataset_info)；没有user消息时返回None"""
+    data = json.loads(line)
+    custom_id = data['custom_id']
+    messages = data['body']['messages']
+    for msg in messages:
+        if msg['role'] == 'user':
+            content = msg['content']
+            # 使用正则表达式提取数据集名称和描述，即使描述为空也进行提取
+            name_match = re.search(r"'dataset_name': '([^']*)'", content)
+            desc_match = re.search(r"'dataset description': '([^']*)'", content)
+            
+            dataset_info = {
+                'dataset_name': name_match.group(1).strip() if name_match else '',
+                'dataset_description': desc_match.group(1).strip() if desc_match else ''
+            }
+            return custom_id, dataset_info
+    return None
 
 def process_files(input_file, output_file, result_file):
     # 存储输入和输出的字典
@@ -8,16 +62,13 @@ def process_files(input_file, output_file, result_file):
     
     # 读取输出文件（result_2.jsonl）
     print("Processing output file...")
-    with open(output_file, 'r', encoding='utf-8') as f:
-        for line in f:
+    with open_jsonl(output_file) as f:
+        for line_num, line in enumerate(f, 1):
             try:
-                data = json.loads(line)
-                custom_id = data['custom_id']
-                # 直接获取content内容，不进行JSON解析
-                content = data['response']['body']['choices'][0]['message']['content']
+                custom_id, content = parse_output_record(line)
                 output_data[custom_id] = content
             except Exception as e:
-                print(f"Error processing output line for {custom_id}: {e}")
+                print(f"Error processing output line {line_num}: {e}")
                 continue
     
     print(f"Processed {len(output_data)} output records")
@@ -25,25 +76,13 @@ def process_files(input_file, output_file, result_file):
     # 读取输入文件
     print("\nProcessing input file...")
     error_count = 0
-    with open(input_file, 'r', encoding='utf-8') as f:
+    with open_jsonl(input_file) as f:
         for line in f:
             try:
-                data = json.loads(line)
-                custom_id = data['custom_id']
-                messages = data['body']['messages']
-                for msg in messages:
-                    if msg['role'] == 'user':
-                        content = msg['content']
-                        # 使用正则表达式提取数据集名称和描述，即使描述为空也进行提取
-                        name_match = re.search(r"'dataset_name': '([^']*)'", content)
-                        desc_match = re.search(r"'dataset description': '([^']*)'", content)
-                        
-                        dataset_info = {
-                            'dataset_name': name_match.group(1).strip() if name_match else '',
-                            'dataset_description': desc_match.group(1).strip() if desc_match else ''
-                        }
-                        input_data[custom_id] = dataset_info
-                        break  # 找到user消息后就退出循环
+                record = parse_input_record(line)
+                if record is not None:
+                    custom_id, dataset_info = record
+                    input_data[custom_id] = dataset_info
             except Exception as e:
                 error_count += 1
                 print(f"Error processing input line {error_count}: {e}")
@@ -66,14 +105,131 @@ def process_files(input_file, output_file, result_file):
                 f.write(json.dumps(result, ensure_ascii=False) + '\n')
                 written_count += 1
     
+    # 缺失数以两个文件中出现过的custom_id总数为准
+    total_count = len(input_data.keys() | output_data.keys())
     print(f"\nTotal matched records written: {written_count}")
-    print(f"Missing input records: {10680 - len(input_data)}")
-    print(f"Missing output records: {10680 - len(output_data)}")
+    print(f"Missing input records: {total_count - len(input_data)}")
+    print(f"Missing output records: {total_count - len(output_data)}")
 
-if __name__ == "__main__":
-    process_files(
-        'paperwithcode_prompt_v1.jsonl',  # 输入文件
-        'result_2.jsonl',        # 输出文件
-        'combined_results_2.jsonl' # 结果文件
-    )
+def iter_records(path, parse, label):
+    """逐行解析JSONL文件，生成(task_number, custom_id, value)；解析失败的行打印后跳过"""
+    with open_jsonl(path) as f:
+        for line_num, line in enumerate(f, 1):
+            try:
+                record = parse(line)
+                if record is not None:
+                    custom_id, value = record
+                    yield task_number(custom_id), custom_id, value
+            except Exception as e:
+                print(f"Error processing {label} line {line_num}: {e}")
+
+def sorted_records(records, run_size=DEFAULT_RUN_SIZE):
+    """按(task_number, custom_id)排序的记录流，内存中最多保留run_size条记录。
+    
+    超过run_size时先把排好序的段写入临时文件，最后用heapq.merge归并（外部排序）。
+    同一custom_id出现多次时只保留最后一次，与字典模式的覆盖行为一致。
+    """
+    runs = []
+    run = []
+    try:
+        for record in records:
+            run.append(record)
+            if len(run) >= run_size:
+                runs.append(_write_run(run))
+                run = []
+        # 排序是稳定的，同一键的记录保持读取顺序
+        run.sort(key=lambda r: (r[0], r[1]))
+        if runs:
+            if run:
+                runs.append(_write_run(run))
+                run = []
+            merged = heapq.merge(*[_read_run(path) for path in runs], key=lambda r: (r[0], r[1]))
+        else:
+            merged = iter(run)
+        
+        # 相同custom_id相邻，保留最后一条
+        previous = None
+        for record in merged:
+            if previous is not None and record[1] != previous[1]:
+                yield previous
+            previous = record
+        if previous is not None:
+            yield previous
+    finally:
+        for path in runs:
+            os.remove(path)
+
+def _write_run(run):
+    """把一段记录排序后写入临时文件，返回文件路径"""
+    run.sort(key=lambda r: (r[0], r[1]))
+    fd, path = tempfile.mkstemp(prefix='result_2_run_', suffix='.jsonl')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        for record in run:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    return path
+
+def _read_run(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            yield tuple(json.loads(line))
 
+def process_files_streaming(input_file, output_file, result_file, run_size=DEFAULT_RUN_SIZE):
+    """与process_files输出相同，但两个文件都按custom_id排序后做归并连接，内存占用有上限"""
+    print("Sorting output and input files...")
+    outputs = sorted_records(iter_records(output_file, parse_output_record, 'output'), run_size)
+    inputs = sorted_records(iter_records(input_file, parse_input_record, 'input'), run_size)
+    
+    input_count = output_count = written_count = 0
+    total_count = 0
+    next_output = next(outputs, None)
+    with open(result_file, 'w', encoding='utf-8') as f:
+        for number, custom_id, dataset_info in inputs:
+            input_count += 1
+            # 跳过排在当前输入之前、没有对应输入的输出记录
+            while next_output is not None and (next_output[0], next_output[1]) < (number, custom_id):
+                output_count += 1
+                total_count += 1
+                next_output = next(outputs, None)
+            total_count += 1
+            if next_output is not None and next_output[1] == custom_id:
+                output_count += 1
+                result = {
+                    'custom_id': custom_id,
+                    'input': dataset_info,
+                    'output': next_output[2]
+                }
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                written_count += 1
+                next_output = next(outputs, None)
+    
+    # 剩余的输出记录都没有对应输入
+    while next_output is not None:
+        output_count += 1
+        total_count += 1
+        next_output = next(outputs, None)
+    
+    print(f"Processed {output_count} output records")
+    print(f"Processed {input_count} input records")
+    print(f"\nTotal matched records written: {written_count}")
+    print(f"Missing input records: {total_count - input_count}")
+    print(f"Missing output records: {total_count - output_count}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Join the batch prompts and the batch outputs of result 2 by custom_id")
+    parser.add_argument('--input', default='paperwithcode_prompt_v1.jsonl',
+                        help="Batch prompt file (.jsonl, or the .zip containing it)")
+    parser.add_argument('--output', default='result_2.jsonl', help="Batch output file (.jsonl or .zip)")
+    parser.add_argument('--result', default='combined_results_2.jsonl', help="Joined records")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Merge-join both files sorted by custom_id with bounded memory")
+    parser.add_argument('--run-size', type=int, default=DEFAULT_RUN_SIZE,
+                        help="Records sorted in memory per run in streaming mode")
+    args = parser.parse_args()
+    
+    if args.streaming:
+        process_files_streaming(args.input, args.output, args.result, args.run_size)
+    else:
+        process_files(args.input, args.output, args.result)
+
+if __name__ == "__main__":
+    main()
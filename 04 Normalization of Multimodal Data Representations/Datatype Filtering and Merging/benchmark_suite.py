@@ -0,0 +1,331 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_HISTORY = 'benchmark_history.json'
+CONFIG_FILE = '5_3_3_pattern_similarity_config.json'
+
+# A stage counts as a regression when it is this much slower than the previous run
+DEFAULT_TOLERANCE = 0.25
+
+# ClusteringEvaluator scores every pair of clustered types up to this vocabulary size
+EXACT_EVALUATION_MAX_TYPES = 20000
+
+# Vocabulary used when no data_types_counts.json is available to learn from
+FALLBACK_PREFIXES = ['3d', '2d', 'rgb', 'depth', 'audio', 'video', 'text', 'medical', 'satellite', 'thermal',
+                     'user', 'question', 'human', 'synthetic', 'multi', 'raw', 'clinical', 'speech']
+FALLBACK_MIDDLES = ['image', 'point', 'sensor', 'motion', 'time', 'scene', 'object', 'language', 'face',
+                    'action', 'graph', 'surface', 'traffic', 'weather', 'product', 'music', 'eeg']
+FALLBACK_SUFFIXES = ['data', 'image', 'video', 'text', 'label', 'annotation', 'sequence', 'description',
+                     'map', 'cloud', 'signal', 'caption', 'record', 'features', 'mask', 'audio', 'score']
+
+
+class VocabularyModel:
+    """Word-level statistics of a data type vocabulary used to synthesize larger ones.
+
+    Name lengths, first words, middle words and last words are drawn from
+    their empirical distributions, and frequencies follow the Zipf law
+    count(rank) = top * rank ** -exponent fitted on the source counts.
+    """
+
+    def __init__(self, length_weights: Counter, prefixes: Counter, middles: Counter, suffixes: Counter,
+                 top_count: int, exponent: float, source_size: int):
+        self.length_weights = length_weights
+        self.prefixes = prefixes
+        self.middles = middles
+        self.suffixes = suffixes
+        self.top_count = top_count
+        self.exponent = exponent
+        self.source_size = source_size
+
+    @classmethod
+    def from_data(cls, data_list: List[List]) -> 'VocabularyModel':
+        """Fit the model on a list of [type, count] pairs"""
+        lengths, prefixes, middles, suffixes = Counter(), Counter(), Counter(), Counter()
+        for dtype, _ in data_list:
+            words = dtype.lower().split()
+            if not words:
+                continue
+            lengths[len(words)] += 1
+            prefixes[words[0]] += 1
+            suffixes[words[-1]] += 1
+            middles.update(words[1:-1])
+        if not middles:
+            middles = Counter(prefixes)
+
+        counts = np.sort(np.array([count for _, count in data_list], dtype=np.float64))[::-1]
+        return cls(lengths, prefixes, middles, suffixes, int(counts[0]), cls._fit_exponent(counts), len(counts))
+
+    @classmethod
+    def fallback(cls) -> 'VocabularyModel':
+        """Small built-in model with roughly the shape of the extracted vocabulary"""
+        lengths = Counter({1: 4, 2: 53, 3: 34, 4: 7, 5: 2})
+        return cls(lengths, Counter(FALLBACK_PREFIXES), Counter(FALLBACK_MIDDLES), Counter(FALLBACK_SUFFIXES),
+                   632, 0.81, 14652)
+
+    @staticmethod
+    def _fit_exponent(counts: np.ndarray) -> float:
+        """Least-squares slope of log(count) against log(rank) above the singleton tail"""
+        ranks = np.arange(1, len(counts) + 1)
+        head = counts > 1
+        if head.sum() < 2:
+            return 1.0
+        slope, _ = np.polyfit(np.log(ranks[head]), np.log(counts[head]), 1)
+        return float(-slope)
+
+    def generate(self, n_types: int, seed: int = 0) -> List[List]:
+        """Synthesize n_types distinct [type, count] pairs, most frequent first"""
+        rng = random.Random(seed)
+        length_values, length_weights = zip(*self.length_weights.items())
+        pools = [tuple(zip(*pool.items())) for pool in (self.prefixes, self.middles, self.suffixes)]
+
+        def draw(pool, k: int) -> List[str]:
+            words, weights = pool
+            return rng.choices(words, weights, k=k)
+
+        names = []
+        seen = set()
+        attempts = 0
+        while len(names) < n_types:
+            length = rng.choices(length_values, length_weights)[0]
+            attempts += 1
+            if attempts > 20 * n_types:
+                # The word pools are exhausted for this size, so lengthen names
+                length += 1 + attempts // (20 * n_types)
+            if length == 1:
+                words = draw(pools[2], 1)
+            else:
+                words = draw(pools[0], 1) + draw(pools[1], length - 2) + draw(pools[2], 1)
+            name = ' '.join(words)
+            if name not in seen:
+                seen.add(name)
+                names.append(name)
+
+        # Keep the share of singletons: scale the head with the vocabulary size
+        top = self.top_count * n_types / self.source_size
+        return [[name, max(1, int(round(top * rank ** -self.exponent)))] for rank, name in enumerate(names, 1)]
+
+
+def _peak_rss_kb() -> int:
+    """Peak resident set size of this process in KiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux kibibytes
+    return int(peak // 1024) if sys.platform == 'darwin' else int(peak)
+
+
+def _improved_results(data_list: List[List]) -> Dict:
+    """Grouping results of the improved analyzer in the results file layout"""
+    from improved_datatype_similarity_analysis import ImprovedDatatypeSimilarityAnalyzer, build_analysis_results
+    analyzer = ImprovedDatatypeSimilarityAnalyzer()
+    similar_groups = analyzer.find_similar_groups(data_list)
+    return build_analysis_results(similar_groups, analyzer.analyze_and_generate_statistics(similar_groups))
+
+
+def _setup_stage(stage: str, data_list: List[List]):
+    """Untimed preparation of a stage; returns the callable to time and a note"""
+    if stage == 'basic_grouping':
+        from datatype_similarity_analysis import DatatypeSimilarityAnalyzer
+        return lambda: DatatypeSimilarityAnalyzer().find_similar_groups(data_list), {}
+
+    if stage == 'improved_grouping':
+        from improved_datatype_similarity_analysis import ImprovedDatatypeSimilarityAnalyzer
+        return lambda: ImprovedDatatypeSimilarityAnalyzer().find_similar_groups(data_list), {}
+
+    if stage == 'threshold_analysis':
+        from threshold_analysis import analyze_threshold_impact
+        thresholds = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
+        return lambda: analyze_threshold_impact(data_list, thresholds), {}
+
+    if stage == 'pattern_extraction':
+        from extract_data_patterns import analyze_patterns
+        return lambda: analyze_patterns(data_list), {}
+
+    if stage == 'isolated_types':
+        from frequency_table import FrequencyTable
+        from isolated_types_analyzer import grouped_type_names, run_isolated_types_analysis
+        matched_types = grouped_type_names(_improved_results(data_list))
+        # The report covers every bucket, so it stands in for the streamed outputs
+        return lambda: list(run_isolated_types_analysis(FrequencyTable.from_pairs(data_list),
+                                                        matched_types).iter_report_lines()), {}
+
+    if stage == 'clustering_evaluation':
+        from clustering_effectiveness_evaluator import ClusteringEvaluator
+        results = _improved_results(data_list)
+        mode = 'exact' if len(data_list) <= EXACT_EVALUATION_MAX_TYPES else 'sampled'
+        evaluator = ClusteringEvaluator(data_list, results)
+        return lambda: evaluator.generate_evaluation_report(quality_mode=mode), {'quality_mode': mode}
+
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+STAGES = ['basic_grouping', 'improved_grouping', 'threshold_analysis', 'pattern_extraction',
+          'isolated_types', 'clustering_evaluation']
+
+
+def _run_stage(stage: str, data_list: List[List], workdir: str, queue) -> None:
+    """Body of the child process that times one stage"""
+    os.chdir(workdir)
+    from similarity_kernel import BatchStringSimilarity
+
+    setup_start = time.perf_counter()
+    run, extra = _setup_stage(stage, data_list)
+    setup_time = time.perf_counter() - setup_start
+
+    calls_before = BatchStringSimilarity.total_calls
+    start = time.perf_counter()
+    run()
+    wall_time = time.perf_counter() - start
+
+    queue.put(dict(extra, **{
+        'status': 'ok',
+        'wall_time': wall_time,
+        'setup_time': setup_time,
+        'peak_rss_kb': _peak_rss_kb(),
+        'similarity_calls': BatchStringSimilarity.total_calls - calls_before
+    }))
+
+
+def run_stage(stage: str, data_list: List[List], workdir: str, timeout: Optional[float]) -> Dict:
+    """Time one stage in a fresh process, so that peak RSS belongs to that stage alone"""
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(target=_run_stage, args=(stage, data_list, workdir, queue))
+    process.start()
+    try:
+        return queue.get(timeout=timeout)
+    except Exception:
+        status = 'timeout' if process.is_alive() else 'failed'
+        return {'status': status}
+    finally:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path: str) -> List[Dict]:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def find_regressions(history: List[Dict], run: Dict, tolerance: float) -> List[str]:
+    """Stages of run that are slower than the latest earlier successful measurement"""
+    regressions = []
+    for result in run['results']:
+        if result['status'] != 'ok':
+            continue
+        for previous_run in reversed(history):
+            previous = next((r for r in previous_run['results']
+                             if r['stage'] == result['stage'] and r['n_types'] == result['n_types']
+                             and r['status'] == 'ok'), None)
+            if previous is None:
+                continue
+            if result['wall_time'] > previous['wall_time'] * (1 + tolerance):
+                regressions.append(
+                    f"{result['stage']} @ {result['n_types']:,} types: {result['wall_time']:.2f}s "
+                    f"vs {previous['wall_time']:.2f}s in {previous_run['timestamp']}"
+                )
+            break
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the datatype filtering and merging stage on synthetic vocabularies")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="Vocabulary sizes to benchmark")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to time")
+    parser.add_argument('--source', default='data_types_counts.json',
+                        help="Vocabulary the synthetic data imitates (built-in model if missing)")
+    parser.add_argument('--config', default=CONFIG_FILE, help="Pattern similarity config of the improved analyzer")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the vocabulary generator")
+    parser.add_argument('--timeout', type=float, default=3600, help="Seconds after which a stage is abandoned")
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help="JSON file the measurements are appended to")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative slowdown reported as a regression")
+    parser.add_argument('--fail-on-regression', action='store_true', help="Exit with status 1 on a regression")
+    args = parser.parse_args()
+
+    if os.path.exists(args.source):
+        with open(args.source, 'r', encoding='utf-8') as f:
+            model = VocabularyModel.from_data(json.load(f))
+    else:
+        print(f"{args.source} not found, using the built-in vocabulary model")
+        model = VocabularyModel.fallback()
+
+    # Stages run in a scratch directory holding only the config they read
+    workdir = os.path.abspath('benchmark_workdir')
+    os.makedirs(workdir, exist_ok=True)
+    if os.path.exists(args.config):
+        with open(args.config, 'r', encoding='utf-8') as src, \
+                open(os.path.join(workdir, CONFIG_FILE), 'w', encoding='utf-8') as dst:
+            dst.write(src.read())
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    run = {
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'revision': _git_revision(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'seed': args.seed,
+        'model': {'zipf_exponent': round(model.exponent, 4), 'source_types': model.source_size},
+        'results': []
+    }
+
+    for n_types in args.sizes:
+        start = time.perf_counter()
+        data_list = model.generate(n_types, args.seed)
+        print(f"\nGenerated {n_types:,} types in {time.perf_counter() - start:.1f}s")
+        for stage in args.stages:
+            if stage in ('improved_grouping', 'isolated_types', 'clustering_evaluation') \
+                    and not os.path.exists(os.path.join(workdir, CONFIG_FILE)):
+                result = {'status': 'skipped'}
+            else:
+                result = run_stage(stage, data_list, workdir, args.timeout)
+            result = dict({'stage': stage, 'n_types': n_types}, **result)
+            run['results'].append(result)
+
+            if result['status'] == 'ok':
+                print(f"  {stage:<22} {result['wall_time']:>10.2f}s  {result['peak_rss_kb'] / 1024:>8.1f} MiB  "
+                      f"{result['similarity_calls']:>14,} similarity calls")
+            else:
+                print(f"  {stage:<22} {result['status']}")
+
+    history = load_history(args.history)
+    regressions = find_regressions(history, run, args.tolerance)
+    history.append(run)
+    with open(args.history, 'w', encoding='utf-8') as f:
+        json.dump(history, f, indent=2)
+    print(f"\nAppended the measurements to {args.history}")
+
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+import math
+from collections import Counter, defaultdict
+from typing import Dict, Hashable, Iterable, List, Sequence, Set, Tuple
+
+import numpy as np
+
+# Characters beyond the most common ones share one count column, which keeps
+# the character-count matrix small while the bound it gives stays valid
+CHAR_COUNT_COLUMNS = 63
+
+
+class TokenBlocker:
+    """Inverted index from tokens to the positions of the items containing them.
+
+    Items without any token are kept as wildcards and returned for every query,
+    which mirrors rules that are trivially satisfied by an empty token set.
+    """
+
+    def __init__(self, token_sets: Sequence[Iterable[Hashable]]):
+        self.postings: Dict[Hashable, Set[int]] = defaultdict(set)
+        self.wildcards: Set[int] = set()
+        self._tokens: List[Tuple[Hashable, ...]] = []
+
+        for position, tokens in enumerate(token_sets):
+            tokens = tuple(set(tokens))
+            self._tokens.append(tokens)
+            if not tokens:
+                self.wildcards.add(position)
+            for token in tokens:
+                self.postings[token].add(position)
+
+    def discard(self, position: int) -> None:
+        """Remove an item so that it is no longer returned as a candidate"""
+        tokens = self._tokens[position]
+        if not tokens:
+            self.wildcards.discard(position)
+        for token in tokens:
+            self.postings[token].discard(position)
+
+    def candidates(self, tokens: Iterable[Hashable]) -> Set[int]:
+        """Positions of the items sharing at least one token with the query"""
+        result = set(self.wildcards)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting:
+                result.update(posting)
+        return result
+
+
+class StringSimilarityBlocker:
+    """Candidate generator for `SequenceMatcher(None, a, b).ratio() > threshold`.
+
+    The number of matching characters found by Ratcliff/Obershelp is bounded by
+    the size of the intersection of the character multisets of both strings
+    (this is what `quick_ratio` computes). Every string is therefore turned into
+    a set of `(char, occurrence)` tokens and indexed by the prefix of that set
+    that any qualifying partner must share (prefix filtering under a global
+    rarest-first token order). No pair above the threshold is ever missed, so
+    callers still verify each candidate with the exact similarity.
+    """
+
+    def __init__(self, strings: Sequence[str], threshold: float):
+        self.threshold = threshold
+        self.lengths = [len(s) for s in strings]
+        self.postings: Dict[Tuple[str, int], Set[int]] = defaultdict(set)
+        self.empty: Set[int] = set()
+        self.alive: Set[int] = set(range(len(strings)))
+
+        self._char_counts = [Counter(s) for s in strings]
+        self._length_array = np.array(self.lengths, dtype=np.int64)
+        self._char_matrix = self._build_char_matrix()
+        token_lists = [self._multiset_tokens(s) for s in strings]
+        self._document_frequency = Counter(token for tokens in token_lists for token in tokens)
+
+        self._prefixes: List[Tuple[Tuple[str, int], ...]] = []
+        for position, tokens in enumerate(token_lists):
+            self._index_prefix(position, tokens)
+
+    def _index_prefix(self, position: int, tokens: List[Tuple[str, int]]) -> None:
+        """Post the string at `position` under the prefix of its tokens, rarest first"""
+        if not tokens:
+            self.empty.add(position)
+            self._prefixes.append(())
+            return
+        tokens.sort(key=lambda token: (self._document_frequency[token], token))
+        prefix = tuple(tokens[:self._prefix_length(len(tokens))])
+        self._prefixes.append(prefix)
+        for token in prefix:
+            self.postings[token].add(position)
+
+    def _build_char_matrix(self) -> np.ndarray:
+        """Per-string character counts over the most common characters plus one shared column"""
+        char_frequency = Counter()
+        for counts in self._char_counts:
+            char_frequency.update(counts.keys())
+        self._columns = {char: k for k, (char, _) in enumerate(char_frequency.most_common(CHAR_COUNT_COLUMNS))}
+        return self._char_rows(self._char_counts)
+
+    def _char_rows(self, char_counts: Sequence[Counter]) -> np.ndarray:
+        other = len(self._columns)
+        matrix = np.zeros((len(char_counts), other + 1), dtype=np.int32)
+        for position, counts in enumerate(char_counts):
+            for char, count in counts.items():
+                matrix[position, self._columns.get(char, other)] += count
+        return matrix
+
+    def add(self, strings: Sequence[str]) -> None:
+        """Index more strings at the next positions.
+
+        The token order and the character columns stay those of the initial
+        strings. Any fixed order and any pooling of characters keep the
+        filters exact, so new strings only make them somewhat less selective.
+        """
+        start = len(self.lengths)
+        char_counts = [Counter(s) for s in strings]
+        self.lengths.extend(len(s) for s in strings)
+        self._char_counts.extend(char_counts)
+        self._length_array = np.array(self.lengths, dtype=np.int64)
+        self._char_matrix = np.vstack([self._char_matrix, self._char_rows(char_counts)])
+        for position, s in enumerate(strings, start):
+            self.alive.add(position)
+            self._index_prefix(position, self._multiset_tokens(s))
+
+    @staticmethod
+    def _multiset_tokens(s: str) -> List[Tuple[str, int]]:
+        """Turn a string into a set of (char, occurrence) tokens"""
+        seen = defaultdict(int)
+        tokens = []
+        for char in s:
+            seen[char] += 1
+            tokens.append((char, seen[char]))
+        return tokens
+
+    def _prefix_length(self, size: int) -> int:
+        """Number of leading tokens that a qualifying partner must overlap with"""
+        if not 0 <= self.threshold < 1:
+            return size
+        # ratio > t implies matches > t * size / (2 - t) for either string
+        min_overlap = max(1, math.floor(self.threshold * size / (2 - self.threshold)))
+        return max(1, size - min_overlap + 1)
+
+    def may_exceed(self, i: int, j: int) -> bool:
+        """Exact upper bounds on the ratio of two strings (length, then `quick_ratio`)"""
+        la, lb = self.lengths[i], self.lengths[j]
+        if la + lb == 0:
+            return 1.0 > self.threshold
+        if 2 * min(la, lb) / (la + lb) <= self.threshold:
+            return False
+
+        counts_a, counts_b = self._char_counts[i], self._char_counts[j]
+        if len(counts_a) > len(counts_b):
+            counts_a, counts_b = counts_b, counts_a
+        matches = sum(min(count, counts_b.get(char, 0)) for char, count in counts_a.items())
+        return 2 * matches / (la + lb) > self.threshold
+
+    def filter_candidates(self, i: int, positions: np.ndarray) -> np.ndarray:
+        """Vectorized `may_exceed` for one string against many positions.
+
+        min(a1 + a2, b1 + b2) >= min(a1, b1) + min(a2, b2), so pooling the rare
+        characters into one column can only loosen the bound, never miss a pair.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.threshold < 0:
+            return positions
+        total = self._length_array[i] + self._length_array[positions]
+        matches = np.minimum(self._char_matrix[i], self._char_matrix[positions]).sum(axis=1)
+        shortest = np.minimum(self._length_array[i], self._length_array[positions])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            keep = (2 * np.minimum(matches, shortest) / total > self.threshold) | (
+                (total == 0) & (1.0 > self.threshold)
+            )
+        return positions[keep]
+
+    def discard(self, position: int) -> None:
+        """Remove an item so that it is no longer returned as a candidate"""
+        self.alive.discard(position)
+        self.empty.discard(position)
+        for token in self._prefixes[position]:
+            self.postings[token].discard(position)
+
+    def candidates(self, position: int) -> Set[int]:
+        """Positions of the remaining strings that may exceed the threshold"""
+        if self.threshold >= 1:
+            return set()
+        if self.threshold < 0:
+            # Every pair satisfies ratio >= 0 > threshold
+            return self.alive - {position}
+
+        if not self._prefixes[position]:
+            # An empty string only reaches a ratio of 1.0 against another empty string
+            return self.empty - {position}
+
+        result = set()
+        for token in self._prefixes[position]:
+            posting = self.postings.get(token)
+            if posting:
+                result.update(posting)
+        result.discard(position)
+        return result
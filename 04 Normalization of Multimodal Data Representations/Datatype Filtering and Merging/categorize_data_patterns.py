@@ -135,18 +135,8 @@ def generate_similarity_config(validated_patterns: Dict) -> Dict:
         }
     }
 
-def main():
-    # Load pattern analysis results
-    with open('pattern_analysis.json', 'r', encoding='utf-8') as f:
-        patterns = json.load(f)
-    
-    # Analyze patterns
-    validated_patterns = analyze_patterns_for_similarity(patterns)
-    
-    # Generate configuration
-    similarity_config = generate_similarity_config(validated_patterns)
-    
-    # Save analysis report
+def generate_pattern_report(validated_patterns: Dict) -> List[str]:
+    """Lines of pattern_categories_report.txt"""
     report = ["Data Type Pattern Analysis Report", "=" * 50, "\n"]
     
     # 1. Add high-frequency pattern statistics
@@ -177,14 +167,33 @@ def main():
                     for term, freq in sorted(terms.items(), key=lambda x: x[1], reverse=True):
                         report.append(f"    - {term}: {freq}")
     
-    # Save report
-    with open('pattern_categories_report.txt', 'w', encoding='utf-8') as f:
-        f.write('\n'.join(report))
-    
-    # Save configuration (including high-frequency patterns)
+    return report
+
+def categorize_patterns(patterns: Dict[str, Dict[str, int]]) -> Tuple[List[str], Dict]:
+    """Report lines and similarity config (including high-frequency patterns) for the pattern statistics"""
+    validated_patterns = analyze_patterns_for_similarity(patterns)
+    similarity_config = generate_similarity_config(validated_patterns)
     similarity_config['high_frequency_patterns'] = validated_patterns['high_frequency']
-    with open('pattern_similarity_config.json', 'w', encoding='utf-8') as f:
+    return generate_pattern_report(validated_patterns), similarity_config
+
+def save_pattern_categories(report: List[str], similarity_config: Dict,
+                            report_path: str = 'pattern_categories_report.txt',
+                            config_path: str = 'pattern_similarity_config.json') -> None:
+    with open(report_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(report))
+    with open(config_path, 'w', encoding='utf-8') as f:
         json.dump(similarity_config, f, indent=2, ensure_ascii=False)
 
+def main():
+    # Load pattern analysis results
+    with open('pattern_analysis.json', 'r', encoding='utf-8') as f:
+        patterns = json.load(f)
+    
+    # Analyze patterns and generate configuration
+    report, similarity_config = categorize_patterns(patterns)
+    
+    # Save report and configuration
+    save_pattern_categories(report, similarity_config)
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
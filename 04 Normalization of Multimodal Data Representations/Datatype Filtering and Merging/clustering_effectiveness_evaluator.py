@@ -1,29 +1,52 @@
 import numpy as np
 from collections import defaultdict
-from difflib import SequenceMatcher
 import json
-from typing import Dict, List, Tuple
+import argparse
+from statistics import NormalDist
+from typing import Dict, List, Tuple, Union
 from datetime import datetime
 import os
+from frequency_table import FrequencyTable
+from results_io import load_results
+from similarity_kernel import BatchStringSimilarity
+
+QUALITY_MODES = ('exact', 'sampled')
+
+# Number of type pairs scored by the sampled mode, split evenly between the
+# intra-cluster and inter-cluster estimates
+DEFAULT_SAMPLE_BUDGET = 20000
+
+def unrank_pairs(p: np.ndarray, size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Pairs (i, j) with i < j < size numbered p in row-major order, as np.triu_indices(size, k=1) lists them"""
+    p = np.asarray(p, dtype=np.int64)
+    i = size - 2 - np.floor(np.sqrt(-8 * p + 4 * size * (size - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = p + i + 1 - size * (size - 1) // 2 + (size - i) * ((size - i) - 1) // 2
+    return i, j
 
 class ClusteringEvaluator:
     """
     A class to evaluate the effectiveness of data type clustering
     """
-    def __init__(self, original_data: List[Tuple[str, int]], clustering_results: Dict):
+    def __init__(self, original_data: Union[FrequencyTable, List[Tuple[str, int]]], clustering_results: Dict,
+                 similarity_method: str = 'ratcliff_obershelp'):
         """
         Initialize with original data and clustering results
         
         Args:
-            original_data: List of tuples (data_type, frequency)
+            original_data: FrequencyTable, or list of tuples (data_type, frequency)
             clustering_results: Dictionary containing clustering information
+            similarity_method: String similarity used by the quality metrics
+                ('ratcliff_obershelp' matches difflib.SequenceMatcher)
         """
+        if not isinstance(original_data, FrequencyTable):
+            original_data = FrequencyTable.from_pairs(original_data)
         self.original_data = original_data
         self.clustering_results = clustering_results
+        self.similarity_kernel = BatchStringSimilarity(similarity_method)
         
         # Calculate basic statistics
         self.total_original_types = len(original_data)
-        self.total_original_freq = sum(freq for _, freq in original_data)
+        self.total_original_freq = original_data.total
         self.total_clusters = clustering_results['statistics']['overall_statistics']['total_groups']
         self.total_clustered_types = clustering_results['statistics']['overall_statistics']['total_types']
         self.total_clustered_freq = clustering_results['statistics']['overall_statistics']['total_frequency']
@@ -57,46 +80,60 @@ class ClusteringEvaluator:
             'suffix_category': sum(group['total_frequency'] for group in stats['suffix_category_match'].values()) / total_matches
         }
 
-    def calculate_cluster_quality(self) -> Dict[str, float]:
-        """Calculate quality metrics for clustering results"""
-        # Get all clusters from the results
+    def get_clusters(self) -> Dict[str, List[str]]:
+        """Member type names of every cluster in the clustering results"""
         clusters = defaultdict(list)
         for group_name, group_data in self.clustering_results['groups'].items():
             for type_info in group_data['types']:
                 clusters[group_name].append(type_info['name'])
+        return clusters
+
+    def calculate_cluster_quality(self, mode: str = 'exact', sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+                                  confidence: float = 0.95, seed: int = 0) -> Dict[str, float]:
+        """Calculate quality metrics for clustering results
         
-        # Calculate average similarity within clusters
-        intra_cluster_similarities = []
-        for cluster_types in clusters.values():
-            if len(cluster_types) > 1:
-                similarities = []
-                for i in range(len(cluster_types)):
-                    for j in range(i + 1, len(cluster_types)):
-                        sim = SequenceMatcher(None, cluster_types[i], cluster_types[j]).ratio()
-                        similarities.append(sim)
-                if similarities:
-                    intra_cluster_similarities.append(np.mean(similarities))
+        'exact' scores every pair of types; 'sampled' estimates both averages
+        from stratified pair samples of about sample_budget pairs and reports
+        confidence intervals.
+        """
+        if mode not in QUALITY_MODES:
+            raise ValueError(f"Unknown quality mode '{mode}', expected one of {QUALITY_MODES}")
         
-        # Calculate average distance between clusters
-        inter_cluster_distances = []
-        cluster_names = list(clusters.keys())
-        for i in range(len(cluster_names)):
-            for j in range(i + 1, len(cluster_names)):
-                distances = []
-                for type1 in clusters[cluster_names[i]]:
-                    for type2 in clusters[cluster_names[j]]:
-                        # Convert similarity to distance
-                        distance = 1 - SequenceMatcher(None, type1, type2).ratio()
-                        distances.append(distance)
-                if distances:
-                    inter_cluster_distances.append(np.mean(distances))
+        # Get all clusters from the results
+        clusters = self.get_clusters()
+        
+        if mode == 'exact':
+            avg_intra, avg_inter, pairs_scored = self._exact_cluster_similarities(clusters)
+            estimation = {'mode': mode, 'pairs_scored': pairs_scored}
+        else:
+            rng = np.random.default_rng(seed)
+            intra = self._sampled_intra_cluster_similarity(clusters, sample_budget // 2, rng)
+            inter = self._sampled_inter_cluster_distance(clusters, sample_budget - sample_budget // 2, rng)
+            avg_intra, avg_inter = intra['estimate'], inter['estimate']
+            z = NormalDist().inv_cdf(0.5 + confidence / 2)
+            estimation = {
+                'mode': mode,
+                'sample_budget': sample_budget,
+                'confidence': confidence,
+                'seed': seed,
+                'pairs_scored': intra['pairs_scored'] + inter['pairs_scored'],
+                'avg_intra_cluster_similarity': self._interval(intra, z),
+                'avg_inter_cluster_distance': self._interval(inter, z)
+            }
+            # The silhouette estimate grows with both averages, so their bounds bound it
+            estimation['silhouette_score_estimate'] = {
+                'lower': self._silhouette(estimation['avg_intra_cluster_similarity']['lower'],
+                                          estimation['avg_inter_cluster_distance']['lower']),
+                'upper': self._silhouette(estimation['avg_intra_cluster_similarity']['upper'],
+                                          estimation['avg_inter_cluster_distance']['upper'])
+            }
         
         # Calculate cluster size statistics
         cluster_sizes = [len(c) for c in clusters.values()]
         
         return {
-            'avg_intra_cluster_similarity': np.mean(intra_cluster_similarities),
-            'avg_inter_cluster_distance': np.mean(inter_cluster_distances),
+            'avg_intra_cluster_similarity': avg_intra,
+            'avg_inter_cluster_distance': avg_inter,
             'cluster_size_stats': {
                 'mean': np.mean(cluster_sizes),
                 'median': np.median(cluster_sizes),
@@ -104,16 +141,149 @@ class ClusteringEvaluator:
                 'min': np.min(cluster_sizes),
                 'max': np.max(cluster_sizes)
             },
-            'silhouette_score_estimate': (np.mean(inter_cluster_distances) - 
-                                        (1 - np.mean(intra_cluster_similarities))) / 
-                                        max(np.mean(inter_cluster_distances), 
-                                            1 - np.mean(intra_cluster_similarities))
+            'silhouette_score_estimate': self._silhouette(avg_intra, avg_inter),
+            'estimation': estimation
+        }
+
+    @staticmethod
+    def _silhouette(avg_intra: float, avg_inter: float) -> float:
+        """Silhouette-style score from the average similarity and distance"""
+        return (avg_inter - (1 - avg_intra)) / max(avg_inter, 1 - avg_intra)
+
+    @staticmethod
+    def _interval(estimate: Dict, z: float) -> Dict[str, float]:
+        """Normal confidence interval of a sampled estimate"""
+        half_width = z * np.sqrt(estimate['variance'])
+        return {
+            'estimate': float(estimate['estimate']),
+            'lower': float(estimate['estimate'] - half_width),
+            'upper': float(estimate['estimate'] + half_width),
+            'standard_error': float(np.sqrt(estimate['variance'])),
+            'strata': estimate['strata'],
+            'strata_sampled': estimate['strata_sampled']
         }
 
-    def generate_evaluation_report(self) -> Dict:
+    def _exact_cluster_similarities(self, clusters: Dict[str, List[str]]) -> Tuple[float, float, int]:
+        """Average intra-cluster similarity and inter-cluster distance over all pairs"""
+        pairs_scored = 0
+        
+        # Calculate average similarity within clusters
+        intra_cluster_similarities = []
+        for cluster_types in clusters.values():
+            if len(cluster_types) > 1:
+                # Only the distinct pairs (i, j) with i < j, in row-major order
+                first, second = np.triu_indices(len(cluster_types), k=1)
+                similarities = self.similarity_kernel.indexed_pairs(cluster_types, first, second)
+                intra_cluster_similarities.append(np.mean(similarities))
+                pairs_scored += len(first)
+        
+        # Calculate average distance between clusters
+        inter_cluster_distances = []
+        cluster_names = list(clusters.keys())
+        for i in range(len(cluster_names)):
+            later_types = [dtype for name in cluster_names[i + 1:] for dtype in clusters[name]]
+            if not later_types:
+                continue
+            # Score the cluster against all later clusters at once, then split by cluster
+            similarity_matrix = self.similarity_kernel.many_to_many(clusters[cluster_names[i]], later_types)
+            pairs_scored += similarity_matrix.size
+            start = 0
+            for name in cluster_names[i + 1:]:
+                end = start + len(clusters[name])
+                # Convert similarity to distance
+                distances = (1 - similarity_matrix[:, start:end]).ravel()
+                if len(distances):
+                    inter_cluster_distances.append(np.mean(distances))
+                start = end
+        
+        return np.mean(intra_cluster_similarities), np.mean(inter_cluster_distances), pairs_scored
+
+    def _sampled_intra_cluster_similarity(self, clusters: Dict[str, List[str]], budget: int,
+                                          rng: np.random.Generator) -> Dict:
+        """Stratified estimate of the average intra-cluster similarity (one stratum per cluster)"""
+        members = [types for types in clusters.values() if len(types) > 1]
+        sizes = np.array([len(types) * (len(types) - 1) // 2 for types in members], dtype=np.int64)
+        
+        def draw(h: int, n: int) -> Tuple[List[str], List[str]]:
+            i, j = unrank_pairs(rng.choice(sizes[h], n, replace=False), len(members[h]))
+            return [members[h][k] for k in i], [members[h][k] for k in j]
+        
+        return self._stratified_mean(len(sizes), lambda chosen: sizes[chosen], draw, budget, rng,
+                                     lambda scores: scores)
+
+    def _sampled_inter_cluster_distance(self, clusters: Dict[str, List[str]], budget: int,
+                                        rng: np.random.Generator) -> Dict:
+        """Stratified estimate of the average inter-cluster distance (one stratum per cluster pair)"""
+        members = list(clusters.values())
+        cluster_sizes = np.array([len(types) for types in members], dtype=np.int64)
+        
+        # Cluster pairs are numbered row by row and unranked only once drawn
+        def stratum_sizes(chosen: np.ndarray) -> np.ndarray:
+            first, second = unrank_pairs(chosen, len(members))
+            return cluster_sizes[first] * cluster_sizes[second]
+        
+        def draw(h: int, n: int) -> Tuple[List[str], List[str]]:
+            first, second = unrank_pairs(np.array([h]), len(members))
+            a, b = members[first[0]], members[second[0]]
+            p = rng.choice(len(a) * len(b), n, replace=False)
+            return [a[k] for k in p // len(b)], [b[k] for k in p % len(b)]
+        
+        return self._stratified_mean(len(members) * (len(members) - 1) // 2, stratum_sizes, draw, budget, rng,
+                                     lambda scores: 1 - scores)
+
+    def _stratified_mean(self, strata: int, stratum_sizes, draw, budget: int, rng: np.random.Generator,
+                         transform) -> Dict:
+        """Two-stage estimate of the unweighted mean of the per-stratum pair means.
+        
+        Strata are drawn uniformly without replacement and pairs uniformly
+        without replacement within each drawn stratum. When every stratum is
+        drawn this reduces to stratified sampling, and a fully enumerated
+        stratum contributes no variance. stratum_sizes gives the pair counts
+        of the drawn strata only, so the strata need not be enumerated.
+        """
+        if strata == 0:
+            return {'estimate': float('nan'), 'variance': 0.0, 'pairs_scored': 0,
+                    'strata': 0, 'strata_sampled': 0}
+        
+        # At least two pairs per stratum are needed for a within-stratum variance
+        per_stratum = max(2, budget // strata)
+        sampled = min(strata, max(1, budget // per_stratum))
+        chosen = np.sort(rng.choice(strata, sampled, replace=False))
+        sizes = stratum_sizes(chosen)
+        draws = np.minimum(sizes, per_stratum)
+        
+        first_strings, second_strings = [], []
+        for h, n in zip(chosen, draws):
+            a, b = draw(int(h), int(n))
+            first_strings.extend(a)
+            second_strings.extend(b)
+        values = transform(self.similarity_kernel.pairwise(first_strings, second_strings))
+        
+        means = np.empty(sampled)
+        within = 0.0
+        start = 0
+        for k, n in enumerate(draws):
+            block = values[start:start + n]
+            start += n
+            means[k] = block.mean()
+            if n < sizes[k]:
+                within += (1 - n / sizes[k]) * block.var(ddof=1) / n
+        
+        between = means.var(ddof=1) if sampled > 1 else 0.0
+        variance = (1 - sampled / strata) * between / sampled + within / (sampled * strata)
+        return {
+            'estimate': float(means.mean()),
+            'variance': float(variance),
+            'pairs_scored': int(draws.sum()),
+            'strata': int(strata),
+            'strata_sampled': int(sampled)
+        }
+
+    def generate_evaluation_report(self, quality_mode: str = 'exact', sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+                                   confidence: float = 0.95, seed: int = 0) -> Dict:
         """Generate a comprehensive evaluation report"""
         # Get cluster quality metrics
-        cluster_quality = self.calculate_cluster_quality()
+        cluster_quality = self.calculate_cluster_quality(quality_mode, sample_budget, confidence, seed)
         
         cluster_size_stats = cluster_quality['cluster_size_stats']
         converted_size_stats = {
@@ -128,7 +298,8 @@ class ClusteringEvaluator:
             'avg_intra_cluster_similarity': float(cluster_quality['avg_intra_cluster_similarity']),
             'avg_inter_cluster_distance': float(cluster_quality['avg_inter_cluster_distance']),
             'cluster_size_stats': converted_size_stats,
-            'silhouette_score_estimate': float(cluster_quality['silhouette_score_estimate'])
+            'silhouette_score_estimate': float(cluster_quality['silhouette_score_estimate']),
+            'estimation': cluster_quality['estimation']
         }
         
         return {
@@ -177,6 +348,21 @@ class ClusteringEvaluator:
             f"Average Intra-cluster Similarity: {report['cluster_quality']['avg_intra_cluster_similarity']:.2%}",
             f"Average Inter-cluster Distance: {report['cluster_quality']['avg_inter_cluster_distance']:.2%}",
             f"Estimated Silhouette Score: {report['cluster_quality']['silhouette_score_estimate']:.2%}",
+        ])
+        
+        estimation = report['cluster_quality'].get('estimation', {'mode': 'exact'})
+        if estimation['mode'] == 'sampled':
+            lines.append(
+                f"(Sampled estimates from {estimation['pairs_scored']:,} type pairs, "
+                f"{estimation['confidence']:.0%} confidence intervals)"
+            )
+            for metric, label in [('avg_intra_cluster_similarity', 'Intra-cluster Similarity'),
+                                  ('avg_inter_cluster_distance', 'Inter-cluster Distance'),
+                                  ('silhouette_score_estimate', 'Silhouette Score')]:
+                interval = estimation[metric]
+                lines.append(f"{label} CI: {interval['lower']:.2%} - {interval['upper']:.2%}")
+        
+        lines.extend([
             "\nCluster Size Statistics:",
             f"Mean Size: {report['cluster_quality']['cluster_size_stats']['mean']:.1f}",
             f"Median Size: {report['cluster_quality']['cluster_size_stats']['median']:.1f}",
@@ -192,26 +378,9 @@ class ClusteringEvaluator:
         
         return "\n".join(lines)
 
-def main():
-    # Create output directory if it doesn't exist
-    output_dir = "evaluation_results"
+def save_evaluation_report(report: Dict, text: str, output_dir: str = "evaluation_results") -> Tuple[str, str]:
+    """Write the report as timestamped JSON and text files; returns their paths"""
     os.makedirs(output_dir, exist_ok=True)
-    
-    # Load original data
-    with open('data_types_counts.json', 'r') as f:
-        original_data = json.load(f)
-
-    # Load clustering results
-    with open('improved_similarity_analysis_results.json', 'r') as f:
-        clustering_results = json.load(f)
-
-    # Initialize evaluator
-    evaluator = ClusteringEvaluator(original_data, clustering_results)
-    
-    # Generate evaluation report
-    report = evaluator.generate_evaluation_report()
-    
-    # Save results in both JSON and text formats
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     
     # Save JSON report
@@ -222,7 +391,39 @@ def main():
     # Save formatted text report
     text_path = os.path.join(output_dir, f'clustering_evaluation_{timestamp}.txt')
     with open(text_path, 'w', encoding='utf-8') as f:
-        f.write(evaluator.format_report_text(report))
+        f.write(text)
+    
+    return json_path, text_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate the effectiveness of the data type clustering")
+    parser.add_argument('--quality-mode', choices=QUALITY_MODES, default='exact',
+                        help="Score every type pair or estimate the quality metrics from a sample")
+    parser.add_argument('--sample-budget', type=int, default=DEFAULT_SAMPLE_BUDGET,
+                        help="Number of type pairs scored in sampled mode")
+    parser.add_argument('--confidence', type=float, default=0.95,
+                        help="Confidence level of the sampled intervals")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the sampled mode")
+    parser.add_argument('--results', default='improved_similarity_analysis_results.json',
+                        help="Grouping results (.json, or .ndjson read one group at a time)")
+    args = parser.parse_args()
+    
+    output_dir = "evaluation_results"
+
+    # Load original data
+    original_data = FrequencyTable.from_json('data_types_counts.json')
+
+    # Load clustering results (groups of .ndjson results are read lazily)
+    clustering_results = load_results(args.results)
+
+    # Initialize evaluator
+    evaluator = ClusteringEvaluator(original_data, clustering_results)
+    
+    # Generate evaluation report
+    report = evaluator.generate_evaluation_report(args.quality_mode, args.sample_budget, args.confidence, args.seed)
+    
+    # Save results in both JSON and text formats
+    json_path, text_path = save_evaluation_report(report, evaluator.format_report_text(report), output_dir)
     
     print(f"Evaluation results have been saved to:")
     print(f"- JSON format: {json_path}")
@@ -1,25 +1,81 @@
 import json
-import matplotlib.pyplot as plt
-import seaborn as sns
+import argparse
 import numpy as np
-from matplotlib.ticker import PercentFormatter
+from frequency_table import FrequencyTable
+from plotting import HEADLESS_ENV, headless_requested, load_pyplot
 
-# Set style parameters
-plt.style.use('default')  
-sns.set_theme(style="whitegrid")  
-plt.rcParams['pdf.fonttype'] = 42  
-plt.rcParams['font.family'] = 'Arial'
+MILESTONE_PERCENTILES = [25, 50, 75, 80, 90, 95, 99, 100]
+
+def setup_plot_style():
+    """Import the plotting libraries and set the style parameters, only once a plot is drawn"""
+    plt = load_pyplot()
+    import seaborn as sns
+    
+    # Set style parameters
+    plt.style.use('default')  
+    sns.set_theme(style="whitegrid")  
+    plt.rcParams['pdf.fonttype'] = 42  
+    plt.rcParams['font.family'] = 'Arial'
+    return plt, sns
 
 def load_data(filepath):
-    """Load and parse data from JSON file"""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-    frequencies = [item[1] for item in data]
-    type_names = [item[0] for item in data]
-    return frequencies, type_names
+    """Load data from JSON file into a frequency table sorted by decreasing frequency"""
+    return FrequencyTable.from_json(filepath)
+
+def compute_frequency_statistics(table):
+    """Summary, cumulative milestones and ranked type distribution, without touching the filesystem"""
+    frequencies = table.counts
+    total_types = len(table)
+    total_frequency = table.total
+    cumsum_percent = table.cumulative_percent()
+    
+    # Milestone rows are looked up in one searchsorted call; the 80% row is
+    # reported as a 0-based index, the milestones as type counts
+    milestone_rows = table.milestone_rows(MILESTONE_PERCENTILES).tolist()
+    eighty_percent_idx = milestone_rows[MILESTONE_PERCENTILES.index(80)]
+    
+    distribution_data = {
+        "summary": {
+            "total_types": int(total_types),  
+            "total_occurrences": total_frequency,
+            "mean_frequency": float(np.mean(frequencies)),
+            "median_frequency": float(np.median(frequencies)),
+            "std_deviation": float(np.std(frequencies)),
+            "min_frequency": int(frequencies.min()), 
+            "max_frequency": int(frequencies.max()), 
+            "types_for_80_percent": int(eighty_percent_idx)
+        },
+        "cumulative_milestones": [],
+        "type_distribution": []
+    }
+    
+    # Add cumulative milestone data
+    for p, idx in zip(MILESTONE_PERCENTILES, milestone_rows):
+        distribution_data["cumulative_milestones"].append({
+            "percentile": int(p), 
+            "types_count": int(idx + 1), 
+            "types_percentage": float((idx+1)/total_types*100)
+        })
+    
+    # Add type distribution data
+    cumulative = cumsum_percent.tolist()
+    for i, (dtype, freq) in enumerate(table.items(), 1):
+        distribution_data["type_distribution"].append({
+            "rank": i,
+            "type": str(dtype),  
+            "frequency": int(freq), 
+            "percentage": float((freq / total_frequency) * 100),
+            "cumulative_percentage": cumulative[i-1]
+        })
+    
+    return distribution_data
 
-def create_frequency_analysis_plot(frequencies, save_path):
+def create_frequency_analysis_plot(table, save_path):
     """Create comprehensive frequency analysis plot"""
+    plt, sns = setup_plot_style()
+    from matplotlib.ticker import PercentFormatter
+    frequencies = table.counts
+    
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(15, 7))
     
     for ax in [ax1, ax2]:
@@ -35,10 +91,8 @@ def create_frequency_analysis_plot(frequencies, save_path):
     ax1.set_xlabel('Frequency')
     ax1.set_ylabel('Count')
     
-    # Right plot: Cumulative percentage curve
-    sorted_freq = sorted(frequencies, reverse=True)
-    cumsum = np.cumsum(sorted_freq)
-    cumsum_percent = cumsum / cumsum[-1] * 100
+    # Right plot: Cumulative percentage curve (the table is sorted by frequency)
+    cumsum_percent = table.cumulative_percent()
     
     ax2.plot(range(1, len(frequencies) + 1), cumsum_percent, 'b-', linewidth=2)
     ax2.set_title('Cumulative Frequency Distribution')
@@ -48,7 +102,7 @@ def create_frequency_analysis_plot(frequencies, save_path):
     ax2.grid(True, alpha=0.3, color='black', linestyle=':')
     
     # Add 80% reference line
-    eighty_percent_idx = np.where(cumsum_percent >= 80)[0][0]
+    eighty_percent_idx = int(table.milestone_rows([80])[0])
     ax2.axhline(y=80, color='r', linestyle='--', alpha=0.5)
     ax2.axvline(x=eighty_percent_idx, color='r', linestyle='--', alpha=0.5)
     ax2.text(eighty_percent_idx + 5, 82, 
@@ -59,7 +113,6 @@ def create_frequency_analysis_plot(frequencies, save_path):
     milestones = [25, 50, 75, 90, 95]
     colors = ['g', 'y', 'c', 'm', 'k']
     for milestone, color in zip(milestones, colors):
-        idx = np.where(cumsum_percent >= milestone)[0][0]
         ax2.axhline(y=milestone, color=color, linestyle=':', alpha=0.3)
     
     plt.tight_layout()
@@ -68,112 +121,69 @@ def create_frequency_analysis_plot(frequencies, save_path):
     
     return eighty_percent_idx, cumsum_percent
 
-def create_analysis_report(frequencies, type_names, eighty_percent_idx, cumsum_percent, output_file):
-    """Generate detailed analysis report"""
-    total_types = len(frequencies)
-    total_frequency = int(sum(frequencies)) 
+def write_analysis_report(distribution_data, f):
+    """Write the text report of compute_frequency_statistics to an open file"""
+    summary = distribution_data["summary"]
     
-    # Sort data by frequency
-    sorted_data = sorted(zip(type_names, frequencies), key=lambda x: x[1], reverse=True)
+    # Write summary statistics
+    f.write("Data Type Frequency Analysis Report\n")
+    f.write("=================================\n\n")
     
-    # Create distribution data for JSON
-    distribution_data = {
-        "summary": {
-            "total_types": int(total_types),  
-            "total_occurrences": total_frequency,
-            "mean_frequency": float(np.mean(frequencies)),
-            "median_frequency": float(np.median(frequencies)),
-            "std_deviation": float(np.std(frequencies)),
-            "min_frequency": int(float(min(frequencies))), 
-            "max_frequency": int(float(max(frequencies))), 
-            "types_for_80_percent": int(eighty_percent_idx)
-        },
-        "cumulative_milestones": [],
-        "type_distribution": []
-    }
+    f.write("Summary Statistics:\n")
+    f.write("-----------------\n")
+    f.write(f"Total unique data types: {summary['total_types']}\n")
+    f.write(f"Total occurrences: {summary['total_occurrences']}\n")
+    f.write(f"Mean frequency: {summary['mean_frequency']:.2f}\n")
+    f.write(f"Median frequency: {summary['median_frequency']:.2f}\n")
+    f.write(f"Standard deviation: {summary['std_deviation']:.2f}\n")
+    f.write(f"Range: {summary['min_frequency']} to {summary['max_frequency']}\n")
+    f.write(f"Number of types covering 80% of occurrences: {summary['types_for_80_percent']}\n\n")
     
-    # Add cumulative milestone data
-    percentiles = [25, 50, 75, 80, 90, 95, 99, 100]
-    for p in percentiles:
-        idx = np.where(cumsum_percent >= p)[0][0]
-        distribution_data["cumulative_milestones"].append({
-            "percentile": int(p), 
-            "types_count": int(idx + 1), 
-            "types_percentage": float((idx+1)/total_types*100)
-        })
+    # Write distribution information
+    f.write("Cumulative Distribution Milestones:\n")
+    f.write("--------------------------------\n")
+    for milestone in distribution_data["cumulative_milestones"]:
+        f.write(f"{milestone['percentile']}% of occurrences covered by top {milestone['types_count']} types "
+                f"({milestone['types_percentage']:.1f}% of all types)\n")
+    f.write("\n")
     
-    # Add type distribution data
-    for i, (dtype, freq) in enumerate(sorted_data, 1):
-        distribution_data["type_distribution"].append({
-            "rank": i,
-            "type": str(dtype),  
-            "frequency": int(float(freq)), 
-            "percentage": float((freq / total_frequency) * 100),
-            "cumulative_percentage": float(cumsum_percent[i-1])
-        })
+    # Write complete frequency distribution
+    f.write("Complete Data Type Distribution:\n")
+    f.write("-----------------------------\n")
+    f.write("Rank. Data Type: Frequency (Percentage of Total)\n\n")
     
-    # Save distribution data as JSON
-    with open('frequency_distribution.json', 'w', encoding='utf-8') as json_file:
-        json.dump(distribution_data, json_file, indent=4)
+    for entry in distribution_data["type_distribution"]:
+        f.write(f"{entry['rank']}. {entry['type']}: {entry['frequency']} ({entry['percentage']:.2f}%) "
+                f"[Cumulative: {entry['cumulative_percentage']:.2f}%]\n")
 
-    # Write text report as before
+def create_analysis_report(distribution_data, output_file, json_file='frequency_distribution.json'):
+    """Save the distribution data as JSON and the detailed text report"""
+    with open(json_file, 'w', encoding='utf-8') as f:
+        json.dump(distribution_data, f, indent=4)
+    
     with open(output_file, 'w', encoding='utf-8') as f:
-        # Write summary statistics
-        f.write("Data Type Frequency Analysis Report\n")
-        f.write("=================================\n\n")
-        
-        f.write("Summary Statistics:\n")
-        f.write("-----------------\n")
-        f.write(f"Total unique data types: {total_types}\n")
-        f.write(f"Total occurrences: {total_frequency}\n")
-        f.write(f"Mean frequency: {np.mean(frequencies):.2f}\n")
-        f.write(f"Median frequency: {np.median(frequencies):.2f}\n")
-        f.write(f"Standard deviation: {np.std(frequencies):.2f}\n")
-        f.write(f"Range: {min(frequencies)} to {max(frequencies)}\n")
-        f.write(f"Number of types covering 80% of occurrences: {eighty_percent_idx}\n\n")
-        
-        # Write distribution information
-        f.write("Cumulative Distribution Milestones:\n")
-        f.write("--------------------------------\n")
-        percentiles = [25, 50, 75, 80, 90, 95, 99, 100]
-        for p in percentiles:
-            idx = np.where(cumsum_percent >= p)[0][0]
-            f.write(f"{p}% of occurrences covered by top {idx+1} types ({((idx+1)/total_types)*100:.1f}% of all types)\n")
-        f.write("\n")
-        
-        # Write complete frequency distribution
-        f.write("Complete Data Type Distribution:\n")
-        f.write("-----------------------------\n")
-        f.write("Rank. Data Type: Frequency (Percentage of Total)\n\n")
-        
-        for i, (dtype, freq) in enumerate(sorted_data, 1):
-            percentage = (freq / total_frequency) * 100
-            cumulative_percentage = cumsum_percent[i-1]
-            f.write(f"{i}. {dtype}: {freq} ({percentage:.2f}%) [Cumulative: {cumulative_percentage:.2f}%]\n")
+        write_analysis_report(distribution_data, f)
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze the frequency distribution of the data types")
+    parser.add_argument('--headless', action='store_true',
+                        help=f"Skip the PDF plot and the plotting imports (also set by {HEADLESS_ENV}=1)")
+    args = parser.parse_args()
+    
     try:
         # Load data
-        frequencies, type_names = load_data('data_types_counts.json')
+        table = load_data('data_types_counts.json')
         
         # Create visualization
-        eighty_percent_idx, cumsum_percent = create_frequency_analysis_plot(
-            frequencies,
-            'data_type_frequency_analysis.pdf'
-        )
+        if not headless_requested(args.headless):
+            create_frequency_analysis_plot(table, 'data_type_frequency_analysis.pdf')
         
         # Generate report
-        create_analysis_report(
-            frequencies,
-            type_names,
-            eighty_percent_idx,
-            cumsum_percent,
-            'data_frequency_analysis.txt'
-        )
+        create_analysis_report(compute_frequency_statistics(table), 'data_frequency_analysis.txt')
         print("Analysis completed successfully!")
         
     except Exception as e:
         print(f"An error occurred: {str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,99 +1,170 @@
 import json
-from collections import defaultdict
 import re
+import argparse
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Tuple
 
-def analyze_patterns(data_list):
-    """Analyze common patterns in data types"""
-    prefixes = defaultdict(int)
-    suffixes = defaultdict(int)
+DIMENSIONAL_PREFIX_PATTERN = re.compile(r'^(\d+d|multi|high|low|cross|inter|sub|super|meta)')
+
+COMMON_TYPE_SUFFIXES = {'data', 'signal', 'sequence', 'series', 'stream', 
+                        'record', 'file', 'format', 'collection', 'set', 
+                        'array', 'matrix', 'tensor', 'vector', 'map'}
+
+class PatternCounters:
+    """Prefix, suffix, dimensional-prefix and type-suffix frequencies filled in one pass.
     
-    for dtype, count in data_list:
-        # Split the type name into words
-        words = dtype.lower().replace('-', ' ').replace('_', ' ').split()
+    Each type is lowercased once; counters of shards processed separately can
+    be merged, and merging shards in order gives the same result (including the
+    order of ties) as counting their concatenation.
+    """
+    
+    def __init__(self):
+        self.prefixes = defaultdict(int)
+        self.suffixes = defaultdict(int)
+        self.dimensional_prefixes = defaultdict(int)
+        self.type_suffixes = defaultdict(int)
+    
+    def add(self, dtype: str, count: int) -> None:
+        lowered = dtype.lower()
         
+        # Prefixes and suffixes treat '-' and '_' as word separators
+        words = lowered.replace('-', ' ').replace('_', ' ').split()
         if len(words) >= 2:
-            # Record the first word as a prefix
-            prefixes[words[0]] += count
-            # Record the last word as a suffix
-            suffixes[words[-1]] += count
+            self.prefixes[words[0]] += count
+            self.suffixes[words[-1]] += count
+        
+        match = DIMENSIONAL_PREFIX_PATTERN.match(lowered)
+        if match:
+            self.dimensional_prefixes[match.group(1)] += count
+        
+        # Type suffixes only split on whitespace
+        tail = lowered.rsplit(None, 1)
+        if tail and tail[-1] in COMMON_TYPE_SUFFIXES:
+            self.type_suffixes[tail[-1]] += count
     
-    return dict(prefixes), dict(suffixes)
+    def update(self, type_counts: Iterable[Tuple[str, int]]) -> 'PatternCounters':
+        """Count any iterable of (type, count) pairs, e.g. iter_type_counts(path)"""
+        for dtype, count in type_counts:
+            self.add(dtype, count)
+        return self
+    
+    def merge(self, other: 'PatternCounters') -> 'PatternCounters':
+        """Add the counts of another shard to this one"""
+        for mine, theirs in ((self.prefixes, other.prefixes), (self.suffixes, other.suffixes),
+                             (self.dimensional_prefixes, other.dimensional_prefixes),
+                             (self.type_suffixes, other.type_suffixes)):
+            for key, count in theirs.items():
+                mine[key] += count
+        return self
+    
+    def to_statistics(self) -> Dict[str, Dict[str, int]]:
+        """Counters sorted by frequency, as saved to data_pattern_statistics.json"""
+        by_frequency = lambda counter: dict(sorted(counter.items(), key=lambda x: x[1], reverse=True))
+        return {
+            'common_prefixes': by_frequency(self.prefixes),
+            'dimensional_prefixes': by_frequency(self.dimensional_prefixes),
+            'common_suffixes': by_frequency(self.suffixes),
+            'type_suffixes': by_frequency(self.type_suffixes)
+        }
 
-def find_dimensional_prefixes(data_list):
-    """Find dimension-related prefixes"""
-    pattern = r'^(\d+d|multi|high|low|cross|inter|sub|super|meta)'
-    dimensional = defaultdict(int)
+def iter_type_counts(path: str) -> Iterator[Tuple[str, int]]:
+    """Yield (type, count) pairs from a JSON list or, one line at a time, from a JSONL file.
     
-    for dtype, count in data_list:
-        match = re.match(pattern, dtype.lower())
-        if match:
-            dimensional[match.group(1)] += count
+    JSONL lines hold either a [type, count] pair or a {"type": ..., "count": ...} object.
+    """
+    if not path.endswith('.jsonl'):
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from (tuple(item) for item in json.load(f))
+        return
     
-    return dict(dimensional)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, dict):
+                yield item['type'], item['count']
+            else:
+                yield item[0], item[1]
+
+def count_shard(path: str) -> PatternCounters:
+    """Pattern counters of one type counts file"""
+    return PatternCounters().update(iter_type_counts(path))
+
+def count_shards(paths: List[str], workers: int = 1) -> PatternCounters:
+    """Count several files in parallel and merge them in the given order"""
+    counters = PatternCounters()
+    if workers == 1 or len(paths) == 1:
+        for path in paths:
+            counters.merge(count_shard(path))
+        return counters
+    with ProcessPoolExecutor(max_workers=workers or None) as executor:
+        for shard in executor.map(count_shard, paths):
+            counters.merge(shard)
+    return counters
+
+def analyze_patterns(data_list):
+    """Analyze common patterns in data types"""
+    counters = PatternCounters().update(data_list)
+    return dict(counters.prefixes), dict(counters.suffixes)
+
+def find_dimensional_prefixes(data_list):
+    """Find dimension-related prefixes"""
+    return dict(PatternCounters().update(data_list).dimensional_prefixes)
 
 def find_data_type_suffixes(data_list):
     """Find data type-related suffixes"""
-    common_type_suffixes = {'data', 'signal', 'sequence', 'series', 'stream', 
-                           'record', 'file', 'format', 'collection', 'set', 
-                           'array', 'matrix', 'tensor', 'vector', 'map'}
-    type_suffixes = defaultdict(int)
-    
-    for dtype, count in data_list:
-        words = dtype.lower().split()
-        if words[-1] in common_type_suffixes:
-            type_suffixes[words[-1]] += count
-    
-    return dict(type_suffixes)
+    return dict(PatternCounters().update(data_list).type_suffixes)
 
-def main():
-    # Load data
-    with open('data_types_counts.json', 'r', encoding='utf-8') as f:
-        data_list = json.load(f)
-    
-    # Analyze patterns
-    prefixes, suffixes = analyze_patterns(data_list)
-    dimensional_prefixes = find_dimensional_prefixes(data_list)
-    type_suffixes = find_data_type_suffixes(data_list)
-    
-    # Sort by frequency
-    sorted_prefixes = sorted(prefixes.items(), key=lambda x: x[1], reverse=True)
-    sorted_suffixes = sorted(suffixes.items(), key=lambda x: x[1], reverse=True)
-    sorted_dimensional = sorted(dimensional_prefixes.items(), key=lambda x: x[1], reverse=True)
-    sorted_type_suffixes = sorted(type_suffixes.items(), key=lambda x: x[1], reverse=True)
-    
-    # Output results
+def compute_pattern_statistics(data_list):
+    """Prefix and suffix frequencies as saved to data_pattern_statistics.json"""
+    return PatternCounters().update(data_list).to_statistics()
+
+def print_pattern_statistics(results):
+    """Print the frequent prefixes and suffixes"""
     print("Common prefixes (occurrences >= 50):")
     print("-" * 40)
-    for prefix, count in sorted_prefixes:
+    for prefix, count in results['common_prefixes'].items():
         if count >= 50:
             print(f"{prefix}: {count}")
     
     print("\nDimension-related prefixes:")
     print("-" * 40)
-    for prefix, count in sorted_dimensional:
+    for prefix, count in results['dimensional_prefixes'].items():
         print(f"{prefix}: {count}")
     
     print("\nCommon suffixes (occurrences >= 50):")
     print("-" * 40)
-    for suffix, count in sorted_suffixes:
+    for suffix, count in results['common_suffixes'].items():
         if count >= 50:
             print(f"{suffix}: {count}")
     
     print("\nData type-related suffixes:")
     print("-" * 40)
-    for suffix, count in sorted_type_suffixes:
+    for suffix, count in results['type_suffixes'].items():
         print(f"{suffix}: {count}")
+
+def save_pattern_statistics(results, path='data_pattern_statistics.json'):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Count prefix and suffix patterns of the data types")
+    parser.add_argument('inputs', nargs='*', default=['data_types_counts.json'],
+                        help="Type counts as a JSON list or JSONL shards, streamed one line at a time")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Number of processes counting shards in parallel (0 uses all CPU cores)")
+    args = parser.parse_args()
     
-    # Save results
-    results = {
-        'common_prefixes': dict(sorted_prefixes),
-        'dimensional_prefixes': dict(sorted_dimensional),
-        'common_suffixes': dict(sorted_suffixes),
-        'type_suffixes': dict(sorted_type_suffixes)
-    }
+    # Analyze patterns
+    results = count_shards(args.inputs, args.workers).to_statistics()
     
-    with open('data_pattern_statistics.json', 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2)
+    # Output results
+    print_pattern_statistics(results)
+    
+    # Save results
+    save_pattern_statistics(results)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,114 @@
+import json
+from array import array
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+
+class FrequencyTable:
+    """Columnar form of a data_types_counts.json style [type, count] table.
+
+    Type names are kept as one UTF-8 buffer with int64 offsets (a row is
+    decoded only when its name is needed) and counts as an int64 array. Rows
+    are sorted once by decreasing count; ties keep their input order, like
+    sorted(..., key=count, reverse=True) does.
+    """
+
+    def __init__(self, buffer: bytes, offsets: np.ndarray, counts: np.ndarray):
+        order = np.argsort(-counts, kind='stable')
+        self._buffer = buffer
+        self._starts = offsets[:-1][order]
+        self._ends = offsets[1:][order]
+        self.counts = counts[order]
+        self._cumulative_percent: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Sequence]) -> 'FrequencyTable':
+        """Build the table from any iterable of (type, count) pairs"""
+        buffer = bytearray()
+        offsets = array('q', [0])
+        counts = array('q')
+        for dtype, count in pairs:
+            buffer += dtype.encode('utf-8')
+            offsets.append(len(buffer))
+            counts.append(count)
+        return cls(bytes(buffer), np.frombuffer(offsets, dtype=np.int64), np.frombuffer(counts, dtype=np.int64))
+
+    @classmethod
+    def from_json(cls, path: str) -> 'FrequencyTable':
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls.from_pairs(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def name(self, row: int) -> str:
+        return self._buffer[self._starts[row]:self._ends[row]].decode('utf-8')
+
+    def iter_names(self, rows: Optional[Iterable[int]] = None) -> Iterator[str]:
+        """Names of the given rows (all rows by default), in row order"""
+        buffer, starts, ends = self._buffer, self._starts.tolist(), self._ends.tolist()
+        if rows is None:
+            rows = range(len(starts))
+        for row in rows:
+            yield buffer[starts[row]:ends[row]].decode('utf-8')
+
+    def items(self, mask: Optional[np.ndarray] = None) -> Iterator[Tuple[str, int]]:
+        """(type, count) pairs of the rows selected by mask (all rows by default)"""
+        rows = range(len(self)) if mask is None else np.flatnonzero(mask).tolist()
+        counts = self.counts.tolist()
+        for row, dtype in zip(rows, self.iter_names(rows)):
+            yield dtype, counts[row]
+
+    def cumulative_percent(self) -> np.ndarray:
+        """Share of all occurrences covered by the top k + 1 types, in percent"""
+        if self._cumulative_percent is None:
+            cumsum = np.cumsum(self.counts)
+            self._cumulative_percent = cumsum / cumsum[-1] * 100
+        return self._cumulative_percent
+
+    def milestone_rows(self, percentiles: Sequence[float]) -> np.ndarray:
+        """First row whose cumulative percentage reaches each percentile"""
+        return np.searchsorted(self.cumulative_percent(), percentiles, side='left')
+
+    def match_mask(self, names: Set[str]) -> np.ndarray:
+        """Rows whose type is in names"""
+        return np.fromiter((dtype in names for dtype in self.iter_names()), dtype=bool, count=len(self))
+
+    def range_index(self, ranges: Sequence[Tuple[float, float, str]],
+                    mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Index of the (min, max, label) range holding each selected count, or -1.
+
+        The ranges must not overlap; all rows are binned with one searchsorted
+        over the lower bounds.
+        """
+        counts = self.counts if mask is None else self.counts[mask]
+        order = sorted(range(len(ranges)), key=lambda k: ranges[k][0])
+        lows = np.array([ranges[k][0] for k in order], dtype=np.float64)
+        highs = np.array([ranges[k][1] for k in order], dtype=np.float64)
+        if np.any(lows[1:] <= highs[:-1]):
+            raise ValueError("Frequency ranges overlap")
+        slot = np.searchsorted(lows, counts, side='right') - 1
+        inside = (slot >= 0) & (counts <= highs[np.maximum(slot, 0)])
+        return np.where(inside, np.array(order, dtype=np.int64)[np.maximum(slot, 0)], -1)
+
+    def range_labels(self, ranges: Sequence[Tuple[float, float, str]],
+                     mask: Optional[np.ndarray] = None) -> List[Optional[str]]:
+        """Label of the (min, max, label) range holding each selected count, or None"""
+        labels = [label for _, _, label in ranges] + [None]
+        return [labels[k] for k in self.range_index(ranges, mask).tolist()]
+
+    def count_bytes(self, byte_flags: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Number of UTF-8 bytes of each row's name whose value is flagged in a 256-entry table"""
+        flagged = byte_flags[np.frombuffer(self._buffer, dtype=np.uint8)]
+        cumulative = np.zeros(len(flagged) + 1, dtype=np.int64)
+        np.cumsum(flagged, out=cumulative[1:])
+        return cumulative[self._ends[rows]] - cumulative[self._starts[rows]]
+
+    def name_lengths(self, rows: np.ndarray) -> np.ndarray:
+        """UTF-8 byte length of each row's name"""
+        return self._ends[rows] - self._starts[rows]
@@ -0,0 +1,327 @@
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from improved_datatype_similarity_analysis import (
+    SIMILARITY_CONFIG_FILE, ImprovedDatatypeSimilarityAnalyzer, load_similarity_config
+)
+from results_io import iter_result_groups
+
+DEFAULT_INDEX_DIR = 'group_lookup_index'
+DEFAULT_RESULTS_FILE = 'improved_similarity_analysis_results.json'
+
+# Character n-gram length, taken over the normalized name padded with ^ and $
+NGRAM_SIZE = 3
+
+# Share of the score given to the pattern keys when the query has any
+PATTERN_WEIGHT = 0.3
+
+# query_batch scores a chunk of queries against all members as one dense
+# (query, member) matrix of at most this many cells
+DENSE_CELLS = 1 << 22
+
+META_NAME = 'meta.json'
+ARRAY_NAMES = (
+    'ngram_keys', 'ngram_indptr', 'ngram_members',
+    'pattern_keys', 'pattern_indptr', 'pattern_members',
+    'member_ngram_counts', 'member_name_offsets', 'member_names',
+    'group_member_offsets', 'group_frequencies', 'group_name_offsets', 'group_names',
+)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_terms(terms: Sequence[str]) -> np.ndarray:
+    """Stable 64-bit hashes of index terms (unlike hash(), the same in every process)"""
+    digests = b''.join(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest() for term in terms)
+    return np.frombuffer(digests, dtype='<u8').astype(np.uint64)
+
+
+def _encode_names(names: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """UTF-8 buffer and int64 offsets of a list of strings"""
+    encoded = [name.encode('utf-8') for name in names]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def _postings(keys: np.ndarray, members: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Sorted distinct keys with CSR (indptr, members) posting lists"""
+    order = np.lexsort((members, keys))
+    keys, members = keys[order], members[order]
+    distinct, starts = np.unique(keys, return_index=True)
+    indptr = np.append(starts, len(keys)).astype(np.int64)
+    return distinct, indptr, members.astype(np.int32)
+
+
+class GroupLookupIndex:
+    """Fuzzy lookup of the existing group a new type string belongs to.
+
+    Every grouped type of a results file is indexed by the character n-grams
+    of its normalized name and by the prefix/suffix pattern keys of
+    ImprovedDatatypeSimilarityAnalyzer. A query scores the members it shares
+    a term with: the Dice coefficient of the n-gram sets, blended with the
+    share of the query's pattern keys the member has. A group scores as its
+    best member; members are stored group by group, so that is the maximum
+    over one slice. The index is a directory of .npy arrays that are
+    memory-mapped on load, so opening it costs nothing until queries touch
+    the pages.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray], meta: Dict):
+        self.meta = meta
+        for name in ARRAY_NAMES:
+            setattr(self, name, arrays[name])
+        self.analyzer = ImprovedDatatypeSimilarityAnalyzer(config=meta['config'])
+
+    def __len__(self) -> int:
+        return len(self.group_frequencies)
+
+    @property
+    def member_count(self) -> int:
+        return len(self.member_ngram_counts)
+
+    @staticmethod
+    def ngrams(analyzer: ImprovedDatatypeSimilarityAnalyzer, dtype: str) -> List[str]:
+        padded = '^' + analyzer.normalize_type(dtype) + '$'
+        if len(padded) <= NGRAM_SIZE:
+            return [padded]
+        return sorted({padded[k:k + NGRAM_SIZE] for k in range(len(padded) - NGRAM_SIZE + 1)})
+
+    @staticmethod
+    def pattern_terms(analyzer: ImprovedDatatypeSimilarityAnalyzer, dtype: str) -> List[str]:
+        """The leader keys of the pattern rules (see _pattern_keys), spelled out as strings"""
+        f = analyzer.get_features(dtype)
+        terms = []
+        if f.prefix and f.prefix_high_freq:
+            terms.append('prefix\x00' + f.prefix)
+        category = analyzer.get_pattern_categories(f.prefix, True) if f.prefix else None
+        if category:
+            terms.append('prefix_category\x00' + '\x00'.join(category))
+        if f.suffix and f.suffix_high_freq:
+            terms.append('suffix\x00' + f.suffix)
+        category = analyzer.get_pattern_categories(f.suffix, False) if f.suffix else None
+        if category:
+            middle = f.parts[1:-1] if len(f.parts) > 2 else f.parts
+            terms.extend('suffix_category\x00' + '\x00'.join(category) + '\x00' + token for token in set(middle))
+        return sorted(terms)
+
+    @classmethod
+    def build(cls, results_path: str, config: Optional[Dict] = None) -> 'GroupLookupIndex':
+        """Index the groups of a results file (regular or compact)"""
+        if config is None:
+            config = load_similarity_config()
+        analyzer = ImprovedDatatypeSimilarityAnalyzer(config=config)
+
+        group_names, group_frequencies = [], []
+        member_names, member_ngram_counts, group_member_offsets = [], [], [0]
+        ngram_keys, ngram_members, pattern_keys, pattern_members = [], [], [], []
+        for key, group in iter_result_groups(results_path):
+            group_names.append(key)
+            group_frequencies.append(group["total_frequency"])
+            for entry in group["types"]:
+                member = len(member_names)
+                member_names.append(entry["name"])
+                grams = hash_terms(cls.ngrams(analyzer, entry["name"]))
+                member_ngram_counts.append(len(grams))
+                ngram_keys.append(grams)
+                ngram_members.append(np.full(len(grams), member, dtype=np.int32))
+                patterns = hash_terms(cls.pattern_terms(analyzer, entry["name"]))
+                pattern_keys.append(patterns)
+                pattern_members.append(np.full(len(patterns), member, dtype=np.int32))
+            group_member_offsets.append(len(member_names))
+
+        def concatenate(chunks, dtype):
+            return np.concatenate(chunks).astype(dtype) if chunks else np.zeros(0, dtype=dtype)
+
+        arrays = {}
+        arrays['ngram_keys'], arrays['ngram_indptr'], arrays['ngram_members'] = _postings(
+            concatenate(ngram_keys, np.uint64), concatenate(ngram_members, np.int32))
+        arrays['pattern_keys'], arrays['pattern_indptr'], arrays['pattern_members'] = _postings(
+            concatenate(pattern_keys, np.uint64), concatenate(pattern_members, np.int32))
+        arrays['member_ngram_counts'] = np.array(member_ngram_counts, dtype=np.int32)
+        arrays['member_names'], arrays['member_name_offsets'] = _encode_names(member_names)
+        arrays['group_member_offsets'] = np.array(group_member_offsets, dtype=np.int64)
+        arrays['group_frequencies'] = np.array(group_frequencies, dtype=np.int64)
+        arrays['group_names'], arrays['group_name_offsets'] = _encode_names(group_names)
+
+        meta = {
+            'source': os.path.abspath(results_path),
+            'source_sha256': file_digest(results_path),
+            'config': config,
+            'ngram_size': NGRAM_SIZE,
+            'groups': len(group_names),
+            'members': len(member_names),
+            'built': time.time(),
+        }
+        return cls(arrays, meta)
+
+    def save(self, directory: str) -> None:
+        """Write the index, replacing any previous one only once it is complete"""
+        tmp_dir = directory.rstrip(os.sep) + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp_dir, META_NAME), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, indent=2, ensure_ascii=False)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(tmp_dir, directory)
+
+    @classmethod
+    def load(cls, directory: str) -> 'GroupLookupIndex':
+        """Open a saved index with every array memory-mapped"""
+        with open(os.path.join(directory, META_NAME), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('ngram_size') != NGRAM_SIZE:
+            raise ValueError(f"Index {directory} uses {meta.get('ngram_size')}-grams, expected {NGRAM_SIZE}")
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES}
+        return cls(arrays, meta)
+
+    @classmethod
+    def open_or_build(cls, directory: str, results_path: str, config: Optional[Dict] = None) -> 'GroupLookupIndex':
+        """Saved index if it was built from the current results and config, rebuilt otherwise"""
+        if config is None:
+            config = load_similarity_config()
+        try:
+            index = cls.load(directory)
+        except (FileNotFoundError, ValueError):
+            index = None
+        if index is not None and index.meta['config'] == config \
+                and index.meta['source_sha256'] == file_digest(results_path):
+            return index
+
+        cls.build(results_path, config).save(directory)
+        return cls.load(directory)
+
+    @staticmethod
+    def _name(buffer: np.ndarray, offsets: np.ndarray, row: int) -> str:
+        return buffer[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def group_name(self, group: int) -> str:
+        return self._name(self.group_names, self.group_name_offsets, group)
+
+    def member_name(self, member: int) -> str:
+        return self._name(self.member_names, self.member_name_offsets, member)
+
+    def query(self, dtype: str, k: int = 5) -> List[Dict]:
+        """Top-k groups for one type string, best first"""
+        return self.query_batch([dtype], k)[0]
+
+    def query_batch(self, dtypes: Sequence[str], k: int = 5) -> List[List[Dict]]:
+        """Top-k groups for each type string, as [{"group", "score", "member"}, ...] lists"""
+        results = []
+        chunk = max(1, DENSE_CELLS // max(self.member_count, 1))
+        for start in range(0, len(dtypes), chunk):
+            results.extend(self._query_chunk(dtypes[start:start + chunk], k))
+        return results
+
+    def _shared_counts(self, term_lists: List[List[str]], keys: np.ndarray, indptr: np.ndarray,
+                       members: np.ndarray) -> np.ndarray:
+        """Dense (query, member) counts of the terms each query shares with each member"""
+        shape = (len(term_lists), self.member_count)
+        hashes = hash_terms([term for terms in term_lists for term in terms])
+        queries = np.repeat(np.arange(len(term_lists), dtype=np.int64), [len(terms) for terms in term_lists])
+        if not len(keys) or not len(hashes):
+            return np.zeros(shape, dtype=np.int64)
+
+        slots = np.minimum(np.searchsorted(keys, hashes), len(keys) - 1)
+        found = keys[slots] == hashes
+        slots, queries = slots[found], queries[found]
+        starts, sizes = indptr[slots], indptr[slots + 1] - indptr[slots]
+        # Positions of every posting of every found term, without a Python loop
+        positions = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(int(sizes.sum()))
+        cells = np.repeat(queries, sizes) * self.member_count + members[positions]
+        return np.bincount(cells, minlength=shape[0] * shape[1]).reshape(shape)
+
+    def _query_chunk(self, dtypes: Sequence[str], k: int) -> List[List[Dict]]:
+        if not self.member_count:
+            return [[] for _ in dtypes]
+        analyzer = self.analyzer
+        grams = [self.ngrams(analyzer, dtype) for dtype in dtypes]
+        patterns = [self.pattern_terms(analyzer, dtype) for dtype in dtypes]
+
+        shared = self._shared_counts(grams, self.ngram_keys, self.ngram_indptr, self.ngram_members)
+        query_grams = np.array([len(g) for g in grams], dtype=np.float64)
+        scores = 2 * shared / (query_grams[:, None] + self.member_ngram_counts[None, :])
+
+        query_patterns = np.array([len(p) for p in patterns], dtype=np.float64)
+        with_patterns = query_patterns > 0
+        if with_patterns.any():
+            overlap = self._shared_counts(patterns, self.pattern_keys, self.pattern_indptr, self.pattern_members)
+            scores[with_patterns] = ((1 - PATTERN_WEIGHT) * scores[with_patterns] + PATTERN_WEIGHT
+                                     * overlap[with_patterns] / query_patterns[with_patterns, None])
+
+        offsets = self.group_member_offsets
+        group_scores = np.maximum.reduceat(scores, offsets[:-1], axis=1)
+        results = []
+        for q in range(len(dtypes)):
+            row = group_scores[q]
+            candidates = np.flatnonzero(row > 0)
+            if len(candidates) > k:
+                # Keep every group tied with the k-th best, then order them exactly
+                kth = np.partition(row[candidates], len(candidates) - k)[len(candidates) - k]
+                candidates = candidates[row[candidates] >= kth]
+            order = np.lexsort((candidates, -self.group_frequencies[candidates], -row[candidates]))[:k]
+            matches = []
+            for group in candidates[order].tolist():
+                start, end = int(offsets[group]), int(offsets[group + 1])
+                matches.append({
+                    "group": self.group_name(group),
+                    "score": round(float(row[group]), 6),
+                    "member": self.member_name(start + int(np.argmax(scores[q, start:end]))),
+                })
+            results.append(matches)
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the existing group a new data type belongs to")
+    parser.add_argument('--index-dir', default=DEFAULT_INDEX_DIR, help="Directory of the lookup index")
+    parser.add_argument('--results', default=DEFAULT_RESULTS_FILE, help="Grouping results the index is built from")
+    parser.add_argument('--config', default=SIMILARITY_CONFIG_FILE, help="Pattern config of the grouping")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('build', help="Build the index from the grouping results")
+    query_parser = subparsers.add_parser('query', help="Look up type strings (rebuilding a stale index first)")
+    query_parser.add_argument('types', nargs='*', help="Type strings to look up")
+    query_parser.add_argument('--file', help="Read the type strings from a file, one per line ('-' for stdin)")
+    query_parser.add_argument('-k', type=int, default=5, help="Number of candidate groups per type")
+
+    args = parser.parse_args()
+    config = load_similarity_config(args.config)
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        index = GroupLookupIndex.build(args.results, config)
+        index.save(args.index_dir)
+        print(f"Indexed {index.meta['members']} types in {index.meta['groups']} groups "
+              f"in {time.perf_counter() - start:.2f}s")
+    elif args.command == 'query':
+        dtypes = list(args.types)
+        if args.file:
+            f = sys.stdin if args.file == '-' else open(args.file, 'r', encoding='utf-8')
+            with f:
+                dtypes.extend(line.strip() for line in f if line.strip())
+        if not dtypes:
+            parser.error("no type strings given")
+
+        index = GroupLookupIndex.open_or_build(args.index_dir, args.results, config)
+        for dtype, matches in zip(dtypes, index.query_batch(dtypes, args.k)):
+            print(json.dumps({"type": dtype, "matches": matches}, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,86 @@
 import json
+import os
+import time
+import argparse
 from difflib import SequenceMatcher
 from collections import defaultdict
-from typing import Dict, List, Set, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Set, Tuple, Optional, Sequence
+import numpy as np
+from candidate_blocking import StringSimilarityBlocker
+from results_io import COMPACT_SUFFIX, write_results
+from rule_profiler import RuleProfiler
+from similarity_cache import SimilarityCache, SparseSimilarityMatrix
+from similarity_graph import GROUPING_MODES, SimilarityGraph
+from similarity_kernel import BatchStringSimilarity
+
+SIMILARITY_CONFIG_FILE = '5_3_3_pattern_similarity_config.json'
+
+# 'bucketed' answers the prefix and suffix rules from hash buckets, 'pairwise'
+# checks every pair; both give the same groups
+GROUPING_ENGINES = ('bucketed', 'pairwise')
+
+# Rules of should_group_types in evaluation order, as named in the profile
+PATTERN_RULES = ('high_frequency_prefix', 'prefix_category', 'high_frequency_suffix', 'suffix_category_middle')
+SIMILARITY_RULE = 'string_similarity'
+
+# Per-process state of the grouping workers, set up once by _init_grouping_worker
+_worker_analyzer = None
+_worker_types = None
+
+def _init_grouping_worker(analyzer: 'ImprovedDatatypeSimilarityAnalyzer', types: List[str]) -> None:
+    """Store the analyzer and the frequency-ordered types in a worker process"""
+    global _worker_analyzer, _worker_types
+    _worker_analyzer = analyzer
+    _worker_types = types
+
+def _match_rows(leaders: List[int], remaining: np.ndarray) -> Dict[int, List[int]]:
+    """Compute, for each leader position, the remaining positions it would group"""
+    rows = {}
+    for leader in leaders:
+        candidates = remaining[remaining > leader]
+        matches = _worker_analyzer.match_candidates(
+            _worker_types[leader], [_worker_types[j] for j in candidates]
+        )
+        rows[leader] = [int(candidates[k]) for k in matches]
+    return rows
+
+class TypeFeatures:
+    """Grouping features of one data type, derived once per type.
+    
+    Tokens and categories are stored as small integer ids (0 means "none"),
+    so the pair predicate only compares integers and intersects id sets.
+    """
+    __slots__ = ('name', 'normalized', 'parts', 'prefix', 'suffix',
+                 'prefix_id', 'suffix_id', 'prefix_high_freq', 'suffix_high_freq',
+                 'prefix_category_id', 'suffix_category_id', 'middle_ids')
+    
+    def __init__(self, name: str, normalized: str, parts: Tuple[str, ...]):
+        self.name = name
+        self.normalized = normalized
+        self.parts = parts
+        self.prefix = parts[0] if parts else None
+        self.suffix = parts[-1] if parts else None
+
+def load_similarity_config(path: str = SIMILARITY_CONFIG_FILE) -> Dict:
+    """Prefix and suffix patterns produced by categorize_data_patterns.py and curated by hand"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
 
 class ImprovedDatatypeSimilarityAnalyzer:
-    def __init__(self, similarity_threshold: float = 0.85):
-        # Load configuration
-        with open('5_3_3_pattern_similarity_config.json', 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
+    def __init__(self, similarity_threshold: float = 0.85, similarity_method: str = 'ratcliff_obershelp',
+                 similarity_cache: Optional[SimilarityCache] = None, config: Optional[Dict] = None,
+                 profiler: Optional[RuleProfiler] = None):
+        # Load configuration unless it is passed in
+        if config is None:
+            config = load_similarity_config()
+        self.config = config
         
         self.similarity_threshold = similarity_threshold
+        self.similarity_kernel = BatchStringSimilarity(similarity_method)
+        self.similarity_cache = similarity_cache
+        self.similarity_matrix: Optional[SparseSimilarityMatrix] = None
+        self.profiler = profiler
         
         # Build prefix and suffix lookup tables
         self.prefix_category_map = self._build_pattern_category_map(self.config['prefix_patterns'])
@@ -18,6 +89,11 @@ class ImprovedDatatypeSimilarityAnalyzer:
         # High frequency patterns
         self.high_freq_prefixes = self.config['high_frequency_patterns']['prefixes']
         self.high_freq_suffixes = self.config['high_frequency_patterns']['suffixes']
+        
+        # Feature table shared by grouping and statistics, filled lazily per type
+        self._features: Dict[str, TypeFeatures] = {}
+        self._token_ids: Dict[str, int] = {}
+        self._category_ids: Dict[Tuple[str, str], int] = {}
     
     def _build_pattern_category_map(self, patterns: Dict) -> Dict[str, Tuple[str, str]]:
         """Build mapping from patterns to categories"""
@@ -34,7 +110,14 @@ class ImprovedDatatypeSimilarityAnalyzer:
     
     def get_string_similarity(self, a: str, b: str) -> float:
         """Calculate the similarity between two strings"""
-        return SequenceMatcher(None, a, b).ratio()
+        if self.similarity_kernel.method == 'ratcliff_obershelp':
+            self.similarity_kernel.record_calls(1)
+            return SequenceMatcher(None, a, b).ratio()
+        return self.similarity_kernel.ratio(a, b)
+    
+    def get_string_similarities(self, a: str, candidates: Sequence[str]) -> np.ndarray:
+        """Calculate the similarities between one string and a block of strings"""
+        return self.similarity_kernel.one_to_many(a, candidates)
     
     def split_compound_type(self, dtype: str) -> List[str]:
         """Decompose a compound data type name while maintaining order"""
@@ -47,82 +130,435 @@ class ImprovedDatatypeSimilarityAnalyzer:
     
     def should_group_types(self, type1: str, type2: str) -> bool:
         """Determine if two types should be grouped"""
-        parts1 = self.split_compound_type(type1)
-        parts2 = self.split_compound_type(type2)
+        if self.matches_patterns(type1, type2):
+            return True
         
-        # 1. Check prefix patterns
-        prefix1 = parts1[0] if parts1 else None
-        prefix2 = parts2[0] if parts2 else None
+        # 3. As a fallback, check the similarity of the entire string
+        if self.get_string_similarity(type1, type2) > self.similarity_threshold:
+            return True
         
-        if prefix1 and prefix2:
+        return False
+    
+    def get_features(self, dtype: str) -> TypeFeatures:
+        """Get the precomputed grouping features of a type, building them on first use"""
+        features = self._features.get(dtype)
+        if features is None:
+            features = self._build_features(dtype)
+            self._features[dtype] = features
+        return features
+    
+    def build_feature_table(self, types: Sequence[str]) -> List[TypeFeatures]:
+        """Build the feature records for a sequence of types"""
+        return [self.get_features(dtype) for dtype in types]
+    
+    def _build_features(self, dtype: str) -> TypeFeatures:
+        """Tokenize a type once and derive every feature used by the grouping rules"""
+        parts = tuple(self.split_compound_type(dtype))
+        features = TypeFeatures(dtype, self.normalize_type(dtype), parts)
+        
+        features.prefix_id = self._intern(self._token_ids, features.prefix)
+        features.suffix_id = self._intern(self._token_ids, features.suffix)
+        features.prefix_high_freq = features.prefix in self.high_freq_prefixes
+        features.suffix_high_freq = features.suffix in self.high_freq_suffixes
+        features.prefix_category_id = self._intern(self._category_ids, self.get_pattern_categories(features.prefix, True))
+        features.suffix_category_id = self._intern(self._category_ids, self.get_pattern_categories(features.suffix, False))
+        middle = parts[1:-1] if len(parts) > 2 else parts
+        features.middle_ids = frozenset(self._token_ids.setdefault(token, len(self._token_ids) + 1)
+                                        for token in middle)
+        return features
+    
+    @staticmethod
+    def _intern(ids: Dict, value) -> int:
+        """Map a value to a stable positive id, or 0 for empty values"""
+        if not value:
+            return 0
+        return ids.setdefault(value, len(ids) + 1)
+    
+    def matches_patterns(self, type1: str, type2: str) -> bool:
+        """Check the prefix and suffix pattern rules of should_group_types"""
+        return self._features_match_patterns(self.get_features(type1), self.get_features(type2))
+    
+    def _features_match_patterns(self, f1: TypeFeatures, f2: TypeFeatures) -> bool:
+        """Pattern rules evaluated on precomputed features"""
+        # 1. Check prefix patterns
+        if f1.prefix_id and f2.prefix_id:
             # Check high frequency prefixes
-            if prefix1 in self.high_freq_prefixes and prefix2 in self.high_freq_prefixes:
-                if prefix1 == prefix2:
-                    return True
+            if f1.prefix_high_freq and f1.prefix_id == f2.prefix_id:
+                return True
             
             # Check prefix categories
-            prefix1_cat = self.get_pattern_categories(prefix1, True)
-            prefix2_cat = self.get_pattern_categories(prefix2, True)
-            if prefix1_cat and prefix2_cat and prefix1_cat == prefix2_cat:
+            if f1.prefix_category_id and f1.prefix_category_id == f2.prefix_category_id:
                 return True
         
         # 2. Check suffix patterns
-        suffix1 = parts1[-1] if parts1 else None
-        suffix2 = parts2[-1] if parts2 else None
-        
-        if suffix1 and suffix2:
+        if f1.suffix_id and f2.suffix_id:
             # Check high frequency suffixes
-            if suffix1 in self.high_freq_suffixes and suffix2 in self.high_freq_suffixes:
-                if suffix1 == suffix2:
-                    return True
+            if f1.suffix_high_freq and f1.suffix_id == f2.suffix_id:
+                return True
             
-            # Check suffix categories
-            suffix1_cat = self.get_pattern_categories(suffix1, False)
-            suffix2_cat = self.get_pattern_categories(suffix2, False)
-            if suffix1_cat and suffix2_cat and suffix1_cat == suffix2_cat:
-                # If suffix categories are the same, check the similarity of the middle parts
-                middle1 = parts1[1:-1] if len(parts1) > 2 else parts1
-                middle2 = parts2[1:-1] if len(parts2) > 2 else parts2
-                if set(middle1).intersection(set(middle2)):
-                    return True
-        
-        # 3. As a fallback, check the similarity of the entire string
-        if self.get_string_similarity(type1, type2) > self.similarity_threshold:
-            return True
+            # Check suffix categories; if they are the same, check the middle parts
+            if (f1.suffix_category_id and f1.suffix_category_id == f2.suffix_category_id
+                    and not f1.middle_ids.isdisjoint(f2.middle_ids)):
+                return True
         
         return False
     
-    def find_similar_groups(self, data_list: List[List]) -> Dict[str, List[Tuple[str, int]]]:
-        """Find similar data type groups"""
-        similar_groups = defaultdict(list)
-        processed = set()
+    @staticmethod
+    def _pattern_rule(rule: int, f1: TypeFeatures, f2: TypeFeatures) -> bool:
+        """One rule of _features_match_patterns, numbered as in PATTERN_RULES"""
+        if rule < 2:
+            if not (f1.prefix_id and f2.prefix_id):
+                return False
+            if rule == 0:
+                return f1.prefix_high_freq and f1.prefix_id == f2.prefix_id
+            return bool(f1.prefix_category_id) and f1.prefix_category_id == f2.prefix_category_id
+        if not (f1.suffix_id and f2.suffix_id):
+            return False
+        if rule == 2:
+            return f1.suffix_high_freq and f1.suffix_id == f2.suffix_id
+        return (bool(f1.suffix_category_id) and f1.suffix_category_id == f2.suffix_category_id
+                and not f1.middle_ids.isdisjoint(f2.middle_ids))
+    
+    def _match_candidates_profiled(self, type1: str, candidates: Sequence[str]) -> List[int]:
+        """match_candidates evaluating one rule at a time over the block, for the profiler"""
+        f1 = self.get_features(type1)
+        others = [self.get_features(type2) for type2 in candidates]
+        matched = set()
+        rest = list(range(len(candidates)))
+        for rule, name in enumerate(PATTERN_RULES):
+            start = time.perf_counter()
+            hits = [k for k in rest if self._pattern_rule(rule, f1, others[k])]
+            self.profiler.record(name, len(rest), len(hits), time.perf_counter() - start, type1)
+            matched.update(hits)
+            rest = [k for k in rest if k not in matched]
+        
+        start = time.perf_counter()
+        scores = self._cached_similarities(type1, [candidates[k] for k in rest])
+        if scores is None:
+            scores = self.get_string_similarities(type1, [candidates[k] for k in rest])
+        hits = [k for k, score in zip(rest, scores) if score > self.similarity_threshold]
+        seconds = time.perf_counter() - start
+        self.profiler.record(SIMILARITY_RULE, len(rest), len(hits), seconds, type1)
+        if rest:
+            self.profiler.record_leader_batch(seconds, SIMILARITY_RULE, type1, len(rest))
+        matched.update(hits)
+        return sorted(matched)
+    
+    def match_candidates(self, type1: str, candidates: Sequence[str]) -> List[int]:
+        """Positions of the candidate types that should be grouped with type1"""
+        if self.profiler is not None:
+            return self._match_candidates_profiled(type1, candidates)
+        f1 = self.get_features(type1)
+        match = self._features_match_patterns
+        pattern_matches = [match(f1, self.get_features(type2)) for type2 in candidates]
         
+        # The similarity fallback is scored in one batch for all other types
+        to_score = [k for k, matched in enumerate(pattern_matches) if not matched]
+        scores = self._cached_similarities(type1, [candidates[k] for k in to_score])
+        if scores is None:
+            scores = self.get_string_similarities(type1, [candidates[k] for k in to_score])
+        similar = {k for k, score in zip(to_score, scores) if score > self.similarity_threshold}
+        
+        return [k for k, matched in enumerate(pattern_matches) if matched or k in similar]
+    
+    def _cached_similarities(self, type1: str, candidates: Sequence[str]) -> Optional[np.ndarray]:
+        """Fallback scores from the similarity cache, or None when it cannot answer"""
+        matrix = self.similarity_matrix
+        if matrix is None or matrix.floor > self.similarity_threshold:
+            return None
+        
+        position = matrix.position(type1)
+        positions = [matrix.position(type2) for type2 in candidates]
+        # Cached scores are oriented leader first, i.e. from the earlier position
+        if position is None or any(p is None or p <= position for p in positions):
+            return None
+        return matrix.scores_for(position, positions)
+    
+    def find_similar_groups(self, data_list: List[List], workers: int = 1, engine: str = 'bucketed',
+                            mode: str = 'greedy', max_diameter: Optional[int] = None) -> Dict[str, List[Tuple[str, int]]]:
+        """Find similar data type groups
+        
+        `engine` selects bucketed or pairwise pattern checks. With the pairwise
+        engine and workers > 1 (0 for all cores) the comparisons run in a
+        process pool and the greedy assignment is replayed in frequency order,
+        so the result is identical. The bucketed engine is serial and much
+        faster than either, so workers other than 1 raise ValueError with it.
+        Mode 'components' groups the connected components of the matching pairs
+        instead (serially, ignoring workers and engine), optionally bounded by
+        max_diameter hops. Building that graph is much slower than greedy
+        grouping; see build_similarity_graph.
+        """
+        if engine not in GROUPING_ENGINES:
+            raise ValueError(f"Unknown grouping engine: {engine}")
+        if mode not in GROUPING_MODES:
+            raise ValueError(f"Unknown grouping mode: {mode}")
+        if mode == 'greedy' and workers != 1 and engine != 'pairwise':
+            raise ValueError(f"workers={workers} needs engine='pairwise'; the bucketed engine runs serially")
+        calls_before = self.similarity_kernel.call_count
+        similar_groups = self._find_similar_groups(data_list, workers, engine, mode, max_diameter)
+        if self.profiler is not None:
+            self.profiler.finish(self.similarity_kernel.call_count - calls_before)
+        return similar_groups
+    
+    def _find_similar_groups(self, data_list: List[List], workers: int, engine: str, mode: str,
+                             max_diameter: Optional[int]) -> Dict[str, List[Tuple[str, int]]]:
+        """Body of find_similar_groups"""
         # Convert list data to dictionary format
         counts_dict = {item[0]: item[1] for item in data_list}
         
         # Sort data types by frequency
         sorted_types = sorted(counts_dict.items(), key=lambda x: x[1], reverse=True)
         
-        for type1, count1 in sorted_types:
-            if type1 in processed:
+        # Tokenize every type once for the whole run
+        self.build_feature_table([dtype for dtype, _ in sorted_types])
+        
+        if self.similarity_cache is not None:
+            self.similarity_matrix = self.similarity_cache.get_or_compute(
+                [dtype for dtype, _ in sorted_types], self.similarity_threshold,
+                self.similarity_kernel, config=self.config
+            )
+        
+        if mode == 'components':
+            return self._find_similar_groups_components(sorted_types, max_diameter)
+        
+        if workers <= 0:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            return self._find_similar_groups_parallel(sorted_types, workers)
+        if engine == 'bucketed':
+            return self._find_similar_groups_bucketed(sorted_types)
+        
+        similar_groups = defaultdict(list)
+        processed = [False] * len(sorted_types)
+        
+        for i, (type1, count1) in enumerate(sorted_types):
+            if processed[i]:
                 continue
             
             current_group = [(type1, count1)]
-            processed.add(type1)
+            processed[i] = True
             
-            for type2, count2 in sorted_types:
-                if type2 in processed:
-                    continue
-                
-                if self.should_group_types(type1, type2):
-                    current_group.append((type2, count2))
-                    processed.add(type2)
+            # Every type before the leader has already been processed
+            remaining = [j for j in range(i + 1, len(sorted_types)) if not processed[j]]
+            for k in self.match_candidates(type1, [sorted_types[j][0] for j in remaining]):
+                current_group.append(sorted_types[remaining[k]])
+                processed[remaining[k]] = True
             
             if len(current_group) > 1:
                 key = current_group[0][0]
                 similar_groups[key] = current_group
         
         return similar_groups
+    
+    @staticmethod
+    def _pattern_keys(f: TypeFeatures, as_leader: bool) -> List[Tuple[int, ...]]:
+        """Equality keys of the pattern rules: a leader groups a type iff they share a key.
+        
+        A type is listed under all of its keys, but a leader only uses its prefix
+        and suffix keys when that prefix or suffix is a high-frequency pattern.
+        """
+        keys = []
+        if f.prefix_id and (f.prefix_high_freq or not as_leader):
+            keys.append((0, f.prefix_id))
+        if f.prefix_category_id:
+            keys.append((1, f.prefix_category_id))
+        if f.suffix_id and (f.suffix_high_freq or not as_leader):
+            keys.append((2, f.suffix_id))
+        if f.suffix_category_id:
+            keys.extend((3, f.suffix_category_id, token) for token in f.middle_ids)
+        return keys
+    
+    def _find_similar_groups_bucketed(self, sorted_types: List[Tuple[str, int]]) -> Dict[str, List[Tuple[str, int]]]:
+        """Greedy grouping with the pattern rules answered from hash buckets.
+        
+        Every type before a leader is already processed, so a leader takes the
+        unprocessed rest of each bucket it matches and the bucket can be dropped;
+        each bucket entry is visited at most once. Only the similarity fallback
+        is checked pairwise, on the candidates of the string blocking index (or
+        the cached neighbours), so the groups equal those of the pairwise scan.
+        With a profiler, a rule's evaluations are the bucket entries it scanned.
+        """
+        profiler = self.profiler
+        types = [dtype for dtype, _ in sorted_types]
+        features = self.build_feature_table(types)
+        
+        buckets = defaultdict(list)
+        for position, f in enumerate(features):
+            for key in self._pattern_keys(f, as_leader=False):
+                buckets[key].append(position)
+        
+        matrix = self.similarity_matrix
+        if matrix is not None and matrix.floor > self.similarity_threshold:
+            matrix = None
+        string_index = StringSimilarityBlocker(types, self.similarity_threshold) if matrix is None else None
+        
+        similar_groups = defaultdict(list)
+        processed = [False] * len(types)
+        
+        def mark_processed(position: int) -> None:
+            processed[position] = True
+            if string_index is not None:
+                string_index.discard(position)
+        
+        for i in range(len(types)):
+            if processed[i]:
+                continue
+            mark_processed(i)
+            
+            matched = set()
+            for key in self._pattern_keys(features[i], as_leader=True):
+                bucket = buckets.pop(key, None)
+                if not bucket:
+                    continue
+                if profiler is None:
+                    matched.update(j for j in bucket if not processed[j])
+                else:
+                    start, before = time.perf_counter(), len(matched)
+                    matched.update(j for j in bucket if not processed[j])
+                    profiler.record(PATTERN_RULES[key[0]], len(bucket), len(matched) - before,
+                                    time.perf_counter() - start, types[i])
+            
+            # Similarity fallback for the types no pattern rule grouped
+            if profiler is not None:
+                start, before = time.perf_counter(), len(matched)
+            if matrix is not None:
+                neighbours, scores = matrix.row(i)
+                evaluated = len(neighbours)
+                matched.update(
+                    int(j) for j in neighbours[scores > self.similarity_threshold]
+                    if j > i and not processed[j]
+                )
+            else:
+                candidates = np.array(sorted(j for j in string_index.candidates(i) if j not in matched), dtype=np.int64)
+                candidates = string_index.filter_candidates(i, candidates)
+                evaluated = len(candidates)
+                if evaluated:
+                    scores = self.get_string_similarities(types[i], [types[j] for j in candidates])
+                    matched.update(int(j) for j in candidates[scores > self.similarity_threshold])
+            if profiler is not None:
+                seconds = time.perf_counter() - start
+                profiler.record(SIMILARITY_RULE, evaluated, len(matched) - before, seconds, types[i])
+                if evaluated:
+                    profiler.record_leader_batch(seconds, SIMILARITY_RULE, types[i], evaluated)
+            
+            if matched:
+                current_group = [sorted_types[i]]
+                for j in sorted(matched):
+                    current_group.append(sorted_types[j])
+                    mark_processed(j)
+                similar_groups[types[i]] = current_group
+        
+        return similar_groups
+    
+    def build_similarity_graph(self, sorted_types: List[Tuple[str, int]], prune: bool = False) -> SimilarityGraph:
+        """Graph of the type pairs should_group_types accepts, the earlier type as leader.
+        
+        Each leader key of the pattern rules becomes one bucket; the similarity
+        rule adds an edge per pair above the threshold, from the cached scores or
+        the string blocking index. With prune, pairs already connected are not
+        scored, which keeps the components but drops edges.
+        
+        Unlike the greedy scan, grouped types stay candidates, so every later
+        type the blocking index returns for a type is checked against it. On
+        the full vocabulary this is over 10x slower than greedy grouping, and
+        without prune (a diameter bound) slower still.
+        """
+        types = [dtype for dtype, _ in sorted_types]
+        features = self.build_feature_table(types)
+        graph = SimilarityGraph(len(types))
+        
+        # Sharing a key is symmetric once the high-frequency check is on both sides
+        buckets = defaultdict(list)
+        for position, f in enumerate(features):
+            for key in self._pattern_keys(f, as_leader=True):
+                buckets[key].append(position)
+        for members in buckets.values():
+            graph.add_bucket(members)
+        
+        matrix = self.similarity_matrix
+        if matrix is not None and matrix.floor <= self.similarity_threshold:
+            for i in range(len(types)):
+                neighbours, scores = matrix.row(i)
+                for j in neighbours[scores > self.similarity_threshold].tolist():
+                    if j > i:
+                        graph.add_edge(i, j)
+            return graph
+        
+        string_index = StringSimilarityBlocker(types, self.similarity_threshold)
+        for i in range(len(types)):
+            # Only later types are candidates, so every pair is scored leader first
+            string_index.discard(i)
+            candidates = sorted(string_index.candidates(i))
+            if prune:
+                candidates = [j for j in candidates if not graph.connected(i, j)]
+            candidates = string_index.filter_candidates(i, np.array(candidates, dtype=np.int64))
+            if len(candidates):
+                scores = self.get_string_similarities(types[i], [types[j] for j in candidates])
+                for j in candidates[scores > self.similarity_threshold].tolist():
+                    graph.add_edge(i, j)
+        return graph
+    
+    def _find_similar_groups_components(self, sorted_types: List[Tuple[str, int]],
+                                        max_diameter: Optional[int]) -> Dict[str, List[Tuple[str, int]]]:
+        """Groups as connected components of the similarity graph, named after their most frequent type"""
+        graph = self.build_similarity_graph(sorted_types, prune=max_diameter is None)
+        similar_groups = defaultdict(list)
+        for positions in graph.groups(max_diameter):
+            similar_groups[sorted_types[positions[0]][0]] = [sorted_types[j] for j in positions]
+        return similar_groups
+    
+    def _find_similar_groups_parallel(self, sorted_types: List[Tuple[str, int]], workers: int,
+                                      wave_size: Optional[int] = None) -> Dict[str, List[Tuple[str, int]]]:
+        """Process-pool version of find_similar_groups.
+        
+        The next unprocessed types are taken as a wave of potential leaders and
+        their rows (the types each of them would group) are computed in parallel
+        against the types still unprocessed at the start of the wave. The greedy
+        assignment is then replayed in order: leaders absorbed by an earlier
+        leader of the same wave are skipped and already processed types are
+        dropped from each row, which is exactly what the serial scan would do.
+        """
+        similar_groups = defaultdict(list)
+        types = [dtype for dtype, _ in sorted_types]
+        processed = [False] * len(sorted_types)
+        wave_size = wave_size or workers * 4
+        
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_grouping_worker,
+                                 initargs=(self, types)) as pool:
+            position = 0
+            while position < len(sorted_types):
+                wave = []
+                while position < len(sorted_types) and len(wave) < wave_size:
+                    if not processed[position]:
+                        wave.append(position)
+                    position += 1
+                if not wave:
+                    break
+                
+                remaining = np.array(
+                    [j for j in range(wave[0] + 1, len(sorted_types)) if not processed[j]], dtype=np.int64
+                )
+                futures = [pool.submit(_match_rows, wave[w::workers], remaining) for w in range(workers)]
+                rows = {}
+                for future in futures:
+                    rows.update(future.result())
+                
+                for leader in wave:
+                    if processed[leader]:
+                        continue
+                    
+                    current_group = [sorted_types[leader]]
+                    processed[leader] = True
+                    for j in rows[leader]:
+                        if not processed[j]:
+                            current_group.append(sorted_types[j])
+                            processed[j] = True
+                    
+                    if len(current_group) > 1:
+                        key = current_group[0][0]
+                        similar_groups[key] = current_group
+        
+        return similar_groups
 
     def analyze_and_generate_statistics(self, similar_groups: Dict[str, List[Tuple[str, int]]]) -> Dict:
         """Generate statistical analysis results"""
@@ -163,9 +599,9 @@ class ImprovedDatatypeSimilarityAnalyzer:
         # Analyze matching situation for each group
         for key, group in similar_groups.items():
             group_freq = sum(count for _, count in group)
-            parts = self.split_compound_type(key)
-            prefix = parts[0] if parts else None
-            suffix = parts[-1] if parts else None
+            features = self.get_features(key)
+            prefix = features.prefix
+            suffix = features.suffix
             
             # Record matching type
             match_type = self._determine_match_type(key, group)
@@ -217,37 +653,23 @@ class ImprovedDatatypeSimilarityAnalyzer:
         if not second_type:
             return "unknown"
         
-        parts1 = self.split_compound_type(key)
-        parts2 = self.split_compound_type(second_type)
-        
-        prefix1 = parts1[0] if parts1 else None
-        prefix2 = parts2[0] if parts2 else None
+        f1 = self.get_features(key)
+        f2 = self.get_features(second_type)
         
         # Check prefix matches
-        if prefix1 and prefix2:
-            if (prefix1 in self.high_freq_prefixes and 
-                prefix2 in self.high_freq_prefixes and 
-                prefix1 == prefix2):
+        if f1.prefix_id and f2.prefix_id:
+            if f1.prefix_high_freq and f1.prefix_id == f2.prefix_id:
                 return "prefix_exact"
             
-            prefix1_cat = self.get_pattern_categories(prefix1, True)
-            prefix2_cat = self.get_pattern_categories(prefix2, True)
-            if prefix1_cat and prefix2_cat and prefix1_cat == prefix2_cat:
+            if f1.prefix_category_id and f1.prefix_category_id == f2.prefix_category_id:
                 return "prefix_category"
         
         # Check suffix matches
-        suffix1 = parts1[-1] if parts1 else None
-        suffix2 = parts2[-1] if parts2 else None
-        
-        if suffix1 and suffix2:
-            if (suffix1 in self.high_freq_suffixes and 
-                suffix2 in self.high_freq_suffixes and 
-                suffix1 == suffix2):
+        if f1.suffix_id and f2.suffix_id:
+            if f1.suffix_high_freq and f1.suffix_id == f2.suffix_id:
                 return "suffix_exact"
             
-            suffix1_cat = self.get_pattern_categories(suffix1, False)
-            suffix2_cat = self.get_pattern_categories(suffix2, False)
-            if suffix1_cat and suffix2_cat and suffix1_cat == suffix2_cat:
+            if f1.suffix_category_id and f1.suffix_category_id == f2.suffix_category_id:
                 return "suffix_category"
         
         # If none of the above matches, it's similarity match
@@ -285,26 +707,8 @@ class ImprovedDatatypeSimilarityAnalyzer:
             cat_stats["matched_patterns"] = sorted(cat_stats["matched_patterns"])
             cat_stats["unmatched_patterns"] = sorted(cat_stats["unmatched_patterns"])
 
-def main():
-    # Load data
-    with open('data_types_counts.json', 'r', encoding='utf-8') as f:
-        data_list = json.load(f)
-    
-    # Create analyzer instance
-    analyzer = ImprovedDatatypeSimilarityAnalyzer()
-    
-    # Analyze data
-    similar_groups = analyzer.find_similar_groups(data_list)
-    
-    # Generate statistics
-    statistics = analyzer.analyze_and_generate_statistics(similar_groups)
-    
-    # Organize results
-    analysis_results = {
-        "statistics": statistics,
-        "groups": {}
-    }
-    
+def iter_group_entries(similar_groups: Dict[str, List[Tuple[str, int]]]) -> Iterator[Tuple[str, Dict]]:
+    """Yield the groups in results order (by total frequency) in their JSON layout"""
     # Sort groups by total frequency
     sorted_groups = []
     for key, group in similar_groups.items():
@@ -315,18 +719,32 @@ def main():
     
     # Restructure group data
     for key, group, _ in sorted_groups:
-        analysis_results["groups"][key] = {
+        yield key, {
             "total_frequency": sum(count for _, count in group),
             "types": [
                 {"name": dtype, "frequency": count}
                 for dtype, count in sorted(group, key=lambda x: x[1], reverse=True)
             ]
         }
-    
-    # Save JSON results
-    with open('improved_similarity_analysis_results.json', 'w', encoding='utf-8') as f:
-        json.dump(analysis_results, f, indent=2, ensure_ascii=False)
-    
+
+def build_analysis_results(similar_groups: Dict[str, List[Tuple[str, int]]], statistics: Dict) -> Dict:
+    """Arrange groups and statistics as stored in improved_similarity_analysis_results.json"""
+    return {
+        "statistics": statistics,
+        "groups": dict(iter_group_entries(similar_groups))
+    }
+
+def run_improved_grouping(data_list: List[List], config: Optional[Dict] = None, workers: int = 1,
+                          similarity_cache: Optional[SimilarityCache] = None, mode: str = 'greedy',
+                          max_diameter: Optional[int] = None, engine: str = 'bucketed') -> Dict:
+    """Group the types and return the results in the layout of improved_similarity_analysis_results.json"""
+    analyzer = ImprovedDatatypeSimilarityAnalyzer(similarity_cache=similarity_cache, config=config)
+    similar_groups = analyzer.find_similar_groups(data_list, workers=workers, engine=engine, mode=mode,
+                                                  max_diameter=max_diameter)
+    return build_analysis_results(similar_groups, analyzer.analyze_and_generate_statistics(similar_groups))
+
+def generate_report(statistics: Dict) -> List[str]:
+    """Lines of improved_similarity_analysis_report.txt"""
     report = ["Data Type Similarity Analysis Report", "=" * 50, "\n"]
     
     # Add overall statistics
@@ -429,9 +847,66 @@ def main():
     for suffix, freq in sorted(suffix_matches.items(), key=lambda x: x[1], reverse=True)[:10]:
         report.append(f"  {suffix}: {freq}")
     
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Group similar data types by prefix, suffix and string similarity")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes of the pairwise engine (0 uses all CPU cores); needs --engine pairwise, "
+                             "and the serial bucketed engine is still much faster")
+    parser.add_argument('--engine', choices=GROUPING_ENGINES, default='bucketed',
+                        help="Answer the prefix and suffix rules from hash buckets or check every pair")
+    parser.add_argument('--grouping', choices=GROUPING_MODES, default='greedy',
+                        help="Greedy leader grouping, or connected components of the matching pairs; "
+                             "components checks every candidate pair instead of only ungrouped types and "
+                             "runs over 10x slower than greedy")
+    parser.add_argument('--max-diameter', type=int, default=None,
+                        help="With --grouping components, keep group members within this many hops (at least 2); "
+                             "connected pairs are then scored too, which is slower still")
+    parser.add_argument('--cache', action='store_true',
+                        help="Read and write the on-disk similarity cache; the first run builds the whole "
+                             "pairwise matrix and is several times slower, later runs on the same vocabulary are faster")
+    parser.add_argument('--compact', action='store_true',
+                        help="Write the results as newline-delimited JSON (improved_similarity_analysis_results.ndjson)")
+    parser.add_argument('--profile', action='store_true',
+                        help="Write per-rule counters and timings to improved_similarity_analysis_profile.json")
+    args = parser.parse_args()
+    if args.profile and args.workers != 1:
+        parser.error("--profile collects rule counters in this process only; use it with --workers 1")
+    if args.max_diameter is not None and (args.grouping != 'components' or args.max_diameter < 2):
+        parser.error("--max-diameter needs --grouping components and a value of at least 2")
+    if args.workers != 1 and args.grouping == 'greedy' and args.engine != 'pairwise':
+        parser.error("--workers other than 1 needs --engine pairwise; the bucketed engine runs serially")
+    
+    # Load data
+    with open('data_types_counts.json', 'r', encoding='utf-8') as f:
+        data_list = json.load(f)
+    
+    # Create analyzer instance
+    profiler = RuleProfiler() if args.profile else None
+    analyzer = ImprovedDatatypeSimilarityAnalyzer(similarity_cache=SimilarityCache() if args.cache else None,
+                                                  profiler=profiler)
+    
+    # Analyze data
+    similar_groups = analyzer.find_similar_groups(data_list, workers=args.workers, engine=args.engine,
+                                                  mode=args.grouping, max_diameter=args.max_diameter)
+    
+    # Generate statistics
+    statistics = analyzer.analyze_and_generate_statistics(similar_groups)
+    
+    # Save JSON results, one group at a time
+    results_path = 'improved_similarity_analysis_results' + (COMPACT_SUFFIX if args.compact else '.json')
+    write_results(results_path, statistics, iter_group_entries(similar_groups))
+    
+    report = generate_report(statistics)
+    
     # Save report
     with open('improved_similarity_analysis_report.txt', 'w', encoding='utf-8') as f:
         f.write('\n'.join(report))
+    
+    # Save profile
+    if profiler is not None:
+        profiler.save('improved_similarity_analysis_profile.json')
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,349 @@
+import json
+import argparse
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from candidate_blocking import StringSimilarityBlocker
+from improved_datatype_similarity_analysis import (
+    ImprovedDatatypeSimilarityAnalyzer, build_analysis_results, iter_group_entries
+)
+from results_io import load_results, write_results
+
+
+class IncrementalGroupIndex:
+    """Greedy grouping state of ImprovedDatatypeSimilarityAnalyzer that absorbs count deltas.
+
+    find_similar_groups scans types by decreasing frequency and lets every
+    type that is not yet grouped lead a group of all later ungrouped types it
+    matches. For a delta only the changed types are re-placed: each one joins
+    the first earlier leader that matches it, or otherwise leads its own group,
+    in which case every later match must already be its member. When that does
+    not hold (a leader would be absorbed, or would take types from another
+    group), the grouping of unchanged types is affected and the delta is
+    reported as a leader reorder instead of being applied.
+
+    Counts only grow. A decrement could move a leader behind unchanged
+    leaders that were never checked against its members, so it is rejected:
+
+    >>> config = {'prefix_patterns': {}, 'suffix_patterns': {},
+    ...           'high_frequency_patterns': {'prefixes': [], 'suffixes': []}}
+    >>> index = IncrementalGroupIndex(
+    ...     ImprovedDatatypeSimilarityAnalyzer(config=config),
+    ...     {'abcdefghijklmnop': 10, 'ZWcdefghijklmnXY': 5, 'abcdefghijklmnXY': 1},
+    ...     {'abcdefghijklmnop': ['abcdefghijklmnop', 'abcdefghijklmnXY']})
+    >>> index.apply_delta([['abcdefghijklmnop', -7]])
+    Traceback (most recent call last):
+    ...
+    ValueError: Count increments must be positive, got -7 for 'abcdefghijklmnop'
+    """
+
+    def __init__(self, analyzer: ImprovedDatatypeSimilarityAnalyzer, counts: Dict[str, int],
+                 groups: Dict[str, List[str]]):
+        self.analyzer = analyzer
+        self.counts = dict(counts)
+        self.leader_of: Dict[str, str] = {}
+        self.members: Dict[str, List[str]] = {}
+        for key, group in groups.items():
+            self.members[key] = [dtype for dtype in group if dtype != key]
+            for dtype in self.members[key]:
+                self.leader_of[dtype] = key
+
+        # Scan order kept sorted by (-count, first appearance), which is the
+        # order of the stable sort in find_similar_groups, with the keys alongside for bisect
+        self._sequence = {dtype: k for k, dtype in enumerate(self.counts)}
+        self._order = [dtype for dtype, _ in sorted(self.counts.items(), key=lambda x: x[1], reverse=True)]
+        self._keys = [self._key(dtype) for dtype in self._order]
+        self._matcher = None
+
+    @classmethod
+    def from_results(cls, analyzer: ImprovedDatatypeSimilarityAnalyzer, data_list: List[List],
+                     results: Dict) -> 'IncrementalGroupIndex':
+        """Rebuild the state from data_types_counts.json and the saved analysis results"""
+        counts = {item[0]: item[1] for item in data_list}
+        groups = {}
+        for key, group in results["groups"].items():
+            names = [entry["name"] for entry in group["types"]]
+            missing = [name for name in names if name not in counts]
+            if missing:
+                raise ValueError(f"Grouped types missing from the counts: {missing[:5]}")
+            groups[key] = names
+        return cls(analyzer, counts, groups)
+
+    def _key(self, dtype: str) -> Tuple[int, int]:
+        return -self.counts[dtype], self._sequence[dtype]
+
+    def _rank(self, dtype: str) -> int:
+        """Position of a type in the scan order"""
+        return bisect_left(self._keys, self._key(dtype))
+
+    def _set_count(self, dtype: str, count: Optional[int]) -> None:
+        """Set the count of a type, or remove a type with None, keeping the scan order sorted"""
+        if dtype in self.counts:
+            k = self._rank(dtype)
+            del self._keys[k]
+            del self._order[k]
+        if count is None:
+            del self.counts[dtype]
+            del self._sequence[dtype]
+            return
+        self._sequence.setdefault(dtype, len(self._sequence))
+        self.counts[dtype] = count
+        key = self._key(dtype)
+        k = bisect_left(self._keys, key)
+        self._keys.insert(k, key)
+        self._order.insert(k, dtype)
+
+    @property
+    def matcher(self) -> '_PairMatcher':
+        """Pair matcher over every type seen so far, built on first use and extended in place"""
+        if self._matcher is None:
+            self._matcher = _PairMatcher(self.analyzer, list(self.counts))
+        return self._matcher
+
+    def sorted_types(self) -> List[Tuple[str, int]]:
+        """Types in the order of the greedy scan"""
+        return [(dtype, self.counts[dtype]) for dtype in self._order]
+
+    def data_list(self) -> List[List]:
+        """Counts in the format of data_types_counts.json"""
+        return [[dtype, count] for dtype, count in self.counts.items()]
+
+    def similar_groups(self) -> Dict[str, List[Tuple[str, int]]]:
+        """Groups as returned by find_similar_groups, leaders and members in scan order"""
+        rank = {dtype: i for i, dtype in enumerate(self._order)}
+        similar_groups = {}
+        for key in sorted(self.members, key=rank.__getitem__):
+            members = sorted(self.members[key], key=rank.__getitem__)
+            if members:
+                similar_groups[key] = [(key, self.counts[key])] + [(dtype, self.counts[dtype]) for dtype in members]
+        return similar_groups
+
+    def apply_delta(self, delta: Sequence[Sequence]) -> Dict:
+        """Add positive `[type, count]` increments and regroup the changed types.
+
+        Returns a report of the changes; when `needs_full_recompute` is set the
+        state is left untouched and find_similar_groups has to be rerun. The
+        scan order and the pair matcher are updated in place, and only the
+        groups the changed types leave or join are copied. Raises ValueError,
+        before changing anything, for an increment or a resulting count that
+        is not positive.
+        """
+        changed = {}
+        for dtype, count in delta:
+            if count <= 0:
+                raise ValueError(f"Count increments must be positive, got {count} for '{dtype}'")
+            changed[dtype] = changed.get(dtype, self.counts.get(dtype, 0)) + count
+        not_positive = [dtype for dtype, count in changed.items() if count <= 0]
+        if not_positive:
+            raise ValueError(f"Counts must stay positive: {not_positive[:5]}")
+        previous = {dtype: self.counts.get(dtype) for dtype in changed}
+        report = {
+            "added_types": [dtype for dtype in changed if previous[dtype] is None],
+            "updated_types": [dtype for dtype in changed if previous[dtype] is not None],
+            "regrouped": {},
+            "leader_reorders": [],
+            "needs_full_recompute": False
+        }
+        for dtype, count in changed.items():
+            self._set_count(dtype, count)
+        matcher = self.matcher
+        matcher.add(report["added_types"])
+        order = self._order
+        pending = set(changed)
+
+        # Changes to leader_of, and copies of the groups that change, applied on success
+        leader_changes: Dict[str, Optional[str]] = {}
+        group_changes: Dict[str, List[str]] = {}
+
+        def leader_of(dtype: str) -> Optional[str]:
+            return leader_changes[dtype] if dtype in leader_changes else self.leader_of.get(dtype)
+
+        def members(key: str) -> List[str]:
+            if key in group_changes:
+                return group_changes[key]
+            return self.members.get(key, [])
+
+        def members_to_change(key: str) -> List[str]:
+            if key not in group_changes:
+                group_changes[key] = list(self.members.get(key, []))
+            return group_changes[key]
+
+        def detach(dtype: str) -> None:
+            old_leader = leader_of(dtype)
+            if old_leader is not None:
+                members_to_change(old_leader).remove(dtype)
+                leader_changes[dtype] = None
+
+        for dtype in sorted(changed, key=self._rank):
+            pending.discard(dtype)
+            position = self._rank(dtype)
+            old_leader = leader_of(dtype)
+
+            # 1. The first earlier leader that matches takes the type
+            leaders = [u for u in order[:position] if leader_of(u) is None and u not in pending]
+            first = matcher.first_match(leaders, dtype)
+            owner = leaders[first] if first is not None else None
+
+            if owner is not None:
+                if members(dtype):
+                    report["leader_reorders"].append(
+                        f"leader '{dtype}' would be absorbed by the group of '{owner}'"
+                    )
+                    continue
+                if owner != old_leader:
+                    detach(dtype)
+                    leader_changes[dtype] = owner
+                    members_to_change(owner).append(dtype)
+                    report["regrouped"][dtype] = owner
+                continue
+
+            # 2. Otherwise the type leads: all later ungrouped matches must be its members
+            if old_leader is not None:
+                detach(dtype)
+                report["regrouped"][dtype] = dtype
+            for member in members(dtype):
+                if self._rank(member) < position:
+                    report["leader_reorders"].append(f"member '{member}' now precedes its leader '{dtype}'")
+
+            later = []
+            for u in order[position + 1:]:
+                if u not in pending:
+                    holder = leader_of(u)
+                    if holder is None or self._rank(holder) >= position:
+                        later.append(u)
+            for k in matcher.matches_of(dtype, later):
+                u = later[k]
+                holder = leader_of(u)
+                if holder != dtype:
+                    holder = u if holder is None else holder
+                    report["leader_reorders"].append(
+                        f"'{dtype}' would take '{u}' from the group of '{holder}'"
+                    )
+
+        if report["leader_reorders"]:
+            report["needs_full_recompute"] = True
+            for dtype, count in previous.items():
+                self._set_count(dtype, count)
+            return report
+
+        for dtype, leader in leader_changes.items():
+            if leader is None:
+                self.leader_of.pop(dtype, None)
+            else:
+                self.leader_of[dtype] = leader
+        for key, group in group_changes.items():
+            if group:
+                self.members[key] = group
+            else:
+                self.members.pop(key, None)
+        return report
+
+    def analysis_results(self) -> Dict:
+        """Current groups and statistics in the format of the results file"""
+        similar_groups = self.similar_groups()
+        statistics = self.analyzer.analyze_and_generate_statistics(similar_groups)
+        return build_analysis_results(similar_groups, statistics)
+
+
+class _PairMatcher:
+    """Batched should_group_types over a growing vocabulary (first argument leads)"""
+
+    def __init__(self, analyzer: ImprovedDatatypeSimilarityAnalyzer, vocabulary: List[str]):
+        self.analyzer = analyzer
+        self.vocabulary = vocabulary
+        self.position = {dtype: i for i, dtype in enumerate(vocabulary)}
+        self.string_index = StringSimilarityBlocker(vocabulary, analyzer.similarity_threshold)
+
+    def add(self, types: Sequence[str]) -> None:
+        """Append the types not in the vocabulary yet"""
+        new = [dtype for dtype in dict.fromkeys(types) if dtype not in self.position]
+        for dtype in new:
+            self.position[dtype] = len(self.vocabulary)
+            self.vocabulary.append(dtype)
+        if new:
+            self.string_index.add(new)
+
+    def _grouped(self, leaders: Sequence[str], others: Sequence[str]) -> np.ndarray:
+        """should_group_types(leaders[k], others[k]) for every k"""
+        result = np.array([self.analyzer.matches_patterns(a, b) for a, b in zip(leaders, others)], dtype=bool)
+        rest = np.flatnonzero(~result)
+        if not len(rest):
+            return result
+
+        # The fallback ratio is only computed where the exact bounds allow it
+        a_index = np.array([self.position[leaders[k]] for k in rest], dtype=np.int64)
+        b_index = np.array([self.position[others[k]] for k in rest], dtype=np.int64)
+        possible = np.zeros(len(rest), dtype=bool)
+        for a in np.unique(a_index):
+            rows = np.flatnonzero(a_index == a)
+            kept = self.string_index.filter_candidates(int(a), b_index[rows])
+            possible[rows[np.isin(b_index[rows], kept)]] = True
+        rest, a_index, b_index = rest[possible], a_index[possible], b_index[possible]
+        if len(rest):
+            scores = self.analyzer.similarity_kernel.indexed_pairs(self.vocabulary, a_index, b_index)
+            result[rest] = scores > self.analyzer.similarity_threshold
+        return result
+
+    def first_match(self, leaders: Sequence[str], dtype: str):
+        """Index of the first leader that would group dtype, or None"""
+        matched = np.flatnonzero(self._grouped(leaders, [dtype] * len(leaders)))
+        return int(matched[0]) if len(matched) else None
+
+    def matches_of(self, leader: str, candidates: Sequence[str]) -> List[int]:
+        """Indices of the candidates that leader would group"""
+        return np.flatnonzero(self._grouped([leader] * len(candidates), candidates)).tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Update the improved grouping results with new type counts")
+    parser.add_argument('delta', help="JSON file with a list of [type, count] increments, each positive")
+    parser.add_argument('--counts', default='data_types_counts.json', help="Type counts of the current results")
+    parser.add_argument('--results', default='improved_similarity_analysis_results.json',
+                        help="Results file of improved_datatype_similarity_analysis.py (.json or .ndjson)")
+    parser.add_argument('--recompute-on-reorder', action='store_true',
+                        help="Rerun the full grouping when the delta reorders group leaders")
+    args = parser.parse_args()
+
+    with open(args.counts, 'r', encoding='utf-8') as f:
+        data_list = json.load(f)
+    results = load_results(args.results)
+    with open(args.delta, 'r', encoding='utf-8') as f:
+        delta = json.load(f)
+
+    analyzer = ImprovedDatatypeSimilarityAnalyzer()
+    index = IncrementalGroupIndex.from_results(analyzer, data_list, results)
+    try:
+        report = index.apply_delta(delta)
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"Added types: {len(report['added_types'])}, updated types: {len(report['updated_types'])}, "
+          f"regrouped: {len(report['regrouped'])}")
+    if report["needs_full_recompute"]:
+        print("Leader reorders:")
+        for reason in report["leader_reorders"]:
+            print(f"  - {reason}")
+        if not args.recompute_on_reorder:
+            print("Results left unchanged; rerun with --recompute-on-reorder or the full analysis")
+            return
+
+        # Apply the counts and regroup the whole vocabulary
+        counts = dict(index.counts)
+        for dtype, count in delta:
+            counts[dtype] = counts.get(dtype, 0) + count
+        data_list = [[dtype, count] for dtype, count in counts.items()]
+        index = IncrementalGroupIndex(analyzer, counts, {
+            key: [dtype for dtype, _ in group]
+            for key, group in analyzer.find_similar_groups(data_list).items()
+        })
+
+    with open(args.counts, 'w', encoding='utf-8') as f:
+        json.dump(index.data_list(), f, indent=2, ensure_ascii=False)
+    similar_groups = index.similar_groups()
+    statistics = analyzer.analyze_and_generate_statistics(similar_groups)
+    write_results(args.results, statistics, iter_group_entries(similar_groups))
+
+if __name__ == "__main__":
+    main()
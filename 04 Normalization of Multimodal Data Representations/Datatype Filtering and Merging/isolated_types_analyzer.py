@@ -1,132 +1,198 @@
-import json
-from typing import List, Dict, Set
-from collections import defaultdict
+import os
+import argparse
+from typing import Dict, Iterator, List, Set, TextIO, Tuple
+import numpy as np
+from frequency_table import FrequencyTable
+from results_io import JsonObjectWriter, TextReportWriter, iter_result_type_names
 
-def extract_isolated_types(data_list: List[List], matched_types: Set[str]) -> Dict[str, int]:
-    """Extract unmatched data types and their frequencies"""
-    return {
-        item[0]: item[1]
-        for item in data_list 
-        if item[0] not in matched_types
-    }
+# Frequency ranges of the analysis; they must not overlap
+FREQUENCY_RANGES = [
+    (500, float('inf'), '500+'),
+    (100, 499, '100-499'),
+    (50, 99, '50-99'),
+    (10, 49, '10-49'),
+    (1, 9, '1-9')
+]
 
-def analyze_isolated_types(isolated_types: Dict[str, int]) -> Dict:
-    """Analyze isolated data types"""
-    # Define frequency ranges
-    frequency_ranges = [
-        (500, float('inf'), '500+'),
-        (100, 499, '100-499'),
-        (50, 99, '50-99'),
-        (10, 49, '10-49'),
-        (1, 9, '1-9')
-    ]
+# Categories in report order: names containing a separator, other names that
+# are not alphanumeric, and plain alphanumeric names
+CATEGORIES = ('special_pattern', 'potential_errors', 'simple_types')
+
+# Byte tables of the character checks. UTF-8 continuation bytes are >= 0x80,
+# so ASCII bytes in the buffer are always whole characters
+SEPARATOR_BYTES = np.zeros(256, dtype=bool)
+SEPARATOR_BYTES[list(b'_- ')] = True
+NON_ASCII_BYTES = np.zeros(256, dtype=bool)
+NON_ASCII_BYTES[0x80:] = True
+ASCII_NON_ALNUM_BYTES = ~NON_ASCII_BYTES
+ASCII_NON_ALNUM_BYTES[list(b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')] = False
+
+def extract_isolated_types(table: FrequencyTable, matched_types: Set[str]) -> np.ndarray:
+    """Mask of the rows of unmatched data types"""
+    return ~table.match_mask(matched_types)
+
+class IsolatedTypes:
+    """Frequency range and category of every isolated row, computed column-wise.
     
-    analysis = {
-        "statistics": {
-            "total_isolated": len(isolated_types),
-            "total_frequency": sum(isolated_types.values()),
-            "frequency_distribution": defaultdict(list)
-        },
-        "categories": {
-            "special_pattern": defaultdict(dict),  # Category by frequency range special pattern
-            "potential_errors": defaultdict(dict),  # Category by frequency range potential errors
-            "simple_types": defaultdict(dict),     # Category by frequency range simple types
-        }
-    }
+    Ranges are binned with one searchsorted and the categories come from byte
+    counts over the name buffer; only names with non-ASCII characters are
+    decoded for the alphanumeric check. Rows keep the table order (decreasing
+    count), so every bucket is already sorted and the outputs are streamed
+    from the row arrays.
+
+    The frequency_distribution lists and the order of the ranges in
+    isolated_types_analysis.json therefore follow decreasing count, not the
+    input order as the former per-type loop did. For input not already sorted
+    by count this changes the order of the output, not its contents.
+    """
     
-    # Analyze each type
-    for dtype, freq in isolated_types.items():
-        # Determine frequency range
-        for min_freq, max_freq, range_label in frequency_ranges:
-            if min_freq <= freq <= max_freq:
-                # Category processing
-                if any(char in dtype for char in ['_', '-', ' ']):
-                    analysis["categories"]["special_pattern"][range_label][dtype] = freq
-                elif not dtype.isalnum():
-                    analysis["categories"]["potential_errors"][range_label][dtype] = freq
-                else:
-                    analysis["categories"]["simple_types"][range_label][dtype] = freq
-                
-                analysis["statistics"]["frequency_distribution"][range_label].append(dtype)
-                break
+    def __init__(self, table: FrequencyTable, isolated: np.ndarray):
+        self.table = table
+        self.isolated = isolated
+        self.total_isolated = int(isolated.sum())
+        self.total_frequency = int(table.counts[isolated].sum())
+        
+        rows = np.flatnonzero(isolated)
+        ranges = table.range_index(FREQUENCY_RANGES, isolated)
+        binned = ranges >= 0
+        self.rows, self.ranges = rows[binned], ranges[binned]
+        
+        special = table.count_bytes(SEPARATOR_BYTES, self.rows) > 0
+        alnum = (table.count_bytes(ASCII_NON_ALNUM_BYTES, self.rows) == 0) & (table.name_lengths(self.rows) > 0)
+        unicode_rows = np.flatnonzero(~special & (table.count_bytes(NON_ASCII_BYTES, self.rows) > 0))
+        alnum[unicode_rows] = [dtype.isalnum() for dtype in table.iter_names(self.rows[unicode_rows].tolist())]
+        self.categories = np.where(special, 0, np.where(alnum, 2, 1))
     
-    # Count types in each frequency range
-    analysis["statistics"]["frequency_counts"] = {
-        range_label: len(types)
-        for range_label, types in analysis["statistics"]["frequency_distribution"].items()
-    }
+    def range_order(self, selection: np.ndarray) -> List[int]:
+        """Ranges present among the selected rows, in order of first appearance"""
+        present, first = np.unique(self.ranges[selection], return_index=True)
+        return present[np.argsort(first)].tolist()
     
-    return analysis
-
-def generate_report(analysis: Dict) -> List[str]:
-    """Generate analysis report"""
-    report = ["Isolated Data Types Analysis Report", "=" * 50, "\n"]
+    def iter_bucket(self, selection: np.ndarray) -> Iterator[Tuple[str, int]]:
+        """(type, count) of the selected rows, by decreasing count"""
+        rows = self.rows[selection]
+        yield from zip(self.table.iter_names(rows.tolist()), self.table.counts[rows].tolist())
     
-    # Overall statistics
-    stats = analysis["statistics"]
-    report.extend([
-        "Overall Statistics:",
-        f"- Total isolated types: {stats['total_isolated']}",
-        f"- Total frequency: {stats['total_frequency']}",
-        "\nFrequency Distribution:",
-    ])
+    def frequency_counts(self) -> List[Tuple[str, int]]:
+        """(range label, number of types) in order of first appearance"""
+        everything = np.ones(len(self.rows), dtype=bool)
+        return [(FREQUENCY_RANGES[k][2], int(np.count_nonzero(self.ranges == k)))
+                for k in self.range_order(everything)]
     
-    for range_label, count in stats["frequency_counts"].items():
-        report.append(f"- {range_label}: {count} types")
+    def buckets(self, category: int) -> Iterator[Tuple[str, np.ndarray]]:
+        """(range label, row selection) of one category, in order of first appearance"""
+        in_category = self.categories == category
+        for k in self.range_order(in_category):
+            yield FREQUENCY_RANGES[k][2], in_category & (self.ranges == k)
     
-    # Category details
-    for category, freq_ranges in analysis["categories"].items():
-        report.extend([
-            f"\n{category}:",
-            "-" * 40
-        ])
-        for range_label, types in freq_ranges.items():
-            if types:
-                report.append(f"\n{range_label} frequency range:")
-                for dtype, freq in sorted(types.items(), key=lambda x: x[1], reverse=True):
-                    report.append(f"  - {dtype}: {freq}")
+    def analysis(self) -> Dict:
+        """The whole analysis as one in-memory dict, laid out as isolated_types_analysis.json"""
+        everything = np.ones(len(self.rows), dtype=bool)
+        return {
+            "statistics": {
+                "total_isolated": self.total_isolated,
+                "total_frequency": self.total_frequency,
+                "frequency_distribution": {
+                    FREQUENCY_RANGES[k][2]: [dtype for dtype, _ in self.iter_bucket(self.ranges == k)]
+                    for k in self.range_order(everything)
+                },
+                "frequency_counts": dict(self.frequency_counts())
+            },
+            "categories": {
+                category: {label: dict(self.iter_bucket(selection)) for label, selection in self.buckets(c)}
+                for c, category in enumerate(CATEGORIES)
+            }
+        }
     
-    return report
-
-def main():
-    # Load original data
-    with open('data_types_counts.json', 'r', encoding='utf-8') as f:
-        data_list = json.load(f)
+    def write_analysis(self, f: TextIO) -> None:
+        """Stream isolated_types_analysis.json, byte-identical to json.dump(self.analysis(), indent=2)"""
+        everything = np.ones(len(self.rows), dtype=bool)
+        with JsonObjectWriter(f) as root:
+            with root.object("statistics") as statistics:
+                statistics.write("total_isolated", self.total_isolated)
+                statistics.write("total_frequency", self.total_frequency)
+                with statistics.object("frequency_distribution") as distribution:
+                    for k in self.range_order(everything):
+                        with distribution.array(FREQUENCY_RANGES[k][2]) as names:
+                            names.extend(dtype for dtype, _ in self.iter_bucket(self.ranges == k))
+                statistics.write("frequency_counts", dict(self.frequency_counts()))
+            with root.object("categories") as categories:
+                for c, category in enumerate(CATEGORIES):
+                    with categories.object(category) as ranges:
+                        for label, selection in self.buckets(c):
+                            with ranges.object(label) as bucket:
+                                for dtype, freq in self.iter_bucket(selection):
+                                    bucket.write(dtype, freq)
     
-    # Load matched types
-    with open('improved_similarity_analysis_results.json', 'r', encoding='utf-8') as f:
-        results = json.load(f)
-        matched_types = {
-            dtype["name"]
-            for group in results["groups"].values()
-            for dtype in group["types"]  # Removed extra nesting levels
-        }
+    def write_type_list(self, f: TextIO) -> None:
+        """Stream isolated_types.json: every isolated type with its count, by decreasing count"""
+        with JsonObjectWriter(f) as root:
+            root.write("total_count", self.total_isolated)
+            with root.object("types") as types:
+                for dtype, freq in self.table.items(self.isolated):
+                    types.write(dtype, freq)
     
-    # Extract and analyze isolated types
-    isolated_types = extract_isolated_types(data_list, matched_types)
-    analysis = analyze_isolated_types(isolated_types)
+    def iter_report_lines(self) -> Iterator[str]:
+        """Lines of isolated_types_report.txt"""
+        yield from ["Isolated Data Types Analysis Report", "=" * 50, "\n"]
+        
+        # Overall statistics
+        yield from [
+            "Overall Statistics:",
+            f"- Total isolated types: {self.total_isolated}",
+            f"- Total frequency: {self.total_frequency}",
+            "\nFrequency Distribution:",
+        ]
+        for range_label, count in self.frequency_counts():
+            yield f"- {range_label}: {count} types"
+        
+        # Category details, each bucket already sorted by decreasing frequency
+        for c, category in enumerate(CATEGORIES):
+            yield f"\n{category}:"
+            yield "-" * 40
+            for range_label, selection in self.buckets(c):
+                yield f"\n{range_label} frequency range:"
+                for dtype, freq in self.iter_bucket(selection):
+                    yield f"  - {dtype}: {freq}"
     
-    # Generate report
-    report = generate_report(analysis)
+    def write_report(self, f: TextIO) -> None:
+        TextReportWriter(f).extend(self.iter_report_lines())
+
+def analyze_isolated_types(table: FrequencyTable, isolated: np.ndarray) -> Dict:
+    """Analyze isolated data types"""
+    return IsolatedTypes(table, isolated).analysis()
+
+def grouped_type_names(results: Dict) -> Set[str]:
+    """Names of the grouped types in in-memory grouping results"""
+    return {entry["name"] for group in results["groups"].values() for entry in group["types"]}
+
+def run_isolated_types_analysis(table: FrequencyTable, matched_types: Set[str]) -> IsolatedTypes:
+    """Classification of the types outside every group, from which the outputs are streamed"""
+    return IsolatedTypes(table, extract_isolated_types(table, matched_types))
+
+def save_isolated_types(isolated: IsolatedTypes, output_dir: str = '.') -> None:
+    """Write isolated_types_analysis.json, isolated_types.json and isolated_types_report.txt"""
+    with open(os.path.join(output_dir, 'isolated_types_analysis.json'), 'w', encoding='utf-8') as f:
+        isolated.write_analysis(f)
+    with open(os.path.join(output_dir, 'isolated_types.json'), 'w', encoding='utf-8') as f:
+        isolated.write_type_list(f)
+    with open(os.path.join(output_dir, 'isolated_types_report.txt'), 'w', encoding='utf-8') as f:
+        isolated.write_report(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the data types that were not grouped")
+    parser.add_argument('--results', default='improved_similarity_analysis_results.json',
+                        help="Grouping results (.json, or .ndjson read one group at a time)")
+    args = parser.parse_args()
     
-    # Save analysis results
-    with open('isolated_types_analysis.json', 'w', encoding='utf-8') as f:
-        json.dump(analysis, f, indent=2, ensure_ascii=False)
+    # Load original data
+    table = FrequencyTable.from_json('data_types_counts.json')
     
-    # Save isolated type data
-    isolated_data = {
-        "total_count": len(isolated_types),
-        "types": {
-            dtype: freq
-            for dtype, freq in sorted(isolated_types.items(), key=lambda x: x[1], reverse=True)
-        }
-    }
-    with open('isolated_types.json', 'w', encoding='utf-8') as f:
-        json.dump(isolated_data, f, indent=2, ensure_ascii=False)
+    # Load matched types
+    matched_types = set(iter_result_type_names(args.results))
     
-    # Save report
-    with open('isolated_types_report.txt', 'w', encoding='utf-8') as f:
-        f.write('\n'.join(report))
+    # Classify isolated types, then stream analysis, type list and report
+    save_isolated_types(run_isolated_types_analysis(table, matched_types))
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import argparse
+from typing import Dict, List, Optional
+
+from categorize_data_patterns import categorize_patterns, save_pattern_categories
+from clustering_effectiveness_evaluator import (
+    DEFAULT_SAMPLE_BUDGET, QUALITY_MODES, ClusteringEvaluator, save_evaluation_report
+)
+from extract_data_patterns import compute_pattern_statistics, save_pattern_statistics
+from frequency_table import FrequencyTable
+from improved_datatype_similarity_analysis import (
+    GROUPING_ENGINES, SIMILARITY_CONFIG_FILE, generate_report, load_similarity_config, run_improved_grouping
+)
+from isolated_types_analyzer import grouped_type_names, run_isolated_types_analysis, save_isolated_types
+from results_io import COMPACT_SUFFIX, write_results
+from similarity_cache import SimilarityCache
+
+
+def run_chain(data_list: List[List], config: Optional[Dict] = None, use_generated_config: bool = False,
+              workers: int = 1, similarity_cache: Optional[SimilarityCache] = None,
+              quality_mode: str = 'exact', sample_budget: int = DEFAULT_SAMPLE_BUDGET,
+              confidence: float = 0.95, seed: int = 0, evaluate: bool = True, engine: str = 'bucketed') -> Dict:
+    """Run every stage on in-memory objects, loading the type counts only once.
+
+    The grouping uses `config` (by default 5_3_3_pattern_similarity_config.json),
+    or the config generated by the categorize stage when use_generated_config
+    is set. Returns the output of each stage and the seconds it took.
+    """
+    outputs = {"timings": {}}
+
+    def timed(name: str, function, *args, **kwargs):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        outputs["timings"][name] = time.perf_counter() - start
+        return result
+
+    outputs["pattern_statistics"] = timed('extract_patterns', compute_pattern_statistics, data_list)
+    outputs["pattern_report"], outputs["generated_config"] = timed(
+        'categorize_patterns', categorize_patterns, outputs["pattern_statistics"]
+    )
+
+    if use_generated_config:
+        config = outputs["generated_config"]
+    elif config is None:
+        config = load_similarity_config()
+    outputs["results"] = timed('improved_grouping', run_improved_grouping, data_list, config, workers,
+                               similarity_cache, engine=engine)
+    outputs["grouping_report"] = generate_report(outputs["results"]["statistics"])
+
+    # One columnar copy of the counts serves the isolated types and the evaluation
+    table = FrequencyTable.from_pairs(data_list)
+    outputs["isolated"] = timed('isolated_types', run_isolated_types_analysis,
+                                table, grouped_type_names(outputs["results"]))
+
+    if evaluate:
+        evaluator = ClusteringEvaluator(table, outputs["results"])
+        outputs["evaluation"] = timed('clustering_evaluation', evaluator.generate_evaluation_report,
+                                      quality_mode, sample_budget, confidence, seed)
+        outputs["evaluation_text"] = evaluator.format_report_text(outputs["evaluation"])
+    return outputs
+
+
+def save_reports(outputs: Dict, output_dir: str = '.') -> None:
+    """Write the human-readable reports of a chain run"""
+    with open(os.path.join(output_dir, 'pattern_categories_report.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(outputs["pattern_report"]))
+    with open(os.path.join(output_dir, 'improved_similarity_analysis_report.txt'), 'w', encoding='utf-8') as f:
+        f.write('\n'.join(outputs["grouping_report"]))
+    with open(os.path.join(output_dir, 'isolated_types_report.txt'), 'w', encoding='utf-8') as f:
+        outputs["isolated"].write_report(f)
+    if "evaluation" in outputs:
+        save_evaluation_report(outputs["evaluation"], outputs["evaluation_text"],
+                               os.path.join(output_dir, 'evaluation_results'))
+
+
+def save_checkpoints(outputs: Dict, output_dir: str = '.', compact: bool = False) -> None:
+    """Write every file the stand-alone scripts produce, so that any of them can resume from here"""
+    save_pattern_statistics(outputs["pattern_statistics"], os.path.join(output_dir, 'data_pattern_statistics.json'))
+    save_pattern_categories(outputs["pattern_report"], outputs["generated_config"],
+                            os.path.join(output_dir, 'pattern_categories_report.txt'),
+                            os.path.join(output_dir, 'pattern_similarity_config.json'))
+    results_path = os.path.join(output_dir, 'improved_similarity_analysis_results' + (COMPACT_SUFFIX if compact else '.json'))
+    write_results(results_path, outputs["results"]["statistics"], outputs["results"]["groups"].items())
+    save_isolated_types(outputs["isolated"], output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the datatype filtering and merging stages in one process")
+    parser.add_argument('--counts', default='data_types_counts.json', help="Type counts to normalize")
+    parser.add_argument('--config', default=SIMILARITY_CONFIG_FILE, help="Pattern config of the grouping stage")
+    parser.add_argument('--use-generated-config', action='store_true',
+                        help="Group with the config generated by the categorize stage instead of --config")
+    parser.add_argument('--output-dir', default='.', help="Directory the reports are written to")
+    parser.add_argument('--checkpoints', action='store_true',
+                        help="Also write the intermediate JSON files of the stand-alone scripts")
+    parser.add_argument('--compact', action='store_true', help="Write the grouping results checkpoint as .ndjson")
+    parser.add_argument('--engine', choices=GROUPING_ENGINES, default='bucketed',
+                        help="Pattern rule engine of the grouping stage")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes of the grouping stage; needs --engine pairwise, "
+                             "and the serial bucketed engine is still much faster")
+    parser.add_argument('--cache', action='store_true',
+                        help="Read and write the on-disk similarity cache (slower first run, faster reruns)")
+    parser.add_argument('--skip-evaluation', action='store_true', help="Do not run the clustering evaluation")
+    parser.add_argument('--quality-mode', choices=QUALITY_MODES, default='exact',
+                        help="Quality metrics of the clustering evaluation")
+    parser.add_argument('--sample-budget', type=int, default=DEFAULT_SAMPLE_BUDGET,
+                        help="Number of type pairs scored in sampled mode")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the sampled mode")
+    args = parser.parse_args()
+    if args.workers != 1 and args.engine != 'pairwise':
+        parser.error("--workers other than 1 needs --engine pairwise; the bucketed engine runs serially")
+
+    start = time.perf_counter()
+    with open(args.counts, 'r', encoding='utf-8') as f:
+        data_list = json.load(f)
+    config = None if args.use_generated_config else load_similarity_config(args.config)
+    load_time = time.perf_counter() - start
+
+    outputs = run_chain(
+        data_list, config, args.use_generated_config, args.workers,
+        SimilarityCache() if args.cache else None, args.quality_mode, args.sample_budget,
+        seed=args.seed, evaluate=not args.skip_evaluation, engine=args.engine
+    )
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.checkpoints:
+        save_checkpoints(outputs, args.output_dir, args.compact)
+    save_reports(outputs, args.output_dir)
+
+    print(f"{'load':<24} {load_time:8.2f}s")
+    for name, seconds in outputs["timings"].items():
+        print(f"{name:<24} {seconds:8.2f}s")
+
+if __name__ == "__main__":
+    main()
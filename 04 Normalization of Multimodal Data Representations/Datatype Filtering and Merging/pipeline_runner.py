@@ -0,0 +1,355 @@
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_STATE_FILE = 'pipeline_state.json'
+DEFAULT_LOG_DIR = 'pipeline_logs'
+
+
+class Stage:
+    """One step of the pipeline: a script (or a Python callable) and the files it reads and writes.
+
+    Paths are relative to the data directory the scripts run in. An output may
+    be a directory, whose whole content is then hashed.
+    """
+
+    def __init__(self, name: str, inputs: Sequence[str], outputs: Sequence[str],
+                 script: Optional[str] = None, args: Sequence[str] = (),
+                 action: Optional[Callable[[str], None]] = None, description: str = ''):
+        if (script is None) == (action is None):
+            raise ValueError(f"Stage {name} needs exactly one of script and action")
+        self.name = name
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.script = script
+        self.args = list(args)
+        self.action = action
+        self.description = description
+
+    def code_files(self) -> List[str]:
+        """The script and every module of this directory it imports, transitively"""
+        if self.script is None:
+            return []
+        return sorted(_local_imports(os.path.join(SCRIPT_DIR, self.script)))
+
+    def command(self) -> List[str]:
+        return [sys.executable, os.path.join(SCRIPT_DIR, self.script)] + self.args
+
+
+def _copy_file(source: str, target: str) -> Callable[[str], None]:
+    def action(data_dir: str) -> None:
+        shutil.copyfile(os.path.join(data_dir, source), os.path.join(data_dir, target))
+    return action
+
+
+def default_stages(workers: int = 1, compact: bool = False, engine: str = 'bucketed') -> List[Stage]:
+    """The Datatype Filtering and Merging scripts in the order they used to be run by hand.
+
+    extract_data_patterns.py writes data_pattern_statistics.json while
+    categorize_data_patterns.py reads pattern_analysis.json, so a copy stage
+    links the two. The config produced by categorize_data_patterns.py is only a
+    proposal: 5_3_3_pattern_similarity_config.json is maintained by hand and is
+    an input of the grouping stage, so editing it reruns grouping and the
+    stages after it only.
+    """
+    results = 'improved_similarity_analysis_results' + ('.ndjson' if compact else '.json')
+    grouping_args = ['--engine', engine, '--workers', str(workers)] + (['--compact'] if compact else [])
+    return [
+        Stage('extract_patterns', ['data_types_counts.json'], ['data_pattern_statistics.json'],
+              script='extract_data_patterns.py', description="prefix and suffix frequencies"),
+        Stage('link_pattern_analysis', ['data_pattern_statistics.json'], ['pattern_analysis.json'],
+              action=_copy_file('data_pattern_statistics.json', 'pattern_analysis.json'),
+              description="input name expected by categorize_data_patterns.py"),
+        Stage('categorize_patterns', ['pattern_analysis.json'],
+              ['pattern_categories_report.txt', 'pattern_similarity_config.json'],
+              script='categorize_data_patterns.py', description="pattern categories and proposed config"),
+        Stage('improved_grouping', ['data_types_counts.json', '5_3_3_pattern_similarity_config.json'],
+              [results, 'improved_similarity_analysis_report.txt'],
+              script='improved_datatype_similarity_analysis.py', args=grouping_args,
+              description="similar type groups"),
+        Stage('isolated_types', ['data_types_counts.json', results],
+              ['isolated_types_analysis.json', 'isolated_types.json', 'isolated_types_report.txt'],
+              script='isolated_types_analyzer.py', args=['--results', results],
+              description="types left out of every group"),
+        Stage('clustering_evaluation', ['data_types_counts.json', results], ['evaluation_results'],
+              script='clustering_effectiveness_evaluator.py', args=['--results', results],
+              description="cluster quality report")
+    ]
+
+
+def _local_imports(path: str, seen: Optional[Set[str]] = None) -> Set[str]:
+    seen = set() if seen is None else seen
+    if path in seen:
+        return seen
+    seen.add(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            module_path = os.path.join(SCRIPT_DIR, name.split('.')[0] + '.py')
+            if os.path.exists(module_path):
+                _local_imports(module_path, seen)
+    return seen
+
+
+def hash_path(path: str) -> Optional[str]:
+    """Content hash of a file or of a directory tree, or None when missing"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                digest.update(os.path.relpath(file_path, path).encode('utf-8') + b'\x00')
+                digest.update(bytes.fromhex(hash_path(file_path)))
+        return digest.hexdigest()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class PipelineRunner:
+    """Runs the stages as a DAG, skipping those whose inputs, code and arguments are unchanged.
+
+    A stage depends on the stages producing its inputs. Its fingerprint hashes
+    the content of its inputs and code files together with its command, and is
+    computed only once its producers have finished, so a producer that reruns
+    but writes identical outputs does not force the stages after it to rerun.
+    """
+
+    def __init__(self, stages: Sequence[Stage], data_dir: str = '.', state_file: str = DEFAULT_STATE_FILE,
+                 log_dir: str = DEFAULT_LOG_DIR, jobs: int = 0):
+        self.stages = {stage.name: stage for stage in stages}
+        self.data_dir = os.path.abspath(data_dir)
+        self.state_path = os.path.join(self.data_dir, state_file)
+        self.log_dir = os.path.join(self.data_dir, log_dir)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.state = self._load_state()
+
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"{output} is written by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+        self.dependencies = {
+            stage.name: sorted({producers[path] for path in stage.inputs if path in producers})
+            for stage in stages
+        }
+        self._check_acyclic()
+
+    def _load_state(self) -> Dict:
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _save_state(self) -> None:
+        with open(self.state_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2)
+
+    def _check_acyclic(self) -> None:
+        visiting, done = set(), set()
+
+        def visit(name: str) -> None:
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependencies form a cycle through {name}")
+            visiting.add(name)
+            for dependency in self.dependencies[name]:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def with_dependencies(self, targets: Sequence[str]) -> Set[str]:
+        """The target stages and everything upstream of them"""
+        selected = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            if name not in selected:
+                selected.add(name)
+                pending.extend(self.dependencies[name])
+        return selected
+
+    def fingerprint(self, stage: Stage) -> Dict:
+        digest = hashlib.sha256()
+        digest.update(json.dumps([stage.name, stage.script, stage.args], ensure_ascii=False).encode('utf-8'))
+        missing = []
+        for path in stage.inputs:
+            content_hash = hash_path(os.path.join(self.data_dir, path))
+            if content_hash is None:
+                missing.append(path)
+            digest.update(f"{path}\x00{content_hash}\x00".encode('utf-8'))
+        for path in stage.code_files():
+            digest.update(f"{os.path.basename(path)}\x00{hash_path(path)}\x00".encode('utf-8'))
+        return {'hash': digest.hexdigest(), 'missing': missing}
+
+    def is_up_to_date(self, stage: Stage, input_hash: str) -> bool:
+        """Same fingerprint as the last successful run, and the outputs are still as it left them"""
+        record = self.state.get(stage.name)
+        if not record or record.get('input_hash') != input_hash:
+            return False
+        return all(
+            hash_path(os.path.join(self.data_dir, path)) == record['outputs'].get(path)
+            for path in stage.outputs
+        )
+
+    def _execute(self, stage: Stage) -> Dict:
+        start = time.perf_counter()
+        if stage.action is not None:
+            stage.action(self.data_dir)
+            return {'status': 'ran', 'seconds': time.perf_counter() - start}
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        log_path = os.path.join(self.log_dir, f'{stage.name}.log')
+        with open(log_path, 'w', encoding='utf-8') as log:
+            completed = subprocess.run(stage.command(), cwd=self.data_dir, stdout=log, stderr=subprocess.STDOUT)
+        result = {'status': 'ran' if completed.returncode == 0 else 'failed',
+                  'seconds': time.perf_counter() - start, 'log': log_path}
+        if completed.returncode != 0:
+            result['error'] = f"exit status {completed.returncode}"
+        return result
+
+    def run(self, targets: Optional[Sequence[str]] = None, force: bool = False, dry_run: bool = False) -> Dict[str, Dict]:
+        """Run the selected stages; returns {stage: {"status", "seconds", ...}}.
+
+        Statuses are "ran", "skipped" (up to date), "failed", "blocked" (an
+        upstream stage failed) and, for dry runs, "would run".
+        """
+        selected = self.with_dependencies(targets) if targets else set(self.stages)
+        remaining = {name: set(self.dependencies[name]) & selected for name in selected}
+        results: Dict[str, Dict] = {}
+        fingerprints: Dict[str, Dict] = {}
+        running = {}
+
+        def finish(name: str, result: Dict) -> None:
+            results[name] = result
+            print(f"[{result['status']:^9}] {name:<24} {result.get('seconds', 0.0):8.2f}s"
+                  + (f"  {result['error']}" if 'error' in result else ''))
+            if result['status'] == 'ran':
+                stage = self.stages[name]
+                self.state[name] = {
+                    'input_hash': fingerprints[name]['hash'],
+                    'outputs': {path: hash_path(os.path.join(self.data_dir, path)) for path in stage.outputs},
+                    'seconds': round(result['seconds'], 3),
+                    'finished': time.strftime('%Y-%m-%d %H:%M:%S')
+                }
+                self._save_state()
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while remaining or running:
+                ready = sorted(name for name, deps in remaining.items() if not deps)
+                for name in ready:
+                    del remaining[name]
+                    stage = self.stages[name]
+                    failed = [dep for dep in self.dependencies[name]
+                              if dep in results and results[dep]['status'] in ('failed', 'blocked')]
+                    if failed:
+                        finish(name, {'status': 'blocked', 'error': f"after {', '.join(failed)}"})
+                    elif dry_run and any(results.get(dep, {}).get('status') == 'would run'
+                                         for dep in self.dependencies[name]):
+                        finish(name, {'status': 'would run'})
+                    else:
+                        fingerprints[name] = self.fingerprint(stage)
+                        if fingerprints[name]['missing']:
+                            finish(name, {'status': 'failed',
+                                          'error': f"missing inputs: {', '.join(fingerprints[name]['missing'])}"})
+                        elif not force and self.is_up_to_date(stage, fingerprints[name]['hash']):
+                            finish(name, {'status': 'skipped'})
+                        elif dry_run:
+                            finish(name, {'status': 'would run'})
+                        else:
+                            running[executor.submit(self._execute, stage)] = name
+
+                    # Newly finished stages may have made others ready
+                    if name in results:
+                        for deps in remaining.values():
+                            deps.discard(name)
+
+                if not running:
+                    if remaining and not any(not deps for deps in remaining.values()):
+                        raise RuntimeError("Pipeline stalled with unresolved dependencies")
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'status': 'failed', 'error': str(e)}
+                    finish(name, result)
+                    for deps in remaining.values():
+                        deps.discard(name)
+
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the datatype filtering and merging scripts as a cached DAG")
+    parser.add_argument('stages', nargs='*', help="Stages to bring up to date, with their upstream stages (default: all)")
+    parser.add_argument('--data-dir', default='.', help="Directory holding data_types_counts.json and the outputs")
+    parser.add_argument('--jobs', type=int, default=0, help="Stages run at the same time (0 uses all CPU cores)")
+    parser.add_argument('--engine', choices=('bucketed', 'pairwise'), default='bucketed',
+                        help="Pattern rule engine of the grouping stage")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes of the grouping stage; needs --engine pairwise, "
+                             "and the serial bucketed engine is still much faster")
+    parser.add_argument('--compact', action='store_true', help="Pass the grouping results as .ndjson")
+    parser.add_argument('--force', action='store_true', help="Rerun the selected stages even if up to date")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which stages would run")
+    parser.add_argument('--list', action='store_true', help="Print the stages and their dependencies")
+    parser.add_argument('--state', default=DEFAULT_STATE_FILE, help="File recording the fingerprints of the last runs")
+    args = parser.parse_args()
+    if args.workers != 1 and args.engine != 'pairwise':
+        parser.error("--workers other than 1 needs --engine pairwise; the bucketed engine runs serially")
+
+    runner = PipelineRunner(default_stages(args.workers, args.compact, args.engine), args.data_dir, args.state,
+                            jobs=args.jobs)
+
+    if args.list:
+        for name, stage in runner.stages.items():
+            after = ', '.join(runner.dependencies[name]) or '-'
+            print(f"{name:<24} after: {after:<40} {stage.description}")
+        return
+
+    start = time.perf_counter()
+    results = runner.run(args.stages, force=args.force, dry_run=args.dry_run)
+    total = time.perf_counter() - start
+
+    counts = {}
+    for result in results.values():
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    print("-" * 60)
+    print(f"{len(results)} stages in {total:.2f}s: " + ', '.join(f"{n} {status}" for status, n in sorted(counts.items())))
+    if any(result['status'] in ('failed', 'blocked') for result in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import os
+
+# Set to 1 (or true/yes) to skip figure generation in every plotting script
+HEADLESS_ENV = 'DTYPE_ANALYSIS_HEADLESS'
+
+
+def headless_requested(flag: bool = False) -> bool:
+    """Whether figures are skipped, from a --headless flag or the environment"""
+    return flag or os.environ.get(HEADLESS_ENV, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def load_pyplot():
+    """Import matplotlib.pyplot on first use, so that headless runs never pay for it"""
+    import matplotlib.pyplot as plt
+    return plt
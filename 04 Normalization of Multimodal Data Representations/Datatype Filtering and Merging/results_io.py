@@ -0,0 +1,239 @@
+import json
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple
+
+# Newline-delimited results: an optional {"statistics": ...} line followed by
+# one {"group": ..., "total_frequency": ..., "types": [[name, frequency], ...]}
+# line per group, in the order of the regular JSON results
+COMPACT_SUFFIX = '.ndjson'
+
+
+def is_compact(path: str) -> bool:
+    return path.endswith(COMPACT_SUFFIX)
+
+
+class JsonObjectWriter:
+    """Writes a JSON object member by member.
+
+    The output is byte-identical to json.dump(obj, f, indent=indent) for the
+    same members, but no member has to be kept once it has been written.
+    """
+
+    def __init__(self, f: TextIO, indent: int = 2, ensure_ascii: bool = False, level: int = 0):
+        self.f = f
+        self.indent = indent
+        self.ensure_ascii = ensure_ascii
+        self.level = level
+        self.count = 0
+        self.closed = False
+        self.f.write('{')
+
+    def _begin_member(self, key: str) -> str:
+        padding = '\n' + ' ' * (self.indent * (self.level + 1))
+        self.f.write((',' if self.count else '') + padding + json.dumps(key, ensure_ascii=self.ensure_ascii) + ': ')
+        self.count += 1
+        return padding
+
+    def write(self, key: str, value: Any) -> None:
+        """Write one member"""
+        padding = self._begin_member(key)
+        text = json.dumps(value, indent=self.indent, ensure_ascii=self.ensure_ascii)
+        self.f.write(text.replace('\n', padding))
+
+    def object(self, key: str) -> 'JsonObjectWriter':
+        """Start a member whose value is itself written member by member"""
+        self._begin_member(key)
+        return JsonObjectWriter(self.f, self.indent, self.ensure_ascii, self.level + 1)
+
+    def array(self, key: str) -> 'JsonArrayWriter':
+        """Start a member whose value is an array written item by item"""
+        self._begin_member(key)
+        return JsonArrayWriter(self.f, self.indent, self.ensure_ascii, self.level + 1)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.count:
+            self.f.write('\n' + ' ' * (self.indent * self.level))
+        self.f.write('}')
+        self.closed = True
+
+    def __enter__(self) -> 'JsonObjectWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class JsonArrayWriter:
+    """Writes a JSON array item by item, byte-identical to json.dump like JsonObjectWriter"""
+
+    def __init__(self, f: TextIO, indent: int = 2, ensure_ascii: bool = False, level: int = 0):
+        self.f = f
+        self.indent = indent
+        self.ensure_ascii = ensure_ascii
+        self.level = level
+        self.count = 0
+        self.closed = False
+        self.f.write('[')
+
+    def append(self, value: Any) -> None:
+        padding = '\n' + ' ' * (self.indent * (self.level + 1))
+        text = json.dumps(value, indent=self.indent, ensure_ascii=self.ensure_ascii)
+        self.f.write((',' if self.count else '') + padding + text.replace('\n', padding))
+        self.count += 1
+
+    def extend(self, values) -> None:
+        for value in values:
+            self.append(value)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        if self.count:
+            self.f.write('\n' + ' ' * (self.indent * self.level))
+        self.f.write(']')
+        self.closed = True
+
+    def __enter__(self) -> 'JsonArrayWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class TextReportWriter:
+    """List-like sink for report lines that writes them out immediately.
+
+    Lines are separated exactly as in f.write('\\n'.join(lines)).
+    """
+
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.count = 0
+
+    def append(self, line: str) -> None:
+        self.f.write(('\n' if self.count else '') + line)
+        self.count += 1
+
+    def extend(self, lines) -> None:
+        for line in lines:
+            self.append(line)
+
+
+class GroupRecordWriter:
+    """Writes results in the compact newline-delimited format"""
+
+    def __init__(self, f: TextIO, statistics: Optional[Dict] = None):
+        self.f = f
+        if statistics is not None:
+            self.f.write(json.dumps({"statistics": statistics}, ensure_ascii=False) + '\n')
+
+    def write(self, key: str, group: Dict) -> None:
+        """Write one group given in the regular {"total_frequency", "types"} layout"""
+        record = {
+            "group": key,
+            "total_frequency": group["total_frequency"],
+            "types": [[entry["name"], entry["frequency"]] for entry in group["types"]]
+        }
+        self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+def _iter_records(path: str) -> Iterator[Dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_result_groups(path: str) -> Iterator[Tuple[str, Dict]]:
+    """Yield (group name, {"total_frequency", "types"}) from a results file.
+
+    Compact files are read one line at a time; regular JSON files (with or
+    without the "statistics"/"groups" wrapper) are loaded in one piece.
+    """
+    if is_compact(path):
+        for record in _iter_records(path):
+            if "group" in record:
+                yield record["group"], {
+                    "total_frequency": record["total_frequency"],
+                    "types": [{"name": name, "frequency": frequency} for name, frequency in record["types"]]
+                }
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        results = json.load(f)
+    groups = results["groups"] if "groups" in results and "statistics" in results else results
+    yield from groups.items()
+
+
+def iter_result_type_names(path: str) -> Iterator[str]:
+    """Yield the name of every grouped type in a results file"""
+    for _, group in iter_result_groups(path):
+        for entry in group["types"]:
+            yield entry["name"]
+
+
+def read_result_statistics(path: str) -> Optional[Dict]:
+    """Statistics stored with the results, or None"""
+    if is_compact(path):
+        for record in _iter_records(path):
+            return record.get("statistics")
+        return None
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("statistics")
+
+
+class LazyResultGroups:
+    """Read-only mapping view of the groups of a compact results file.
+
+    Every iteration streams the file again instead of keeping the groups.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def items(self) -> Iterator[Tuple[str, Dict]]:
+        return iter_result_groups(self.path)
+
+    def keys(self) -> Iterator[str]:
+        return (key for key, _ in self.items())
+
+    def values(self) -> Iterator[Dict]:
+        return (group for _, group in self.items())
+
+    def __iter__(self) -> Iterator[str]:
+        return self.keys()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.items())
+
+
+def load_results(path: str) -> Dict:
+    """Results as {"statistics", "groups"}, with lazily read groups for compact files"""
+    if is_compact(path):
+        return {"statistics": read_result_statistics(path), "groups": LazyResultGroups(path)}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_results(path: str, statistics: Optional[Dict], groups) -> None:
+    """Write (name, group) pairs as they are produced, in the format chosen by the suffix"""
+    with open(path, 'w', encoding='utf-8') as f:
+        if is_compact(path):
+            writer = GroupRecordWriter(f, statistics)
+            for key, group in groups:
+                writer.write(key, group)
+            return
+
+        with JsonObjectWriter(f) as root:
+            if statistics is None:
+                # Plain {name: group} layout of datatype_similar_groups.json
+                for key, group in groups:
+                    root.write(key, group)
+                return
+            root.write("statistics", statistics)
+            with root.object("groups") as groups_writer:
+                for key, group in groups:
+                    groups_writer.write(key, group)
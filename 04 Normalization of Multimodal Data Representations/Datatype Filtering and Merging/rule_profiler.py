@@ -0,0 +1,83 @@
+import json
+import time
+import heapq
+import itertools
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+
+class RuleProfiler:
+    """Per-rule counters and timings of one grouping run.
+
+    Analyzers only call the profiler when one is attached, so a run without
+    one pays a single `is None` test per leader. For every rule the profile
+    holds how many (leader, candidate) pairs it evaluated, how many it grouped
+    and the time spent in it. A pair is attributed to the first rule that
+    grouped it, in the order the analyzer evaluates them.
+
+    The slowest leader batches are kept as well: one entry per scoring call
+    of the similarity rule, i.e. all candidates of a leader scored in bulk,
+    or a single pair (with the other type) where the analyzer scores pairs
+    one by one. Their time is that of the whole batch, not of one pair, and
+    batches without any pair are not recorded.
+    """
+
+    def __init__(self, max_slowest: int = 20, max_groups: int = 20):
+        self.max_slowest = max_slowest
+        self.max_groups = max_groups
+        self.rules: Dict[str, Dict] = {}
+        self.similarity_calls = 0
+        self.group_rules: Dict[str, Counter] = defaultdict(Counter)
+        self._slowest: List = []
+        self._sequence = itertools.count()
+        self._start = time.perf_counter()
+        self.wall_time: Optional[float] = None
+
+    def record(self, rule: str, evaluations: int, hits: int, seconds: float, leader: Optional[str] = None) -> None:
+        """Add the outcome of evaluating one rule on `evaluations` pairs"""
+        stats = self.rules.get(rule)
+        if stats is None:
+            stats = self.rules[rule] = {'evaluations': 0, 'hits': 0, 'seconds': 0.0}
+        stats['evaluations'] += evaluations
+        stats['hits'] += hits
+        stats['seconds'] += seconds
+        if leader is not None and hits:
+            self.group_rules[leader][rule] += hits
+
+    def record_leader_batch(self, seconds: float, rule: str, leader: str, pairs: int,
+                            other: Optional[str] = None) -> None:
+        """Keep the slowest batches: `pairs` candidates of a leader scored together"""
+        entry = {'seconds': seconds, 'rule': rule, 'leader': leader, 'pairs': pairs}
+        if other is not None:
+            entry['other'] = other
+        item = (seconds, next(self._sequence), entry)
+        if len(self._slowest) < self.max_slowest:
+            heapq.heappush(self._slowest, item)
+        elif seconds > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    def finish(self, similarity_calls: int = 0) -> None:
+        """Close the run, adding the similarity calls made during it"""
+        self.similarity_calls += similarity_calls
+        self.wall_time = time.perf_counter() - self._start
+
+    def to_dict(self) -> Dict:
+        """Machine-readable profile"""
+        largest = sorted(self.group_rules.items(), key=lambda x: sum(x[1].values()), reverse=True)
+        return {
+            'wall_time': self.wall_time,
+            'similarity_calls': self.similarity_calls,
+            'rules': {
+                rule: dict(stats, hit_rate=stats['hits'] / stats['evaluations'] if stats['evaluations'] else 0.0)
+                for rule, stats in self.rules.items()
+            },
+            'slowest_leader_batches': [entry for _, _, entry in sorted(self._slowest, reverse=True)],
+            'largest_groups': [
+                {'leader': leader, 'size': sum(hits.values()) + 1, 'rule_hits': dict(hits)}
+                for leader, hits in largest[:self.max_groups]
+            ]
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
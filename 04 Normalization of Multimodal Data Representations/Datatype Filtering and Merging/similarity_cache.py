@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import argparse
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from candidate_blocking import StringSimilarityBlocker
+from similarity_kernel import ALGORITHM_VERSION, BatchStringSimilarity
+
+DEFAULT_CACHE_DIR = 'similarity_cache'
+
+# Total size of the cached matrices above which the least recently used are evicted
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Number of candidate pairs collected before they are scored in one kernel call
+PAIRS_PER_BATCH = 1 << 16
+
+MANIFEST_NAME = 'manifest.json'
+ARRAY_NAMES = ('indptr', 'indices', 'scores')
+
+
+def vocabulary_key(strings: Sequence[str], method: str, config: Optional[Dict] = None) -> str:
+    """Content hash of an ordered vocabulary, the analyzer config and the kernel version"""
+    digest = hashlib.sha256()
+    header = {'algorithm_version': ALGORITHM_VERSION, 'method': method, 'config': config}
+    digest.update(json.dumps(header, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    for s in strings:
+        digest.update(b'\x00')
+        digest.update(s.encode('utf-8'))
+    return digest.hexdigest()
+
+
+class SparseSimilarityMatrix:
+    """Symmetric pairwise scores above a floor, stored as CSR arrays.
+
+    Pairs missing from a row score at most `floor`, so for any threshold
+    >= floor the stored entries answer `score > threshold` exactly. Ratcliff/
+    Obershelp is not symmetric: the score of positions i and j is always the
+    one of (strings[min(i, j)], strings[max(i, j)]), which is the orientation
+    of a frequency-ordered greedy scan (leader first). Scores are kept as
+    float64 so that comparisons against a threshold match the kernel exactly.
+    """
+
+    def __init__(self, strings: Sequence[str], floor: float, indptr: np.ndarray,
+                 indices: np.ndarray, scores: np.ndarray):
+        self.strings = list(strings)
+        self.floor = floor
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self._positions = {s: i for i, s in enumerate(self.strings)}
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.indptr.nbytes + self.indices.nbytes + self.scores.nbytes)
+
+    def position(self, s: str) -> Optional[int]:
+        return self._positions.get(s)
+
+    def row(self, i: int):
+        """Neighbours of position i (sorted) and their scores, as views into the arrays"""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.scores[start:end]
+
+    def scores_for(self, i: int, positions: Sequence[int]) -> np.ndarray:
+        """Scores of position i against the given positions, `floor` where not stored"""
+        positions = np.asarray(positions, dtype=np.int64)
+        neighbours, scores = self.row(i)
+        result = np.full(len(positions), self.floor, dtype=np.float64)
+        if len(neighbours) and len(positions):
+            slots = np.searchsorted(neighbours, positions)
+            slots[slots == len(neighbours)] = 0
+            found = neighbours[slots] == positions
+            result[found] = scores[slots[found]]
+        return result
+
+    @classmethod
+    def compute(cls, strings: Sequence[str], floor: float, kernel: BatchStringSimilarity) -> 'SparseSimilarityMatrix':
+        """Score every pair that may exceed the floor and keep those that do"""
+        index = StringSimilarityBlocker(strings, floor)
+        rows, cols, values = [], [], []
+        batch_rows, batch_cols = [], []
+        pending = 0
+
+        def flush():
+            a = np.concatenate(batch_rows)
+            b = np.concatenate(batch_cols)
+            s = kernel.indexed_pairs(strings, a, b)
+            keep = s > floor
+            rows.append(a[keep])
+            cols.append(b[keep])
+            values.append(s[keep])
+            batch_rows.clear()
+            batch_cols.clear()
+
+        for i in range(len(strings)):
+            candidates = np.array(sorted(j for j in index.candidates(i) if j > i), dtype=np.int64)
+            candidates = index.filter_candidates(i, candidates)
+            if len(candidates):
+                batch_rows.append(np.full(len(candidates), i, dtype=np.int64))
+                batch_cols.append(candidates)
+                pending += len(candidates)
+            if pending >= PAIRS_PER_BATCH:
+                flush()
+                pending = 0
+        if batch_rows:
+            flush()
+
+        # Mirror the upper triangle so every row lists all of its neighbours
+        upper_rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        upper_cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        upper_values = np.concatenate(values) if values else np.zeros(0, dtype=np.float64)
+        all_rows = np.concatenate([upper_rows, upper_cols])
+        all_cols = np.concatenate([upper_cols, upper_rows])
+        all_values = np.concatenate([upper_values, upper_values])
+        order = np.lexsort((all_cols, all_rows))
+
+        indptr = np.zeros(len(strings) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_rows, minlength=len(strings)), out=indptr[1:])
+        return cls(strings, floor, indptr, all_cols[order].astype(np.int32), all_values[order])
+
+
+class SimilarityCache:
+    """On-disk cache of SparseSimilarityMatrix objects, read back memory-mapped.
+
+    Each entry lives in `<directory>/<key>/` as plain .npy arrays plus the
+    vocabulary, and `manifest.json` tracks sizes and last use so that the least
+    recently used entries are evicted once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        try:
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_manifest(self, manifest: Dict[str, Dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._manifest_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self._manifest_path())
+
+    def get(self, key: str, max_floor: float) -> Optional[SparseSimilarityMatrix]:
+        """Memory-map a cached matrix whose floor is at most max_floor"""
+        manifest = self.load_manifest()
+        entry = manifest.get(key)
+        if entry is None or entry['floor'] > max_floor:
+            return None
+
+        entry_dir = os.path.join(self.directory, key)
+        try:
+            arrays = [np.load(os.path.join(entry_dir, name + '.npy'), mmap_mode='r') for name in ARRAY_NAMES]
+            with open(os.path.join(entry_dir, 'vocabulary.json'), 'r', encoding='utf-8') as f:
+                strings = json.load(f)
+        except (FileNotFoundError, ValueError):
+            # A half-written or damaged entry is dropped and recomputed
+            self.invalidate(key)
+            return None
+
+        entry['last_used'] = time.time()
+        self._save_manifest(manifest)
+        return SparseSimilarityMatrix(strings, entry['floor'], *arrays)
+
+    def put(self, key: str, matrix: SparseSimilarityMatrix, method: str) -> None:
+        """Store a matrix under key, then evict old entries beyond max_bytes"""
+        os.makedirs(self.directory, exist_ok=True)
+        entry_dir = os.path.join(self.directory, key)
+        tmp_dir = entry_dir + '.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(tmp_dir, name + '.npy'), np.ascontiguousarray(getattr(matrix, name)))
+        with open(os.path.join(tmp_dir, 'vocabulary.json'), 'w', encoding='utf-8') as f:
+            json.dump(matrix.strings, f, ensure_ascii=False)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(tmp_dir, entry_dir)
+
+        manifest = self.load_manifest()
+        manifest[key] = {
+            'floor': matrix.floor,
+            'method': method,
+            'algorithm_version': ALGORITHM_VERSION,
+            'vocabulary_size': len(matrix.strings),
+            'pairs': int(len(matrix.indices) // 2),
+            'size_bytes': matrix.nbytes,
+            'last_used': time.time(),
+        }
+        self._save_manifest(manifest)
+        self.evict(keep=key)
+
+    def lookup(self, strings: Sequence[str], floor: float, method: str,
+               config: Optional[Dict] = None) -> Optional[SparseSimilarityMatrix]:
+        """Cached matrix for the vocabulary if one with a low enough floor exists"""
+        return self.get(vocabulary_key(strings, method, config), floor)
+
+    def get_or_compute(self, strings: Sequence[str], floor: float, kernel: BatchStringSimilarity,
+                       config: Optional[Dict] = None) -> SparseSimilarityMatrix:
+        """Cached matrix for the vocabulary, computed and stored on a miss"""
+        key = vocabulary_key(strings, kernel.method, config)
+        matrix = self.get(key, floor)
+        if matrix is not None:
+            return matrix
+
+        self.put(key, SparseSimilarityMatrix.compute(strings, floor, kernel), kernel.method)
+        return self.get(key, floor)
+
+    def evict(self, keep: Optional[str] = None) -> List[str]:
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        manifest = self.load_manifest()
+        total = sum(entry['size_bytes'] for entry in manifest.values())
+        evicted = []
+        for key, entry in sorted(manifest.items(), key=lambda item: item[1]['last_used']):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(os.path.join(self.directory, key), ignore_errors=True)
+            total -= entry['size_bytes']
+            evicted.append(key)
+
+        if evicted:
+            self._save_manifest({key: entry for key, entry in manifest.items() if key not in evicted})
+        return evicted
+
+    def invalidate(self, key: Optional[str] = None) -> List[str]:
+        """Remove one entry, or every entry when no key is given"""
+        manifest = self.load_manifest()
+        keys = [key] if key is not None else list(manifest)
+        for k in keys:
+            shutil.rmtree(os.path.join(self.directory, k), ignore_errors=True)
+            manifest.pop(k, None)
+        self._save_manifest(manifest)
+        return keys
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the on-disk pairwise similarity cache")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="Cache directory")
+    parser.add_argument('--max-bytes', type=int, default=DEFAULT_MAX_BYTES,
+                        help="Size above which least recently used entries are evicted")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('list', help="Show the cached entries")
+    invalidate_parser = subparsers.add_parser('invalidate', help="Delete cached entries")
+    invalidate_parser.add_argument('--key', help="Entry to delete (all entries by default)")
+    build_parser = subparsers.add_parser('build', help="Precompute the entries of data_types_counts.json")
+    build_parser.add_argument('--floor', type=float, default=0.5, help="Lowest threshold the entries must serve")
+    build_parser.add_argument('--analyzer', choices=('basic', 'improved', 'both'), default='both',
+                              help="Vocabulary to precompute (normalized or raw type names)")
+
+    args = parser.parse_args()
+    cache = SimilarityCache(args.cache_dir, args.max_bytes)
+
+    if args.command == 'list':
+        manifest = cache.load_manifest()
+        total = 0
+        for key, entry in sorted(manifest.items(), key=lambda item: item[1]['last_used'], reverse=True):
+            total += entry['size_bytes']
+            last_used = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['last_used']))
+            print(f"{key[:16]}  floor={entry['floor']:.2f}  method={entry['method']}  "
+                  f"types={entry['vocabulary_size']}  pairs={entry['pairs']}  "
+                  f"size={entry['size_bytes']}  last_used={last_used}")
+        print(f"{len(manifest)} entries, {total} bytes")
+    elif args.command == 'invalidate':
+        removed = cache.invalidate(args.key)
+        print(f"Removed {len(removed)} cache entries")
+    elif args.command == 'build':
+        # Imported here because both analyzers import this module
+        from datatype_similarity_analysis import DatatypeSimilarityAnalyzer
+        from improved_datatype_similarity_analysis import ImprovedDatatypeSimilarityAnalyzer
+        
+        with open('data_types_counts.json', 'r', encoding='utf-8') as f:
+            data_list = json.load(f)
+        counts_dict = {item[0]: item[1] for item in data_list}
+        sorted_types = [dtype for dtype, _ in sorted(counts_dict.items(), key=lambda x: x[1], reverse=True)]
+        
+        if args.analyzer in ('basic', 'both'):
+            analyzer = DatatypeSimilarityAnalyzer(similarity_threshold=args.floor)
+            norm_types = [analyzer.normalize_type(dtype) for dtype in sorted_types]
+            matrix = cache.get_or_compute(norm_types, args.floor, analyzer.similarity_kernel)
+            print(f"basic: {len(norm_types)} types, {len(matrix.indices) // 2} pairs above {matrix.floor}")
+        if args.analyzer in ('improved', 'both'):
+            analyzer = ImprovedDatatypeSimilarityAnalyzer(similarity_threshold=args.floor)
+            matrix = cache.get_or_compute(sorted_types, args.floor, analyzer.similarity_kernel, config=analyzer.config)
+            print(f"improved: {len(sorted_types)} types, {len(matrix.indices) // 2} pairs above {matrix.floor}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+from array import array
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 'greedy' lets each leader take the types it matches, in frequency order;
+# 'components' groups the connected components of the graph of matching pairs
+GROUPING_MODES = ('greedy', 'components')
+
+
+class DisjointSet:
+    """Union-find over positions 0..size-1; the root of a set is its smallest position"""
+
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, position: int) -> int:
+        parent = self.parent
+        while parent[position] != position:
+            # Path halving
+            parent[position] = parent[parent[position]]
+            position = parent[position]
+        return position
+
+    def union(self, a: int, b: int) -> bool:
+        """Merge the sets of a and b; False if they already were one set"""
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a == root_b:
+            return False
+        if root_a < root_b:
+            self.parent[root_b] = root_a
+        else:
+            self.parent[root_a] = root_b
+        return True
+
+
+class SimilarityGraph:
+    """Sparse graph of the type pairs a grouping rule accepts, over frequency-ordered positions.
+
+    Pairwise matches are kept as an edge list. Pairs implied by a shared
+    equality key are kept as one bucket per key: a bucket of m types stands
+    for the m * (m - 1) / 2 edges between them at the cost of m entries.
+    Connected components are maintained with union-find while edges are added,
+    so builders can skip scoring a pair that is already connected when they
+    only need the components.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.sources = array('q')
+        self.targets = array('q')
+        self.buckets: List[List[int]] = []
+        self.components = DisjointSet(size)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.sources) + sum(len(b) * (len(b) - 1) // 2 for b in self.buckets)
+
+    def connected(self, a: int, b: int) -> bool:
+        return self.components.find(a) == self.components.find(b)
+
+    def add_edge(self, a: int, b: int) -> None:
+        self.sources.append(a)
+        self.targets.append(b)
+        self.components.union(a, b)
+
+    def add_bucket(self, members: Iterable[int]) -> None:
+        """Connect every pair of the given positions"""
+        members = list(members)
+        if len(members) < 2:
+            return
+        self.buckets.append(members)
+        for position in members[1:]:
+            self.components.union(members[0], position)
+
+    def groups(self, max_diameter: Optional[int] = None) -> List[List[int]]:
+        """Groups of two or more positions, each sorted and ordered by its first position.
+
+        Without max_diameter these are the connected components. Otherwise the
+        groups are grown from the first (most frequent) position not yet
+        grouped, taking every ungrouped position within max_diameter // 2 hops,
+        so no two members of a group are more than max_diameter hops apart.
+        With max_diameter 2 this is the greedy leader grouping.
+        """
+        if max_diameter is None:
+            members = [[] for _ in range(self.size)]
+            for position in range(self.size):
+                members[self.components.find(position)].append(position)
+            return [group for group in members if len(group) > 1]
+        if max_diameter < 2:
+            raise ValueError(f"max_diameter must be at least 2, got {max_diameter}")
+        return self._bounded_groups(max_diameter // 2)
+
+    def _adjacency(self) -> Tuple[np.ndarray, np.ndarray]:
+        """CSR arrays (indptr, indices) of the pairwise edges in both directions"""
+        sources = np.frombuffer(self.sources, dtype=np.int64)
+        targets = np.frombuffer(self.targets, dtype=np.int64)
+        heads = np.concatenate([sources, targets])
+        tails = np.concatenate([targets, sources])
+        order = np.argsort(heads, kind='stable')
+        indptr = np.zeros(self.size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=self.size), out=indptr[1:])
+        return indptr, tails[order]
+
+    def _bounded_groups(self, radius: int) -> List[List[int]]:
+        """Breadth-first groups of at most `radius` hops around each leader"""
+        indptr, indices = self._adjacency()
+        indptr, indices = indptr.tolist(), indices.tolist()
+        memberships = [[] for _ in range(self.size)]
+        for bucket, members in enumerate(self.buckets):
+            for position in members:
+                memberships[position].append(bucket)
+
+        grouped = [False] * self.size
+        # Expanding a bucket groups all its remaining members, so it is never needed again
+        expanded = [False] * len(self.buckets)
+        groups = []
+        for leader in range(self.size):
+            if grouped[leader]:
+                continue
+            grouped[leader] = True
+            group = [leader]
+            frontier = [leader]
+            for _ in range(radius):
+                reached = []
+                for position in frontier:
+                    for other in indices[indptr[position]:indptr[position + 1]]:
+                        if not grouped[other]:
+                            grouped[other] = True
+                            reached.append(other)
+                    for bucket in memberships[position]:
+                        if expanded[bucket]:
+                            continue
+                        expanded[bucket] = True
+                        for other in self.buckets[bucket]:
+                            if not grouped[other]:
+                                grouped[other] = True
+                                reached.append(other)
+                if not reached:
+                    break
+                group.extend(reached)
+                frontier = reached
+            if len(group) > 1:
+                groups.append(sorted(group))
+        return groups
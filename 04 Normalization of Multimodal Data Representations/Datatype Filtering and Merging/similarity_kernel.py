@@ -0,0 +1,280 @@
+import json
+import random
+from difflib import SequenceMatcher
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+# Bump whenever the scores produced by the kernel change
+ALGORITHM_VERSION = 1
+
+# SequenceMatcher applies its "popular element" heuristic to sequences of this
+# length or longer, so such pairs are delegated to difflib itself
+AUTOJUNK_MIN_LENGTH = 200
+
+# Upper bound on the number of cells of the (pairs x len_a x len_b) work arrays
+MAX_CELLS_PER_CHUNK = 1 << 22
+
+# Upper bound on the number of pairs scored per call of the vectorized path
+MAX_PAIRS_PER_BLOCK = 1 << 20
+
+# Granularity (in characters) of the length buckets of the vectorized path
+LENGTH_BUCKET = 8
+
+# Below this many pairs the per-call numpy overhead outweighs the batching gain
+MIN_VECTORIZED_PAIRS = 64
+
+
+def encode_strings(strings: Sequence[str], pad_value: int = -1) -> Tuple[np.ndarray, np.ndarray]:
+    """Encode strings as a padded matrix of code points plus their lengths"""
+    lengths = np.fromiter((len(s) for s in strings), dtype=np.int64, count=len(strings))
+    width = int(lengths.max()) if len(strings) else 0
+    codes = np.full((len(strings), max(width, 1)), pad_value, dtype=np.int64)
+    for row, s in enumerate(strings):
+        if s:
+            codes[row, :len(s)] = np.frombuffer(s.encode('utf-32-le'), dtype=np.uint32)
+    return codes, lengths
+
+
+class BatchStringSimilarity:
+    """Batched string similarity over integer-encoded string arrays.
+
+    `ratcliff_obershelp` reproduces `SequenceMatcher(None, a, b).ratio()` exactly,
+    including the order in which difflib picks between equally long blocks.
+    `levenshtein` is a faster normalized edit-distance similarity
+    (1 - distance / max(len_a, len_b)) with the same interface.
+    """
+
+    METHODS = ('ratcliff_obershelp', 'levenshtein')
+
+    # Pairs scored by all instances of this process, read by the benchmark suite
+    total_calls = 0
+
+    def __init__(self, method: str = 'ratcliff_obershelp'):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown similarity method: {method}")
+        self.method = method
+        self.call_count = 0
+
+    def record_calls(self, count: int) -> None:
+        """Count pairs scored outside the kernel (e.g. with SequenceMatcher directly)"""
+        self.call_count += count
+        BatchStringSimilarity.total_calls += count
+
+    def ratio(self, a: str, b: str) -> float:
+        """Similarity of a single pair"""
+        return float(self.pairwise([a], [b])[0])
+
+    def one_to_many(self, query: str, candidates: Sequence[str]) -> np.ndarray:
+        """Similarities of one string (first argument) against a block of strings"""
+        candidates = list(candidates)
+        return self._score_indexed([query], np.zeros(len(candidates), dtype=np.int64),
+                                   candidates, np.arange(len(candidates)))
+
+    def many_to_many(self, rows: Sequence[str], cols: Sequence[str]) -> np.ndarray:
+        """Similarity matrix with `rows` as first and `cols` as second argument"""
+        rows, cols = list(rows), list(cols)
+        scores = np.zeros((len(rows), len(cols)))
+        if not rows or not cols:
+            return scores
+        block_rows = max(1, MAX_PAIRS_PER_BLOCK // len(cols))
+        for start in range(0, len(rows), block_rows):
+            block = rows[start:start + block_rows]
+            row_index = np.repeat(np.arange(len(block)), len(cols))
+            col_index = np.tile(np.arange(len(cols)), len(block))
+            scores[start:start + len(block)] = self._score_indexed(
+                block, row_index, cols, col_index
+            ).reshape(len(block), len(cols))
+        return scores
+
+    def pairwise(self, a_list: Sequence[str], b_list: Sequence[str]) -> np.ndarray:
+        """Element-wise similarities of two equally long lists of strings"""
+        if len(a_list) != len(b_list):
+            raise ValueError("pairwise() expects two lists of the same length")
+        index = np.arange(len(a_list))
+        return self._score_indexed(list(a_list), index, list(b_list), index)
+
+    def indexed_pairs(self, strings: Sequence[str], a_index: np.ndarray, b_index: np.ndarray) -> np.ndarray:
+        """Similarities of the pairs (strings[a_index[k]], strings[b_index[k]]) of one vocabulary"""
+        strings = list(strings)
+        return self._score_indexed(strings, np.asarray(a_index), strings, np.asarray(b_index))
+
+    def _score_indexed(self, a_strings: List[str], a_index: np.ndarray,
+                       b_strings: List[str], b_index: np.ndarray) -> np.ndarray:
+        """Score the pairs (a_strings[a_index[k]], b_strings[b_index[k]])"""
+        scores = np.empty(len(a_index), dtype=np.float64)
+        if not len(a_index):
+            return scores
+        self.record_calls(len(a_index))
+
+        a_lengths = np.fromiter((len(x) for x in a_strings), dtype=np.int64, count=len(a_strings))
+        b_lengths = np.fromiter((len(x) for x in b_strings), dtype=np.int64, count=len(b_strings))
+        pair_a_len = a_lengths[a_index]
+        pair_b_len = b_lengths[b_index]
+        if self.method == 'ratcliff_obershelp':
+            fallback = (pair_a_len >= AUTOJUNK_MIN_LENGTH) | (pair_b_len >= AUTOJUNK_MIN_LENGTH)
+            if len(a_index) < MIN_VECTORIZED_PAIRS:
+                fallback[:] = True
+        else:
+            fallback = np.zeros(len(a_index), dtype=bool)
+        for k in np.flatnonzero(fallback):
+            scores[k] = SequenceMatcher(None, a_strings[a_index[k]], b_strings[b_index[k]]).ratio()
+
+        vectorized = np.flatnonzero(~fallback)
+        if not len(vectorized):
+            return scores
+        a_codes, _ = encode_strings(a_strings, pad_value=-1)
+        b_codes, _ = encode_strings(b_strings, pad_value=-2)
+
+        # Bucket pairs by their rounded-up lengths to keep padding small; padded
+        # cells never match, so they do not change the result
+        a_bucket = (pair_a_len[vectorized] + LENGTH_BUCKET - 1) // LENGTH_BUCKET
+        b_bucket = (pair_b_len[vectorized] + LENGTH_BUCKET - 1) // LENGTH_BUCKET
+        bucket_keys = a_bucket * (int(b_bucket.max()) + 1) + b_bucket
+        order = np.argsort(bucket_keys, kind='stable')
+        vectorized, bucket_keys = vectorized[order], bucket_keys[order]
+        boundaries = np.flatnonzero(np.diff(bucket_keys)) + 1
+
+        for bucket in np.split(vectorized, boundaries):
+            width_a = max(int(pair_a_len[bucket].max()), 1)
+            width_b = max(int(pair_b_len[bucket].max()), 1)
+            step = max(1, MAX_CELLS_PER_CHUNK // (width_a * width_b))
+            for start in range(0, len(bucket), step):
+                chunk = bucket[start:start + step]
+                a_chunk = a_codes[a_index[chunk], :width_a]
+                b_chunk = b_codes[b_index[chunk], :width_b]
+                if self.method == 'ratcliff_obershelp':
+                    scores[chunk] = _ratcliff_obershelp(a_chunk, pair_a_len[chunk], b_chunk, pair_b_len[chunk])
+                else:
+                    scores[chunk] = _normalized_levenshtein(a_chunk, pair_a_len[chunk], b_chunk, pair_b_len[chunk])
+
+        return scores
+
+
+def _ratcliff_obershelp(a: np.ndarray, a_len: np.ndarray, b: np.ndarray, b_len: np.ndarray) -> np.ndarray:
+    """Vectorized `SequenceMatcher.ratio()` for padded code matrices without junk.
+
+    The run length of the matching diagonal ending at every (i, j) is computed
+    once. Inside a search window starting at (alo, blo) the longest block ending
+    at (i, j) is min(run, i - alo + 1, j - blo + 1), and difflib keeps the first
+    maximum in row-major (i, j) order, which is exactly what argmax returns.
+    All pending windows of all pairs are resolved together, level by level.
+    """
+    pairs, width_a = a.shape
+    width_b = b.shape[1]
+
+    equal = a[:, :, None] == b[:, None, :]
+    runs = np.zeros((pairs, width_a, width_b), dtype=np.int16)
+    runs[:, 0, :] = equal[:, 0, :]
+    for i in range(1, width_a):
+        runs[:, i, 0] = equal[:, i, 0]
+        runs[:, i, 1:] = equal[:, i, 1:] * (runs[:, i - 1, :-1] + 1)
+
+    matches = np.zeros(pairs, dtype=np.int64)
+    rows = np.arange(width_a, dtype=np.int16)[None, :, None]
+    cols = np.arange(width_b, dtype=np.int16)[None, None, :]
+
+    active = np.flatnonzero((a_len > 0) & (b_len > 0))
+    pid = active
+    alo = np.zeros(len(active), dtype=np.int64)
+    ahi = a_len[active].astype(np.int64)
+    blo = np.zeros(len(active), dtype=np.int64)
+    bhi = b_len[active].astype(np.int64)
+    first_level = True
+
+    while len(pid):
+        if first_level:
+            # The initial windows cover whole strings and padded cells never match
+            window = runs[pid]
+            first_level = False
+        else:
+            # Cells outside a window are capped at 0, cells inside at the
+            # distance to the window start
+            lo_a, hi_a = alo[:, None, None], ahi[:, None, None]
+            lo_b, hi_b = blo[:, None, None], bhi[:, None, None]
+            row_cap = np.where((rows >= lo_a) & (rows < hi_a), rows - lo_a + 1, 0).astype(np.int16)
+            col_cap = np.where((cols >= lo_b) & (cols < hi_b), cols - lo_b + 1, 0).astype(np.int16)
+            window = np.minimum(np.minimum(runs[pid], row_cap), col_cap)
+
+        flat = window.reshape(len(pid), -1)
+        best = flat.argmax(axis=1)
+        size = flat[np.arange(len(pid)), best]
+
+        found = size > 0
+        pid, alo, ahi, blo, bhi = pid[found], alo[found], ahi[found], blo[found], bhi[found]
+        best, size = best[found], size[found]
+        np.add.at(matches, pid, size)
+
+        i_start = best // width_b - size + 1
+        j_start = best % width_b - size + 1
+        i_end = i_start + size
+        j_end = j_start + size
+
+        left = (alo < i_start) & (blo < j_start)
+        right = (i_end < ahi) & (j_end < bhi)
+        pid = np.concatenate([pid[left], pid[right]])
+        alo, ahi = np.concatenate([alo[left], i_end[right]]), np.concatenate([i_start[left], ahi[right]])
+        blo, bhi = np.concatenate([blo[left], j_end[right]]), np.concatenate([j_start[left], bhi[right]])
+
+    total = a_len + b_len
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = 2.0 * matches / total
+    scores[total == 0] = 1.0
+    return scores
+
+
+def _normalized_levenshtein(a: np.ndarray, a_len: np.ndarray, b: np.ndarray, b_len: np.ndarray) -> np.ndarray:
+    """Vectorized 1 - levenshtein(a, b) / max(len_a, len_b) over padded code matrices"""
+    pairs, width_a = a.shape
+    width_b = b.shape[1]
+    offsets = np.arange(width_b + 1)
+
+    previous = np.broadcast_to(offsets, (pairs, width_b + 1)).copy()
+    distance = np.where(a_len == 0, b_len, 0)
+    for i in range(1, width_a + 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        substitution = previous[:, :-1] + (a[:, i - 1, None] != b)
+        deletion = previous[:, 1:] + 1
+        current[:, 1:] = np.minimum(substitution, deletion)
+        # Insertions: current[j] = min over k <= j of current[k] + (j - k)
+        current = np.minimum.accumulate(current - offsets, axis=1) + offsets
+        done = a_len == i
+        distance[done] = current[done, b_len[done]]
+        previous = current
+
+    longest = np.maximum(a_len, b_len)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = 1.0 - distance / longest
+    scores[longest == 0] = 1.0
+    return scores
+
+
+def main():
+    """Parity check of the batched kernel against SequenceMatcher.ratio()"""
+    with open('data_types_counts.json', 'r', encoding='utf-8') as f:
+        vocabulary = [item[0] for item in json.load(f)]
+
+    kernel = BatchStringSimilarity()
+    rng = random.Random(0)
+    mismatches = 0
+
+    # One string against the whole vocabulary, in both argument orders
+    for query in rng.sample(vocabulary, 5):
+        expected = [SequenceMatcher(None, query, other).ratio() for other in vocabulary]
+        mismatches += int(np.sum(kernel.one_to_many(query, vocabulary) != np.array(expected)))
+        expected = [SequenceMatcher(None, other, query).ratio() for other in vocabulary]
+        mismatches += int(np.sum(kernel.pairwise(vocabulary, [query] * len(vocabulary)) != np.array(expected)))
+
+    # A block against a block
+    rows, cols = rng.sample(vocabulary, 200), rng.sample(vocabulary, 200)
+    expected = np.array([[SequenceMatcher(None, r, c).ratio() for c in cols] for r in rows])
+    mismatches += int(np.sum(kernel.many_to_many(rows, cols) != expected))
+
+    print(f"Compared {kernel.call_count} pairs against SequenceMatcher.ratio(): {mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
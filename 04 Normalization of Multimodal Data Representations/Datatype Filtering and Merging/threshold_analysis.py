@@ -1,38 +1,167 @@
 import json
 import importlib
 from datatype_similarity_analysis import DatatypeSimilarityAnalyzer
+from candidate_blocking import StringSimilarityBlocker, TokenBlocker
+from similarity_cache import SimilarityCache
+from plotting import HEADLESS_ENV, headless_requested, load_pyplot
 from collections import defaultdict
-import matplotlib.pyplot as plt
+from typing import Dict, List, Optional, Tuple
+import argparse
+import numpy as np
 
-def analyze_threshold_impact(data_list, thresholds):
+class ThresholdSweep:
+    """Pairwise grouping structure shared by every threshold of a sweep.
+    
+    The keyword rules of DatatypeSimilarityAnalyzer do not depend on the
+    threshold, and the string rule only compares a ratio against it. For each
+    potential leader the candidates (from the blocking indexes built for the
+    lowest threshold) are kept in a row whose keyword outcomes and ratios are
+    filled in lazily, only for the types still unassigned when a replay reaches
+    that leader. Every threshold >= min_threshold reuses what earlier replays
+    already computed. When the similarity cache already holds the vocabulary
+    with a low enough floor (see `similarity_cache.py build`), the ratios are
+    read from it instead of being computed; the sweep never writes the cache.
+    """
+    
+    def __init__(self, data_list: List[List], min_threshold: float,
+                 similarity_cache: Optional[SimilarityCache] = None):
+        self.min_threshold = min_threshold
+        self.analyzer = DatatypeSimilarityAnalyzer(similarity_threshold=min_threshold)
+        
+        counts_dict = {item[0]: item[1] for item in data_list}
+        self.sorted_types = sorted(counts_dict.items(), key=lambda x: x[1], reverse=True)
+        
+        self.norm_types = [self.analyzer.normalize_type(dtype) for dtype, _ in self.sorted_types]
+        self.parts = [self.analyzer.split_compound_type(dtype) for dtype, _ in self.sorted_types]
+        self.keyword_index = TokenBlocker(self.parts)
+        self.similarity_matrix = None
+        self.string_index = None
+        if similarity_cache is not None:
+            # Only an existing entry is used: scoring every pair above a low
+            # threshold up front costs more than the lazy rows below
+            self.similarity_matrix = similarity_cache.lookup(
+                self.norm_types, min_threshold, self.analyzer.similarity_kernel.method
+            )
+        if self.similarity_matrix is None:
+            self.string_index = StringSimilarityBlocker(self.norm_types, min_threshold)
+        
+        # positions, string-candidate mask, keyword outcome (-1 = unknown), ratio (NaN = unknown)
+        self._rows: Dict[int, Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = {}
+    
+    def _row(self, i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Candidates after position i, with room for their keyword outcome and ratio"""
+        row = self._rows.get(i)
+        if row is not None:
+            return row
+        
+        n = len(self.sorted_types)
+        if not self.parts[i]:
+            # An empty keyword set satisfies rule 2 for every other type
+            positions = np.arange(i + 1, n)
+            row = (positions, np.zeros(len(positions), dtype=bool),
+                   np.ones(len(positions), dtype=np.int8), np.full(len(positions), -np.inf))
+        else:
+            if self.similarity_matrix is not None:
+                similar_candidates = set(self.similarity_matrix.row(i)[0].tolist())
+            else:
+                similar_candidates = self.string_index.candidates(i)
+            candidates = self.keyword_index.candidates(self.parts[i]) | similar_candidates
+            positions = np.array(sorted(j for j in candidates if j > i), dtype=np.int64)
+            in_similar = np.array([j in similar_candidates for j in positions], dtype=bool)
+            row = (positions, in_similar,
+                   np.full(len(positions), -1, dtype=np.int8), np.full(len(positions), np.nan))
+        
+        self._rows[i] = row
+        return row
+    
+    def _fill_row(self, i: int, open_slots: np.ndarray) -> None:
+        """Compute the keyword outcomes and ratios still missing for the given row slots"""
+        positions, in_similar, keyword, scores = self._row(i)
+        
+        unknown = open_slots[keyword[open_slots] < 0]
+        for k in unknown:
+            keyword[k] = self.analyzer.shares_keywords(self.parts[i], self.parts[positions[k]])
+        
+        unscored = open_slots[(keyword[open_slots] == 0) & np.isnan(scores[open_slots])]
+        if not len(unscored):
+            return
+        
+        # Ratios that cannot exceed the lowest threshold are left at -inf
+        scores[unscored] = -np.inf
+        unscored = unscored[in_similar[unscored]]
+        if self.similarity_matrix is not None:
+            scores[unscored] = self.similarity_matrix.scores_for(i, positions[unscored])
+            return
+        kept = self.string_index.filter_candidates(i, positions[unscored])
+        to_score = unscored[np.isin(positions[unscored], kept)]
+        if len(to_score):
+            scores[to_score] = self.analyzer.get_string_similarities(
+                self.norm_types[i], [self.norm_types[j] for j in positions[to_score]]
+            )
+    
+    def find_similar_groups(self, threshold: float) -> Dict[str, List[Tuple[str, int]]]:
+        """Greedy grouping at one threshold, identical to DatatypeSimilarityAnalyzer"""
+        if threshold < self.min_threshold:
+            raise ValueError(f"Threshold {threshold} is below the sweep minimum {self.min_threshold}")
+        
+        similar_groups = defaultdict(list)
+        processed = np.zeros(len(self.sorted_types), dtype=bool)
+        
+        for i, (type1, count1) in enumerate(self.sorted_types):
+            if processed[i]:
+                continue
+            
+            processed[i] = True
+            positions, _, keyword, scores = self._row(i)
+            open_slots = np.flatnonzero(~processed[positions])
+            self._fill_row(i, open_slots)
+            
+            members = positions[open_slots[(keyword[open_slots] == 1) | (scores[open_slots] > threshold)]]
+            processed[members] = True
+            
+            if len(members):
+                similar_groups[type1] = [(type1, count1)] + [self.sorted_types[j] for j in members]
+        
+        return similar_groups
+
+def summarize_groups(threshold: float, similar_groups: Dict[str, List[Tuple[str, int]]]) -> Dict:
+    """Group statistics reported for one threshold"""
+    # Calculate statistics
+    total_groups = len(similar_groups)
+    total_types_in_groups = sum(len(group) for group in similar_groups.values())
+    avg_group_size = total_types_in_groups / total_groups if total_groups > 0 else 0
+    
+    # Calculate group size distribution
+    group_sizes = [len(group) for group in similar_groups.values()]
+    max_group_size = max(group_sizes) if group_sizes else 0
+    
+    return {
+        'threshold': threshold,
+        'total_groups': total_groups,
+        'total_types_in_groups': total_types_in_groups,
+        'avg_group_size': avg_group_size,
+        'max_group_size': max_group_size
+    }
+
+def analyze_threshold_impact(data_list, thresholds, use_sweep=True, similarity_cache=None):
     """Analyze the impact of different thresholds"""
+    if use_sweep and thresholds:
+        # Score every candidate pair once and replay the grouping per threshold
+        sweep = ThresholdSweep(data_list, min(thresholds), similarity_cache)
+        return [summarize_groups(threshold, sweep.find_similar_groups(threshold)) for threshold in thresholds]
+    
     results = []
     
     for threshold in thresholds:
         analyzer = DatatypeSimilarityAnalyzer(similarity_threshold=threshold)
         similar_groups, _ = analyzer.analyze_and_report(data_list)
-        
-        # Calculate statistics
-        total_groups = len(similar_groups)
-        total_types_in_groups = sum(len(group) for group in similar_groups.values())
-        avg_group_size = total_types_in_groups / total_groups if total_groups > 0 else 0
-        
-        # Calculate group size distribution
-        group_sizes = [len(group) for group in similar_groups.values()]
-        max_group_size = max(group_sizes) if group_sizes else 0
-        
-        results.append({
-            'threshold': threshold,
-            'total_groups': total_groups,
-            'total_types_in_groups': total_types_in_groups,
-            'avg_group_size': avg_group_size,
-            'max_group_size': max_group_size
-        })
+        results.append(summarize_groups(threshold, similar_groups))
     
     return results
 
 def plot_threshold_analysis(results):
     """Plot threshold analysis charts"""
+    plt = load_pyplot()
     plt.figure(figsize=(15, 10))
     
     # Create subplots
@@ -77,16 +206,27 @@ def plot_threshold_analysis(results):
     plt.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="Analyze how the similarity threshold affects grouping")
+    parser.add_argument('--cache', action='store_true',
+                        help="Read the ratios from the on-disk similarity cache when it holds this vocabulary with "
+                             "a floor of at most the lowest threshold, as written by 'similarity_cache.py build'; "
+                             "the sweep never writes the cache")
+    parser.add_argument('--headless', action='store_true',
+                        help=f"Skip threshold_analysis.pdf and the matplotlib import (also set by {HEADLESS_ENV}=1)")
+    args = parser.parse_args()
+    
     # Load data
     with open('data_types_counts.json', 'r', encoding='utf-8') as f:
         data_list = json.load(f)
     
     # Analyze different thresholds
     thresholds = [0.5, 0.55, 0.6, 0.65, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95]
-    results = analyze_threshold_impact(data_list, thresholds)
+    similarity_cache = SimilarityCache() if args.cache else None
+    results = analyze_threshold_impact(data_list, thresholds, similarity_cache=similarity_cache)
     
     # Plot analysis charts
-    plot_threshold_analysis(results)
+    if not headless_requested(args.headless):
+        plot_threshold_analysis(results)
     
     # Print detailed results
     print("Threshold Analysis Results:")